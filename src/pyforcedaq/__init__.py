@@ -18,16 +18,15 @@ import relevant stuff to program your own force:
 ``
 
 
-For function to support data handling see the folder pyForceDAQ/analysis
+For functions to support data handling see pyforcedaq.analysis
 
 Oliver Lindemann
 """
 
 import sys as _sys
+from functools import cache as _cache
 from importlib.metadata import version
 
-from .tools import _log
-
 APPNAME = "pyForceDAQ"
 __version__ = version(APPNAME)
 __author__ = "Oliver Lindemann"
@@ -39,4 +38,17 @@ if _sys.version_info[0] != 3 or _sys.version_info[1] < 12 or _sys.version_info[1
         + f"is not compatible with Python {_sys.version_info[0]}.{_sys.version_info[1]}. "
         + "Please use Python 3.12 or 3.13."
     )
-LOGFILE = _log.set_logging(log_file=f"{APPNAME}.log")
+
+
+@_cache
+def init_logging():
+    """Configures the file logging (only once) and returns the path of the log file"""
+    from .tools import _log
+    return _log.set_logging(log_file=f"{APPNAME}.log")
+
+
+def __getattr__(name):
+    # logging is configured lazily on first access of LOGFILE
+    if name == "LOGFILE":
+        return init_logging()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,7 +1,10 @@
 import argparse
+import sys
 
-from . import APPNAME, LOGFILE, __author__, __version__, constants
+from . import APPNAME, __author__, __version__, constants, init_logging
+from .lib.daq import available_backends
 from .lib.settings import AppSettings
+from .tools import profiling
 
 
 def print_info(logfilename:str|None = None):
@@ -39,6 +42,13 @@ def cli():
         help="Omit launcher GUI and start recording directly",
     )
 
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        default=False,
+        help="Record without GUI (requires settings file)",
+    )
+
     parser.add_argument(
         "--mock",
         action="store_true",
@@ -46,42 +56,71 @@ def cli():
         help="Use mock sensor",
     )
 
+    parser.add_argument(
+        "--backend",
+        default=None,
+        help="DAQ backend (overrides settings file), e.g. nidaqmx or mock",
+    )
+
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="cprofile",
+        default=None,
+        choices=profiling.MODES,
+        help="Profile all processes (default: cprofile, overrides settings file)",
+    )
+
 
     args = parser.parse_args()
 
+    logfile = init_logging()
     if args.logfile:
-        print(f"Log file: {LOGFILE}")
+        print(f"Log file: {logfile}")
         return
 
     if args.mock:
-        constants.DAQ_TYPE = constants.DaqType.MOCK_SENSOR
+        daq_backend = constants.MOCK_BACKEND
     else:
-        constants.DAQ_TYPE = constants.DaqType.NIDAQMX # use NI-DAQmx
+        daq_backend = args.backend  # None: as defined in settings
+
+    if daq_backend is not None and daq_backend not in available_backends():
+        print(f"Unknown DAQ backend: {daq_backend}. Available: {available_backends()}")
+        sys.exit()
+
+    print_info(str(logfile))
+    if args.headless:
+        from .headless import run_settings_file
+
+        if len(args.SETTINGS_FILE) == 0:
+            print("No settings file provided, can't start headless recording")
+            sys.exit()
+
+        run_settings_file(args.SETTINGS_FILE, daq_backend=daq_backend, profile=args.profile)
 
-    print_info(str(LOGFILE))
-    if not args.omit_launcher:
+    elif not args.omit_launcher:
         if len(args.SETTINGS_FILE) > 0:
             print("Can't use launcher and settings file")
-            exit()
+            sys.exit()
 
         from .launcher import run_launcher
         try:
-            return run_launcher()
+            return run_launcher(daq_backend=daq_backend, profile=args.profile)
         except FileNotFoundError:
             ans = input("No settings file found. Create one with defaults? [Y/n]: ")
             if ans.lower() == "y" or ans.lower() == "yes":
                 AppSettings(constants.DEFAULT_SETTINGS_FILE, create_if_not_exists=True)  # create new settings file with defaults
             else:
-                exit()
+                sys.exit()
 
     else:
         from .gui import run_settings_file
 
         if len(args.SETTINGS_FILE) == 0:
             print("No settings file provided, can't start recording")
-            exit()
+            sys.exit()
 
-        run_settings_file(args.SETTINGS_FILE)
+        run_settings_file(args.SETTINGS_FILE, daq_backend=daq_backend, profile=args.profile)
 
 
 if __name__ == "__main__":  # required because of threading
@@ -0,0 +1,28 @@
+"""Functions to read and analyse recorded force data
+
+    from pyforcedaq import analysis
+
+    data = analysis.load("recording.csv.bz2")
+    print(data["time"], data["Fz"])
+
+    for chunk in analysis.iter_chunks("recording.manifest.json"):
+        ...  # constant memory for large files
+
+    data = analysis.load("recording.sensors.json")  # one file per sensor, merged
+
+    trial = analysis.read_window("recording.csv.bz2", t0, t0 + 2.0)
+    bin_width, bins = analysis.overview("recording.csv.bz2")  # min/mean/max
+
+See analysis.reader.
+"""
+
+from .reader import (
+    DataFileInfo,
+    iter_chunks,
+    load,
+    load_sensors,
+    overview,
+    read_info,
+    read_window,
+    split_sensors,
+)
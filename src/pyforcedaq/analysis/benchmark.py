@@ -0,0 +1,108 @@
+"""Benchmark of the data file reader
+
+Compares iter_chunks with np.loadtxt and the csv module on a generated data
+file:
+
+    python -m pyforcedaq.analysis.benchmark [n_lines] [--bz2]
+
+np.fromstring parses the same chunks as iter_chunks without np.loadtxt.
+With NumPy 2, it is slower than np.loadtxt and iter_chunks is about 20 %
+slower than np.loadtxt of the whole file, but with constant memory.
+
+Note: np.loadtxt and csv keep the whole file in memory, with 100 M lines
+this requires several GB.
+"""
+
+import argparse
+import csv
+import tempfile
+import tracemalloc
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from .reader import CHUNK_SIZE, iter_chunks, read_info
+from .reader import _open as open_data_file
+
+HEADER = ("Recorded at Mon Jan  1 00:00:00 2026 with pyForceDAQ benchmark\n"
+          " Sensor: label=Dev1, cal-file=FT9334.cal\n"
+          " Sensor: label=Dev2, cal-file=FT9335.cal\n"
+          "time,device_tag,Fx,Fy,Fz\n")
+
+
+def make_file(path: Path, n_lines: int, block: int = 100_000) -> None:
+    """writes a data file in the format of SensorDataWriter (two sensors)"""
+    rng = np.random.default_rng(1)
+    with open_data_file(path, "wb") as fl:
+        fl.write(HEADER.encode())
+        for start in range(0, n_lines, block):
+            n = min(block, n_lines - start)
+            k = np.arange(start, start + n)
+            data = np.column_stack((1000 + k // 2 / 1000, k % 2 + 1,
+                                    rng.normal(size=(n, 3)) * 10))
+            np.savetxt(fl, data, delimiter=",", fmt=["%.6f", "%d", "%.6f", "%.6f", "%.6f"])
+
+
+def _chunked(path: Path) -> int:
+    return sum(len(chunk) for chunk in iter_chunks(path))
+
+
+def _fromstring(path: Path) -> int:
+    info = read_info(path)
+    n_values = 0
+    with open_data_file(path) as fl:
+        for _ in range(info.n_header_lines):
+            fl.readline()
+        while True:
+            lines = fl.readlines(CHUNK_SIZE)
+            if len(lines) == 0:
+                break
+            n_values += np.fromstring(b"".join(lines).replace(b"\n", b","), sep=",").size
+    return n_values // len(info.columns)
+
+
+def _loadtxt(path: Path) -> int:
+    info = read_info(path)
+    return len(np.loadtxt(path, delimiter=",", skiprows=info.n_header_lines))
+
+
+def _csv(path: Path) -> int:
+    info = read_info(path)
+    with open_data_file(path, "rt") as fl:
+        for _ in range(info.n_header_lines):
+            fl.readline()
+        rows = [[float(x) for x in row] for row in csv.reader(fl)]
+    return len(np.array(rows))
+
+
+def run(n_lines: int, compress: bool = False, memory: bool = True) -> None:
+    suffix = ".csv.bz2" if compress else ".csv"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / f"benchmark{suffix}"
+        print(f"Creating {path.name} with {n_lines} lines")
+        make_file(path, n_lines)
+        print(f"File size {path.stat().st_size / 1e6:.1f} MB")
+        for name, fnc in (("iter_chunks", _chunked), ("np.fromstring", _fromstring),
+                          ("np.loadtxt", _loadtxt), ("csv", _csv)):
+            t = perf_counter()
+            n = fnc(path)
+            duration = perf_counter() - t
+            txt = f"{name:>13}: {duration:7.2f} s, {n / duration / 1e6:5.2f} M lines/s"
+            if memory:
+                tracemalloc.start()
+                fnc(path)
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                txt += f", peak memory {peak / 1e6:8.1f} MB"
+            print(txt)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the data file reader")
+    parser.add_argument("n_lines", nargs="?", type=int, default=1_000_000)
+    parser.add_argument("--bz2", action="store_true", help="compressed data file")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="do not measure the peak memory (faster)")
+    args = parser.parse_args()
+    run(args.n_lines, compress=args.bz2, memory=not args.no_memory)
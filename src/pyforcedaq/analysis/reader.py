@@ -0,0 +1,331 @@
+"""Reader for the data files of pyForceDAQ
+
+The files written by SensorDataWriter (.csv or .csv.bz2) start with some
+comment lines and (optionally) a line with the variable names, followed by
+the samples. With multiple sensors, the second column is the device_tag
+(sensor_id).
+
+The data are read in chunks of complete lines, decompressed on the fly and
+parsed with np.loadtxt (C parser since NumPy 1.23). iter_chunks returns a
+generator of structured arrays (one field per column), so that memory usage
+does not depend on the file size. Parsing is about as fast as np.loadtxt of
+the whole file; vectorized alternatives like np.fromstring are not faster
+(see analysis.benchmark).
+Segmented recordings (see tools.segments) are read via their manifest.
+Recordings with one file per sensor (see tools.sensor_files) are read via
+their sensor manifest, the samples of the sensors are merged by time and
+get the device_tag column.
+
+read_window uses the time index of the data files (see tools.time_index) to
+read only the part of a file that contains a time window. overview reads the
+min/mean/max pyramid (see tools.pyramid) with a suitable resolution for plots
+of long recordings.
+"""
+
+__author__ = "Oliver Lindemann"
+
+import bz2
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+from ..tools import pyramid
+from ..tools.segments import MANIFEST_SUFFIX, select_segments
+from ..tools.sensor_files import SENSORS_SUFFIX, read_sensors_manifest
+from ..tools.time_index import read_index, window_offsets
+
+CHUNK_SIZE = 1 << 20  # bytes
+DEVICE_TAG = "device_tag"
+
+
+@dataclass
+class DataFileInfo:
+    path: Path
+    comments: list[str] = field(default_factory=list)
+    columns: list[str] = field(default_factory=list)
+    n_header_lines: int = 0
+
+    @property
+    def dtype(self) -> np.dtype:
+        """structured dtype of the samples"""
+        return np.dtype([(c, "f8") for c in self.columns])
+
+    @property
+    def has_device_tag(self) -> bool:
+        return DEVICE_TAG in self.columns
+
+
+def _open(path: Path, mode: str = "rb"):
+    if path.suffix.endswith(".bz2"):
+        return bz2.open(path, mode)
+    if "b" in mode:
+        return open(path, mode)
+    return open(path, mode, encoding="utf-8")
+
+
+def _is_data_line(line: bytes) -> bool:
+    """all values of the line are numbers (comment lines are free text)"""
+    try:
+        for x in line.split(b","):
+            float(x)
+    except ValueError:
+        return False
+    return True
+
+
+def read_info(path: Path | str) -> DataFileInfo:
+    """reads the header of a data file
+
+    If the file has no line with variable names, the columns are named
+    col0, col1, ...
+
+    For a sensor manifest, the header of the first sensor file with the
+    device_tag column of the merged samples.
+    """
+    path = Path(path)
+    if path.name.endswith(SENSORS_SUFFIX):
+        info = _first_info(_sensor_files(path)[0][1])
+        info.path = path
+        info.columns.insert(1, DEVICE_TAG)
+        return info
+    info = DataFileInfo(path=path)
+    with _open(path) as fl:
+        for line in fl:
+            if _is_data_line(line):
+                if len(info.columns) == 0:
+                    n = len(line.split(b","))
+                    info.columns = [f"col{i}" for i in range(n)]
+                break
+            info.n_header_lines += 1
+            txt = line.decode("utf-8").rstrip("\r\n")
+            if txt.startswith("time,"):
+                info.columns = txt.split(",")
+            else:
+                info.comments.append(txt)
+    return info
+
+
+def _sensor_files(path: Path) -> list[tuple[int, Path]]:
+    """sensor_id and data file (or segment manifest) of each sensor"""
+    return [(s["sensor_id"], s["file"]) for s in read_sensors_manifest(path)["sensors"]]
+
+
+def _data_files(path: Path, t0: float | None, t1: float | None) -> list[Path]:
+    if path.name.endswith(SENSORS_SUFFIX):
+        return [f for _, p in _sensor_files(path) for f in _data_files(p, t0, t1)]
+    if path.name.endswith(MANIFEST_SUFFIX):
+        return select_segments(path, t0, t1)
+    return [path]
+
+
+def _add_device_tag(data: np.ndarray, sensor_id: int, dtype: np.dtype) -> np.ndarray:
+    rtn = np.empty(len(data), dtype=dtype)
+    rtn[DEVICE_TAG] = sensor_id
+    for name in data.dtype.names:  # type: ignore
+        rtn[name] = data[name]
+    return rtn
+
+
+def _sort_by_time(data: np.ndarray) -> np.ndarray:
+    return data[np.argsort(data["time"], kind="stable")]
+
+
+def _iter_merged(path: Path, t0: float | None, t1: float | None,
+                 chunk_size: int) -> Iterator[np.ndarray]:
+    """merges the chunks of the sensor files by time"""
+    dtype = read_info(path).dtype
+    sources = [(sensor_id, iter_chunks(p, t0=t0, t1=t1, chunk_size=chunk_size))
+               for sensor_id, p in _sensor_files(path)]
+    pending = [np.empty(0, dtype=dtype) for _ in sources]
+    done = [False] * len(sources)
+    while True:
+        for i, (sensor_id, chunks) in enumerate(sources):
+            while not done[i] and len(pending[i]) == 0:
+                try:
+                    pending[i] = _add_device_tag(next(chunks), sensor_id, dtype)
+                except StopIteration:
+                    done[i] = True
+        if all(len(x) == 0 for x in pending):
+            return
+        # all samples up to the last time, for which all sensors have been read
+        limit = min((x["time"][-1] for x, d in zip(pending, done) if not d), default=np.inf)
+        chunk = np.concatenate([x[x["time"] <= limit] for x in pending])
+        pending = [x[x["time"] > limit] for x in pending]
+        yield _sort_by_time(chunk)
+
+
+def iter_chunks(path: Path | str, t0: float | None = None, t1: float | None = None,
+                chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """generator of the samples of a data file as structured arrays
+
+    Parameters
+    ----------
+    path: Path
+        data file, manifest of a segmented recording or sensor manifest
+    t0, t1: float, optional
+        only samples with t0 <= time <= t1 (segments outside this time range
+        are not read)
+    chunk_size: int
+        approximate number of (uncompressed) bytes per chunk
+
+    Raises ValueError, if a line can not be parsed.
+    """
+    path = Path(path)
+    if path.name.endswith(SENSORS_SUFFIX):
+        yield from _iter_merged(path, t0, t1, chunk_size)
+        return
+    for data_file in _data_files(path, t0, t1):
+        info = read_info(data_file)
+        dtype = info.dtype
+        with _open(data_file) as fl:
+            for _ in range(info.n_header_lines):
+                fl.readline()
+            while True:
+                lines = fl.readlines(chunk_size)
+                if len(lines) == 0:
+                    break
+                chunk = _parse(lines, dtype, data_file, t0, t1)
+                if len(chunk) > 0:
+                    yield chunk
+
+
+def _parse(lines: list[bytes], dtype: np.dtype, data_file: Path,
+           t0: float | None, t1: float | None) -> np.ndarray:
+    try:
+        arr = np.loadtxt(lines, delimiter=",", dtype=np.float64, ndmin=2)
+    except ValueError as err:
+        raise ValueError(f"{data_file}: {err}") from err
+    if len(arr) == 0:
+        return np.empty(0, dtype=dtype)
+    if arr.shape[1] != len(dtype):
+        raise ValueError(f"{data_file}: {arr.shape[1]} columns, "
+                         f"expected {len(dtype)}")
+    data = arr.view(dtype).reshape(-1)
+    if t0 is not None:
+        data = data[data["time"] >= t0]
+    if t1 is not None:
+        data = data[data["time"] <= t1]
+    return data
+
+
+def _read_range(data_file: Path, start: int, end: int | None) -> bytes:
+    """reads the lines between two offsets of the time index"""
+    with open(data_file, "rb") as fl:
+        fl.seek(start)
+        raw = fl.read(-1 if end is None else end - start)
+    if data_file.suffix.endswith(".bz2"):
+        # one bz2 stream per index entry, the last one might be incomplete
+        streams = []
+        while len(raw) > 0:
+            decompressor = bz2.BZ2Decompressor()
+            streams.append(decompressor.decompress(raw))
+            if not decompressor.eof:
+                break
+            raw = decompressor.unused_data
+        raw = b"".join(streams)
+    return raw[:raw.rfind(b"\n") + 1]  # complete lines
+
+
+def read_window(path: Path | str, t0: float, t1: float) -> np.ndarray:
+    """loads the samples with t0 <= time <= t1
+
+    Only the part of the data files that contains the time window is read
+    (see tools.time_index). Files without time index are scanned.
+    """
+    path = Path(path)
+    if path.name.endswith(SENSORS_SUFFIX):
+        dtype = read_info(path).dtype
+        return _sort_by_time(np.concatenate(
+            [_add_device_tag(read_window(p, t0, t1), sensor_id, dtype)
+             for sensor_id, p in _sensor_files(path)]))
+    rtn = []
+    for data_file in _data_files(Path(path), t0, t1):
+        index = read_index(data_file)
+        if index is None or len(index) == 0:
+            rtn.extend(iter_chunks(data_file, t0=t0, t1=t1))
+            continue
+        start, end = window_offsets(index, t0, t1)
+        lines = _read_range(data_file, start, end).splitlines()
+        rtn.append(_parse(lines, read_info(data_file).dtype, data_file, t0, t1))
+    if len(rtn) == 0:
+        return np.empty(0, dtype=_first_info(Path(path)).dtype)
+    return np.concatenate(rtn)
+
+
+def split_sensors(data: np.ndarray) -> dict[int, np.ndarray]:
+    """splits samples by device_tag (sensor_id), returns a dict of arrays
+    without the device_tag field"""
+    if DEVICE_TAG not in data.dtype.names:  # type: ignore
+        raise ValueError("Data have no device_tag")
+    fields = [n for n in data.dtype.names if n != DEVICE_TAG]  # type: ignore
+    tags = data[DEVICE_TAG]
+    return {int(tag): repack_fields(data[fields][tags == tag])
+            for tag in np.unique(tags)}
+
+
+def load(path: Path | str, t0: float | None = None, t1: float | None = None) -> np.ndarray:
+    """loads all samples of a data file (see iter_chunks)"""
+    chunks = list(iter_chunks(path, t0=t0, t1=t1))
+    if len(chunks) == 0:
+        return np.empty(0, dtype=_first_info(Path(path)).dtype)
+    return np.concatenate(chunks)
+
+
+def load_sensors(path: Path | str, t0: float | None = None,
+                 t1: float | None = None) -> dict[int, np.ndarray]:
+    """loads the samples of a data file with multiple sensors, returns a
+    dict sensor_id -> samples"""
+    rtn: dict[int, list[np.ndarray]] = {}
+    for chunk in iter_chunks(path, t0=t0, t1=t1):
+        for tag, samples in split_sensors(chunk).items():
+            rtn.setdefault(tag, []).append(samples)
+    return {tag: np.concatenate(x) for tag, x in rtn.items()}
+
+
+def overview(path: Path | str, t0: float | None = None, t1: float | None = None,
+             max_bins: int = 2000) -> tuple[float, np.ndarray]:
+    """min, mean and max of the forces in time bins, e.g. to plot a whole
+    session or to zoom into a time window
+
+    The finest pyramid level with at most max_bins bins between t0 and t1 is
+    read (the coarsest level, if all levels have more bins).
+
+    Returns the bin width and the bins (structured array with the fields
+    sensor_id, n (samples), time (start of the bin), min, mean and max; the
+    last three contain one value per channel).
+
+    Raises FileNotFoundError, if the data files have no pyramid.
+    """
+    files = _data_files(Path(path), t0, t1)
+    n_levels = min((pyramid.n_levels(f) for f in files), default=0)
+    if n_levels == 0:
+        raise FileNotFoundError(f"No pyramid for {path}")
+    widths = [pyramid.read_header(files[0], level)[0]["bin_width"]
+              for level in range(n_levels)]
+    if t0 is None or t1 is None:
+        # time range from the coarsest level
+        bins = _read_pyramid(files, n_levels - 1, t0, t1)
+        if len(bins) == 0:
+            return widths[-1], bins
+        start = bins["time"].min() if t0 is None else t0
+        end = bins["time"].max() + widths[-1] if t1 is None else t1
+    else:
+        start, end = t0, t1
+    for level, width in enumerate(widths):
+        if (end - start) / width <= max_bins:
+            return width, _read_pyramid(files, level, t0, t1)
+    return widths[-1], _read_pyramid(files, n_levels - 1, t0, t1)
+
+
+def _read_pyramid(files: list[Path], level: int, t0: float | None,
+                  t1: float | None) -> np.ndarray:
+    return np.concatenate([pyramid.read_level(f, level, t0, t1)[1] for f in files])
+
+
+def _first_info(path: Path) -> DataFileInfo:
+    if path.name.endswith(SENSORS_SUFFIX):
+        return read_info(path)
+    return read_info(_data_files(path, None, None)[0])
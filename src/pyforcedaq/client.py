@@ -0,0 +1,135 @@
+"""Client library for live force data on the acquisition PC
+
+SharedMemoryClient reads the live samples of a sensor from the named shared
+memory of a running recording (setting `shared_memory`). Reading needs no
+sockets or serialization: new samples are returned as NumPy views into the
+shared memory.
+
+Example::
+
+    from pyforcedaq.client import SharedMemoryClient
+
+    client = SharedMemoryClient("pyforcedaq_Dev1")
+    while True:
+        for samples in client.read_new(timeout=1.0):
+            print(samples["time"], samples["forces"][:, 2])  # Fz
+
+The samples have the fields "time" (local_clock), "forces" (Fx, Fy, Fz, Tx,
+Ty, Tz) and "trigger" (trigger1, trigger2).
+
+For clients that do not run on the acquisition PC, see
+lib.force_stream.ForceStreamClient (UDP) and lib.stream_server.StreamClient
+(Unix domain socket/TCP).
+"""
+
+__author__ = "Oliver Lindemann"
+
+from time import sleep
+
+import numpy as np
+
+from .lib.sample_ring import HEADER, attach, ring_views, shared_memory_name
+from .lib.stream_server import StreamClient
+from .tools.clock import local_clock
+
+__all__ = ["SharedMemoryClient", "StreamClient", "shared_memory_name"]
+
+
+class SharedMemoryClient:
+    """Reads the live samples of a sensor from shared memory with an own
+    read cursor
+
+    The returned views remain valid until the recording has written further
+    `capacity` samples (see `lag`). Copy the data, if you need them longer.
+    """
+
+    POLL_INTERVAL = 0.0005  # seconds
+
+    def __init__(self, name: str, from_start: bool = False):
+        """
+        Parameters
+        ----------
+        name: str
+            name of the shared memory (see shared_memory_name)
+        from_start: bool
+            if True, the first read returns all samples in the buffer,
+            otherwise only samples written after attaching
+        """
+
+        self._shm = attach(name)
+        self.name = name
+        _, self.capacity, self.sensor_id, self.rate, _, _ = HEADER.unpack_from(self._shm.buf)
+        self._n_written, self._data = ring_views(self._shm)
+        if from_start:
+            self._cursor = max(0, self.n_written - self.capacity)
+        else:
+            self._cursor = self.n_written
+        self.n_lost = 0  # samples overwritten before they were read
+
+    @property
+    def n_written(self) -> int:
+        """total number of samples written by the recording"""
+        return int(self._n_written[0])
+
+    @property
+    def lag(self) -> int:
+        """number of written, but not yet read samples"""
+        return self.n_written - self._cursor
+
+    def read(self, max_samples: int | None = None) -> np.ndarray:
+        """returns the next new samples as view (possibly empty)
+
+        The view is contiguous and ends at the end of the ring buffer, call
+        read again or use read_new to get all new samples.
+        """
+        n_written = self.n_written
+        if n_written - self._cursor > self.capacity:
+            self.n_lost += n_written - self._cursor - self.capacity
+            self._cursor = n_written - self.capacity
+        pos = self._cursor % self.capacity
+        n = min(n_written - self._cursor, self.capacity - pos)
+        if max_samples is not None:
+            n = min(n, max_samples)
+        self._cursor += n
+        return self._data[pos:pos + n]
+
+    def read_new(self, timeout: float | None = 0) -> list[np.ndarray]:
+        """returns all new samples as list of views (max. two, if the ring
+        buffer wraps around)
+
+        Waits up to timeout seconds for new samples (None: wait forever).
+        """
+        if timeout != 0 and not self.wait(timeout):
+            return []
+        rtn = []
+        n_written = self.n_written
+        while self._cursor < n_written:
+            rtn.append(self.read(max_samples=n_written - self._cursor))
+        return rtn
+
+    def latest(self, n_samples: int) -> np.ndarray:
+        """copy of the last n samples (does not change the read cursor)"""
+        n_written = self.n_written
+        n = min(n_samples, n_written, self.capacity)
+        idx = np.arange(n_written - n, n_written) % self.capacity
+        return self._data[idx]
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """waits until new samples are available, returns False after
+        timeout seconds"""
+        if timeout is not None:
+            t_end = local_clock() + timeout
+        while self.lag <= 0:
+            if timeout is not None and local_clock() >= t_end:  # type: ignore
+                return False
+            sleep(SharedMemoryClient.POLL_INTERVAL)
+        return True
+
+    def __iter__(self):
+        """iterates endlessly over the new samples (blocks of views)"""
+        while True:
+            yield from self.read_new(timeout=None)
+
+    def close(self) -> None:
+        del self._n_written, self._data  # release buffer views
+        self._shm.close()
@@ -1,13 +1,7 @@
-from enum import Enum
-
-
-class DaqType(Enum):
-    NIDAQMX = 1
-    MOCK_SENSOR = 9
-    UNDEFINED = 0
-
-
-DAQ_TYPE = DaqType.UNDEFINED
+# names of the built-in DAQ backends (see lib.daq)
+NIDAQMX_BACKEND = "nidaqmx"
+MOCK_BACKEND = "mock"
+DEFAULT_DAQ_BACKEND = NIDAQMX_BACKEND
 
 SETTINGS_FILE_EXTENSION = ".toml"
 DEFAULT_SETTINGS_FILE = "pyForceDAQ.settings" + SETTINGS_FILE_EXTENSION
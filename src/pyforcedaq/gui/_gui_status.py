@@ -10,7 +10,9 @@ from ..lib.sensor_process import SensorProcess
 from ..lib.settings import GUISettings
 from ..lib.types import ForceSensorData
 from ..tools.data import DataBuffer, Thresholds
+from ..tools.stats import StageStats
 from ._layout import RecordingScreen, expy_constants, logo_text_line
+from ._perf_overlay import PerfOverlay
 from ._scaling import Scaling
 
 
@@ -68,11 +70,17 @@ class GUIStatus:
 
         self.pause_recording = False
         self.quit_recording = False
+        self.writer_is_lagging = False
         self.clear_screen = True
         self.threshold_list: list[Thresholds] = []
         self.set_marker = False
         self._last_processed_smpl = [0] * self.n_sensors
         self._clock = misc.Clock()
+        # frame times and performance overlay
+        self.stats = StageStats("GUI", ["frame"])
+        self.recorder.register_stats(self.stats)
+        self.perf_overlay = PerfOverlay(recorder, self.stats["frame"], screen_size)
+        self.show_perf_overlay = False
 
         self.sensor_info_str = ""
         for tmp in self.recorder.sensor_settings_list:
@@ -123,8 +131,11 @@ class GUIStatus:
                 txt_col = expy_constants.C_GREEN
         if len(info_recording) == 0:
             info_recording = "DATA ARE NOT SAVED OR STREAMED!"
+        if self.writer_is_lagging:
+            info_recording += " | FILE WRITER LAGS!"
+            txt_col = expy_constants.C_RED
         if self.recorder.has_file_writer:
-            info_file = f"file: {self.recorder.file_writer.filepath.name}" # type: ignore
+            info_file = f"file: {self.recorder.data_file.name}" # type: ignore
         else:
             if self.recorder.recording_settings.lsl_stream:
                 info_file = "no local file"
@@ -152,6 +163,16 @@ class GUIStatus:
             return True
         return False
 
+    def check_writer_lag(self) -> bool:
+        """returns True, if the lag warning of the file writer has changed
+        (the background is updated)"""
+        lagging = self.recorder.writer_is_lagging
+        if lagging == self.writer_is_lagging:
+            return False
+        self.writer_is_lagging = lagging
+        self.background = self._make_background()
+        return True
+
     def check_new_samples(self) -> list[int]:
         """returns list of sensors with new samples"""
         rtn = []
@@ -170,6 +191,9 @@ class GUIStatus:
         elif key == misc.constants.K_v:
             self.plot_indicator = not self.plot_indicator
             self.background.stimulus().present()
+        elif key == misc.constants.K_s:
+            self.show_perf_overlay = not self.show_perf_overlay
+            self.background.stimulus().present()
         elif key == misc.constants.K_p:
             # pause
             self.pause_recording = not self.pause_recording
@@ -90,6 +90,9 @@ class RecordingScreen(object):
         self.add_text_line_left(
             "T: change thresholds", [self.left + 580, self.bottom], text_colour=col
         )
+        self.add_text_line_left(
+            "S: performance", [self.left + 580, self.bottom + 20], text_colour=col
+        )
         self.add_text_line_right("Q: quit recording", [self.right, self.bottom], text_colour=col)
 
         self.add_text_line_right(txt_top_right, [self.right, self.top], text_size=15)
@@ -0,0 +1,114 @@
+"""Performance overlay of the recording screen
+
+Shows per sensor the effective sampling rate and the lost samples, the
+depth and lag of the file writer queue, the CPU usage of the processes and
+the frame time of the GUI. The values are updated every UPDATE_INTERVAL
+seconds and rendered into a cached surface, each frame merely blits the
+surface.
+"""
+
+__author__ = "Oliver Lindemann"
+
+import os
+
+import pygame
+from expyriment.misc import constants as expy_constants
+
+from ..lib.data_recorder import DataRecorder
+from ..tools.clock import local_clock
+from ..tools.stats import LatencyHistogram, ProcessCPU
+
+
+class PerfOverlay:
+
+    UPDATE_INTERVAL = 1.0  # seconds
+    TEXT_SIZE = 14
+    MARGIN = 30
+
+    def __init__(self, recorder: DataRecorder, frame_stats: LatencyHistogram,
+                 screen_size: tuple[int, int]):
+        self.recorder = recorder
+        self.frame_stats = frame_stats
+        self.screen_size = screen_size
+        self._font = None
+        self._surface = None
+        self._lines: list[str] = []
+        self._line_surfaces: dict[str, pygame.Surface] = {}  # cache of rendered lines
+        self._last_time = local_clock()
+        self._last_sample_cnt = [p.get_total_sample_cnt() for p in recorder.force_sensor_processes]
+        self._last_frames = (0, 0.0)  # n and sum of the frame times
+        self._cpu: dict[int, ProcessCPU] = {}
+
+    def _cpu_usage(self, pid: int | None) -> str:
+        if pid is None:
+            return _percent(None)
+        if pid not in self._cpu:
+            self._cpu[pid] = ProcessCPU(pid)  # usage available at the next update
+            return _percent(None)
+        return _percent(self._cpu[pid].usage())
+
+    def update(self) -> None:
+        """collects the values and renders the surface (at most every
+        UPDATE_INTERVAL)"""
+        t = local_clock()
+        dt = t - self._last_time
+        if dt < PerfOverlay.UPDATE_INTERVAL:
+            return
+        self._last_time = t
+
+        lines = []
+        for i, fsp in enumerate(self.recorder.force_sensor_processes):
+            cnt = fsp.get_total_sample_cnt()
+            rate = (cnt - self._last_sample_cnt[i]) / dt
+            self._last_sample_cnt[i] = cnt
+            lines.append(f"{fsp.sensor_settings.device_label:<8}{rate:7.0f} Hz  "
+                         f"lost {fsp.get_lost_sample_cnt():<6}"
+                         f"cpu {self._cpu_usage(fsp.pid)}")
+        for writer in self.recorder.file_writers:
+            st = writer.queue.stats()
+            label = "writer" if writer.sensor is None else f"w {writer.sensor.device_label}"
+            lines.append(f"{label:<8}depth {st['depth']:<4}lag {st['lag'] * 1000:5.0f} ms "
+                         f"cpu {self._cpu_usage(writer.pid)}")
+        n = self.frame_stats.n
+        total = self.frame_stats.mean * n
+        n_frames = n - self._last_frames[0]
+        frame = (total - self._last_frames[1]) / n_frames if n_frames > 0 else 0.0
+        self._last_frames = (n, total)
+        lines.append(f"{'GUI':<8}frame {frame * 1000:5.1f} ms {n_frames / dt:4.0f} fps "
+                     f"cpu {self._cpu_usage(os.getpid())}")
+        if lines != self._lines:
+            self._lines = lines
+            self._render()
+
+    def _render(self) -> None:
+        if self._font is None:
+            self._font = pygame.font.SysFont("courier", PerfOverlay.TEXT_SIZE)
+        cache = {}
+        for txt in self._lines:
+            surface = self._line_surfaces.get(txt)
+            if surface is None:
+                surface = self._font.render(txt, True, expy_constants.C_GREY)
+            cache[txt] = surface
+        self._line_surfaces = cache
+
+        line_height = self._font.get_linesize()
+        width = max(s.get_width() for s in cache.values())
+        if self._surface is not None:
+            width = max(width, self._surface.get_width())  # covers the previous overlay
+        self._surface = pygame.Surface((width, line_height * len(self._lines)))
+        self._surface.fill(expy_constants.C_BLACK)
+        for i, txt in enumerate(self._lines):
+            self._surface.blit(cache[txt], (0, i * line_height))
+
+    def draw(self) -> pygame.Rect | None:
+        """blits the overlay to the screen (top right corner), returns the
+        rect to be updated"""
+        if self._surface is None:
+            return None
+        pos = (self.screen_size[0] - PerfOverlay.MARGIN - self._surface.get_width(),
+               PerfOverlay.MARGIN + 30)
+        return pygame.display.get_surface().blit(self._surface, pos)
+
+
+def _percent(x: float | None) -> str:
+    return "  n/a" if x is None else f"{x:4.0f}%"
@@ -7,7 +7,7 @@ __author__ = "Oliver Lindemann"
 import logging
 import os
 from pathlib import Path
-from time import sleep
+from time import perf_counter, sleep
 
 import numpy as np
 import pygame
@@ -42,6 +42,7 @@ def _main_loop(exp, recorder: DataRecorder, gs: GUISettings, info_strings: list[
 
     last_recording_status = None
     last_thresholds = None
+    frame_stats = s.stats["frame"]
     if recorder.lsl_events_stream is not None:
         recorder.lsl_events_stream.push_sample(["Recording started, " + forceDAQVersion])
     s.background.stimulus().present()
@@ -91,6 +92,10 @@ def _main_loop(exp, recorder: DataRecorder, gs: GUISettings, info_strings: list[
 
         ########################### plotting
         if s.check_refresh_required():  # do not give priority to visual output
+            t_frame = perf_counter()
+            if s.check_writer_lag():
+                s.background.stimulus().present()
+
             thr = s.threshold_list[0] if len(s.threshold_list) > 0 else None
             if thr != last_thresholds:
                 # thresholds have changed
@@ -121,8 +126,14 @@ def _main_loop(exp, recorder: DataRecorder, gs: GUISettings, info_strings: list[
                     exp_screen_size=exp.screen.size)
 
             update_rects = _draw_plotter_texts(update_rects, status=s, exp_screen_size=exp.screen.size)
+            if s.show_perf_overlay:
+                s.perf_overlay.update()
+                rect = s.perf_overlay.draw()
+                if rect is not None:
+                    update_rects.append(rect)
 
             pygame.display.update(update_rects)
+            frame_stats.add(perf_counter() - t_frame)
             # end plotting screen
 
         ##### end main  loop
@@ -135,8 +146,16 @@ def _main_loop(exp, recorder: DataRecorder, gs: GUISettings, info_strings: list[
         plotter_thread.join()
 
 
-def run_settings_file(settings_file: str | Path = ""):
-    return run(AppSettings(settings_file, create_if_not_exists=False))
+def run_settings_file(settings_file: str | Path = "", daq_backend: str | None = None,
+                      profile: str | None = None):
+    """daq_backend: overrides the DAQ backend of the settings file
+    profile: overrides the profiling mode of the settings file"""
+    settings = AppSettings(settings_file, create_if_not_exists=False)
+    if daq_backend is not None:
+        settings.recording.daq_backend = daq_backend
+    if profile is not None:
+        settings.recording.profile = profile
+    return run(settings)
 
 
 def run(settings: AppSettings):
@@ -181,7 +200,8 @@ def run(settings: AppSettings):
     show_logo_time = 0.5
     recorder = DataRecorder(
         recording_settings=rs,
-        force_sensor_settings=sensor_settings
+        force_sensor_settings=sensor_settings,
+        profile_folder=rs.absolute_path_profiles(working_dir)
     )
     if rs.save_data:
         if len(settings.output_filename) > 3:
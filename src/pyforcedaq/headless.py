@@ -0,0 +1,220 @@
+"""Headless recording without GUI
+
+Runs a DataRecorder with file and LSL output, bias handling and UDP remote
+control, but never imports expyriment or pygame. Throughput statistics are
+printed periodically to the console.
+
+Remote control commands (UDP, port 5005):
+    $start   start saving
+    $pause   pause saving
+    $bias    determine new baselines
+    $quit    quit recording
+
+If RecordingSettings.udp_force_stream is set, remote PCs can subscribe to
+the binary force stream with $subscribe (see lib.force_stream). Any other
+UDP data are handled as software trigger.
+"""
+
+__author__ = "Oliver Lindemann"
+
+import logging
+import signal
+import threading
+from pathlib import Path
+from queue import Empty
+from time import localtime, strftime
+
+from . import __version__
+from .constants import DEFAULT_OUTPUT_FILENAME
+from .lib.data_recorder import DataRecorder
+from .lib.settings import AppSettings
+from .lib.udp_connection import UDPConnection, UDPConnectionProcess
+from .tools.clock import local_clock
+
+STATS_INTERVAL = 5.0  # seconds
+
+logger = logging.getLogger()
+
+
+class RemoteCommand:
+    START = UDPConnection.COMMAND_CHAR + b"start"
+    PAUSE = UDPConnection.COMMAND_CHAR + b"pause"
+    BIAS = UDPConnection.COMMAND_CHAR + b"bias"
+    QUIT = UDPConnection.COMMAND_CHAR + b"quit"
+
+
+class ThroughputMonitor:
+    """Keeps track of the sample counts of the recorder and computes the
+    effective sampling rate since the last call of `update`"""
+
+    def __init__(self, recorder: DataRecorder):
+        self._recorder = recorder
+        self._start_time = local_clock()
+        self._last_time = self._start_time
+        self._last_cnt = self._sample_counts()
+
+    def _sample_counts(self) -> list[int]:
+        return [x.get_total_sample_cnt() for x in self._recorder.force_sensor_processes]
+
+    def update(self) -> str:
+        """returns a status line with the effective rates of all sensors"""
+        t = local_clock()
+        cnt = self._sample_counts()
+        dt = t - self._last_time
+        infos = []
+        for fsp, n, last_n in zip(self._recorder.force_sensor_processes, cnt, self._last_cnt):
+            rate = (n - last_n) / dt if dt > 0 else 0
+            txt = f"{fsp.sensor_settings.device_label}: {rate:.1f} Hz ({n} samples"
+            lost = fsp.get_lost_sample_cnt()
+            infos.append(txt + (f", {lost} LOST)" if lost > 0 else ")"))
+        self._last_time = t
+        self._last_cnt = cnt
+
+        if self._recorder.is_saving:
+            infos.append("saving")
+        else:
+            infos.append("not saving")
+        writers = self._recorder.file_writers
+        if len(writers) > 0:
+            # sum of all writers (writer_per_sensor), maximum lag
+            stats = [w.queue.stats() for w in writers]
+            writes = [w.write_stats() for w in writers]
+            label = "writer" if len(writers) == 1 else f"{len(writers)} writers"
+            infos.append(f"{label}: depth {sum(s['depth'] for s in stats)}"
+                         f", lag {max(s['lag'] for s in stats) * 1000:.0f} ms"
+                         f", {sum(s['spilled'] for s in stats)} spilled"
+                         f", {sum(s['dropped'] for s in stats)} dropped"
+                         f", {sum(w['writes'] for w in writes)} writes"
+                         f", {sum(w['bytes_per_second'] for w in writes) / 1000:.1f} kB/s")
+            if self._recorder.writer_is_lagging:
+                infos.append("WARNING: FILE WRITER LAGS BEHIND")
+        if self._recorder.stream_server is not None:
+            clients = self._recorder.stream_server.client_stats()
+            max_lag = max((c["max_lag"] for c in clients), default=0)
+            dropped = sum(c["dropped_frames"] for c in clients) + \
+                self._recorder.stream_server.dropped_input_blocks
+            infos.append(f"stream: {len(clients)} clients, max lag {max_lag * 1000:.1f} ms, "
+                         f"{dropped} dropped")
+        return f"[{t - self._start_time:8.1f} s] " + " | ".join(infos)
+
+
+def _output_filename(settings: AppSettings) -> str:
+    if len(settings.output_filename) > 3:
+        return settings.output_filename
+    elif DEFAULT_OUTPUT_FILENAME is not None:
+        return DEFAULT_OUTPUT_FILENAME
+    else:
+        return "recording_" + strftime("%Y%m%d_%H%M%S", localtime())
+
+
+def run_settings_file(settings_file: str | Path,
+                      daq_backend: str | None = None,
+                      stats_interval: float = STATS_INTERVAL,
+                      profile: str | None = None):
+    """daq_backend: overrides the DAQ backend of the settings file
+    profile: overrides the profiling mode of the settings file"""
+    settings = AppSettings(settings_file, create_if_not_exists=False)
+    if daq_backend is not None:
+        settings.recording.daq_backend = daq_backend
+    if profile is not None:
+        settings.recording.profile = profile
+    return run(settings, stats_interval=stats_interval)
+
+
+def run(settings: AppSettings, stats_interval: float = STATS_INTERVAL) -> None:
+    """start headless recording with specified settings
+
+    Recording runs until Ctrl+C, SIGTERM or the remote command $quit.
+    """
+
+    rs = settings.recording
+    working_dir = settings.file.parent
+    logger.info("New headless recording with forceDAQ %s", __version__)
+    logger.info("Sensors %s", [sensor["calibration_file_name"] for sensor in rs.sensors])
+    logger.info("Settings %s", settings.recording_as_json)
+
+    recorder = DataRecorder(
+        recording_settings=rs,
+        force_sensor_settings=rs.get_sensor_settings(working_dir),
+        profile_folder=rs.absolute_path_profiles(working_dir)
+    )
+    if rs.save_data:
+        filepath = rs.absolute_path_data(working_dir) / _output_filename(settings)
+        filepath = recorder.open_data_file(filepath, comment_line="")
+        print(f"Data file: {filepath}")
+
+    for name in recorder.shared_memory_names:
+        print(f"Shared memory: {name}")
+    if recorder.stream_server is not None:
+        print(f"Stream server: {recorder.stream_server.address}")
+
+    udp_process = UDPConnectionProcess(
+        event_ring=recorder.event_ring,
+        event_ignore_tag=UDPConnection.COMMAND_CHAR,
+        force_stream=recorder.force_stream,
+    )
+    recorder.register_stats(udp_process.stats)
+    udp_process.profiler = recorder.profiler("udp_connection")
+    udp_process.start()
+    print(f"Remote control: {udp_process.my_ip}, port 5005")
+
+    quit_request = threading.Event()
+
+    def _signal_handler(signum, frame):
+        quit_request.set()
+
+    signal.signal(signal.SIGTERM, _signal_handler)
+
+    if recorder.lsl_events_stream is not None:
+        recorder.lsl_events_stream.push_sample(["Recording started, " + __version__])
+    if rs.save_data:
+        recorder.start_saving()
+
+    monitor = ThroughputMonitor(recorder)
+    next_stats = local_clock() + stats_interval
+    print("Recording... (quit with Ctrl+C)")
+    try:
+        while not quit_request.is_set():
+            try:
+                data = udp_process.receive_queue.get(timeout=0.1)
+            except Empty:
+                data = None
+            if data is not None:
+                _process_remote_command(data.byte_string, recorder, udp_process, quit_request)
+
+            if local_clock() >= next_stats:
+                next_stats += stats_interval
+                print(monitor.update())
+    except KeyboardInterrupt:
+        pass
+
+    print("Quitting")
+    recorder.pause_saving()
+    if recorder.lsl_events_stream is not None:
+        recorder.lsl_events_stream.push_sample(["Recording stopped"])
+    udp_process.quit()
+    if udp_process.receive_latency.n > 0:
+        print(udp_process.receive_latency)
+    recorder.quit()
+
+
+def _process_remote_command(byte_string: bytes,
+                            recorder: DataRecorder,
+                            udp_process: UDPConnectionProcess,
+                            quit_request: threading.Event) -> None:
+
+    if byte_string == RemoteCommand.START:
+        if recorder.has_file_writer:
+            recorder.start_saving()
+    elif byte_string == RemoteCommand.PAUSE:
+        recorder.pause_saving()
+    elif byte_string == RemoteCommand.BIAS:
+        recorder.determine_biases()
+    elif byte_string == RemoteCommand.QUIT:
+        quit_request.set()
+    else:
+        return  # no command
+
+    logger.info("Remote command: %s", byte_string.decode("utf-8", "replace"))
+    print(f"Remote command: {byte_string.decode('utf-8', 'replace')}")
+    udp_process.send_queue.put(UDPConnection.COMMAND_REPLY)
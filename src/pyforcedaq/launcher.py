@@ -27,8 +27,11 @@ def _check_sensor_calibration_settings(sensors:list[SensorSettings]):
 
     return rtn
 
-def _windows_run(settings: AppSettings, lst_settings: list[str]):
+def _windows_run(settings: AppSettings, lst_settings: list[str],
+                 daq_backend: str | None = None):
     rs = settings.recording
+    if daq_backend is None:
+        daq_backend = rs.daq_backend
     working_dir = settings.file.parent
     n_sensor = len(rs.sensors)
 
@@ -57,8 +60,10 @@ def _windows_run(settings: AppSettings, lst_settings: list[str]):
     info = [[_sg.Text(f"version: {__version__}")]]
     info.append([_sg.Text(f"IP address: {get_lan_ip()}")])
 
-    if constants.DAQ_TYPE == constants.DaqType.MOCK_SENSOR:
+    if daq_backend == constants.MOCK_BACKEND:
         info.append([_sg.Text("!!!  USING MOCK SENSORS  !!!", text_color="red")])
+    elif daq_backend != constants.DEFAULT_DAQ_BACKEND:
+        info.append([_sg.Text(f"DAQ backend: {daq_backend}")])
 
     layout = [
         [
@@ -125,7 +130,12 @@ def _load_settings_file(settings_file: str | Path) -> AppSettings:
     return settings
 
 
-def run_launcher():
+def run_launcher(daq_backend: str | None = None, profile: str | None = None):
+    """daq_backend: overrides the DAQ backend of the settings files
+    profile: overrides the profiling mode of the settings files
+
+    The overrides apply to the recording only and are never saved to the
+    settings files."""
     _sg.theme("DarkBlue14")  # please make your windows colorful
 
     app_setting_files = list_settings_files()
@@ -135,7 +145,7 @@ def run_launcher():
         settings_file = app_setting_files[0]
     settings = _load_settings_file(settings_file)
     while True:
-        event, values, settings = _windows_run(settings, app_setting_files)
+        event, values, settings = _windows_run(settings, app_setting_files, daq_backend)
 
         if event == "Save":
             settings.save()
@@ -154,6 +164,10 @@ def run_launcher():
             )
             if ch == "No":
                 return  # quit
+        if daq_backend is not None:
+            settings.recording.daq_backend = daq_backend
+        if profile is not None:
+            settings.recording.profile = profile
         from . import gui
         gui.run(settings)
     else:
@@ -1,16 +1,55 @@
+"""DAQ backends and backend registry
+
+Backends are implementations of DAQReadAnalogABC that are registered under a
+name. The built-in backends are "nidaqmx" and "mock". Third-party packages can
+provide further backends via the entry point group "pyforcedaq.daq_backends":
+
+    [project.entry-points."pyforcedaq.daq_backends"]
+    my_device = "my_package.my_module:MyDAQReadAnalog"
+
+Backend modules are imported only if the backend is used.
+"""
+
 __author__ = "Oliver Lindemann"
 
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from importlib import import_module
+from importlib.metadata import EntryPoint, entry_points
 
 from numpy import float64
 from numpy.typing import NDArray
 
 from ..settings import SensorSettings
 
+ENTRY_POINT_GROUP = "pyforcedaq.daq_backends"
+
+
+@dataclass(frozen=True)
+class DAQCapabilities:
+    """Capabilities of a DAQ backend. The sensor pipeline uses the fastest
+    code path a backend supports.
+
+    block_read: read_analog/read_into return all available samples, not
+        just one sample per call
+    read_into_buffer: read_into() is implemented and fills a preallocated
+        buffer without allocating new arrays
+    hardware_timestamps: sample_times() is implemented and returns the
+        acquisition time of each sample
+    calibrated: the backend delivers forces, no calibration conversion needed
+    """
+
+    block_read: bool = False
+    read_into_buffer: bool = False
+    hardware_timestamps: bool = False
+    calibrated: bool = False
+
 
 class DAQReadAnalogABC(ABC):
     """Abstract base class for DAQ analog reading."""
 
+    CAPABILITIES = DAQCapabilities()
+
     @abstractmethod
     def __init__(self,
                  configuration: SensorSettings,
@@ -42,8 +81,89 @@ class DAQReadAnalogABC(ABC):
         Returns
         -------
         read_buffer : numpy array
-            The read data.
-        read_samples : int
-            The number of samples actually read.
+            The read data (samples x channels).
         """
         pass
+
+    def read_into(self, buffer: NDArray[float64]) -> int:
+        """Read available samples into the preallocated buffer (samples x channels).
+
+        Only required if CAPABILITIES.read_into_buffer is True.
+
+        Returns
+        -------
+        n_samples : int
+            The number of samples written to the beginning of the buffer.
+        """
+        raise NotImplementedError
+
+    def sample_times(self, n_samples: int) -> NDArray[float64]:
+        """Acquisition times (local_clock) of the last n_samples read samples.
+
+        Only required if CAPABILITIES.hardware_timestamps is True.
+        """
+        raise NotImplementedError
+
+
+# name -> backend class, "module:class" string or entry point (loaded on use)
+_backends: dict[str, type[DAQReadAnalogABC] | str | EntryPoint] = {
+    "nidaqmx": "pyforcedaq.lib.daq.ni_daq:DAQReadAnalog",
+    "mock": "pyforcedaq.lib.daq.mock_daq:DAQReadAnalog",
+}
+_entry_points_loaded = False
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if not _entry_points_loaded:
+        _entry_points_loaded = True
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            _backends.setdefault(ep.name, ep)
+
+
+def register_backend(name: str, backend: type[DAQReadAnalogABC] | str | None = None):
+    """Register a DAQ backend under a name.
+
+    The backend is a subclass of DAQReadAnalogABC or a "module:class" string
+    that is imported on first use. Without backend, the function returns a
+    class decorator.
+    """
+
+    if backend is None:
+        def decorator(cls):
+            register_backend(name, cls)
+            return cls
+        return decorator
+
+    if not isinstance(backend, str) and not issubclass(backend, DAQReadAnalogABC):
+        raise TypeError("DAQ backend has to be a subclass of DAQReadAnalogABC")
+    _backends[name] = backend
+
+
+def available_backends() -> list[str]:
+    """Names of all registered DAQ backends (incl. entry points)"""
+    _load_entry_points()
+    return list(_backends.keys())
+
+
+def get_backend(name: str) -> type[DAQReadAnalogABC]:
+    """Returns the backend class registered under the name"""
+
+    if name not in _backends:
+        _load_entry_points()
+    try:
+        backend = _backends[name]
+    except KeyError as err:
+        raise RuntimeError(f"Unsupported DAQ backend: {name}. "
+                           f"Available backends: {available_backends()}") from err
+
+    if isinstance(backend, EntryPoint):
+        backend = backend.load()
+    elif isinstance(backend, str):
+        module_name, class_name = backend.split(":")
+        backend = getattr(import_module(module_name), class_name)
+
+    if not issubclass(backend, DAQReadAnalogABC):  # type: ignore
+        raise TypeError(f"DAQ backend {name} is not a subclass of DAQReadAnalogABC")
+    _backends[name] = backend
+    return backend  # type: ignore
@@ -1,12 +1,23 @@
+"""Mock DAQ device with simulated sensor data
+
+The device buffer holds NI_DAQ_BUFFER_SIZE samples, older unread samples
+are overwritten (sample loss). To test the detection of sample loss and
+backlog, stalls of the reading can be injected with the environment
+variable PYFORCEDAQ_MOCK_STALL="<interval>:<duration>" (seconds), e.g. "10:2"
+blocks the reading every 10 seconds for 2 seconds.
+"""
+
 __author__ = 'Oliver Lindemann'
 
 import logging
+import os
+from time import sleep
 
 import numpy as np
 from numpy.typing import NDArray
 
-from ...tools.clock import StopWatch
-from . import DAQReadAnalogABC
+from ...tools.clock import local_clock
+from . import DAQCapabilities, DAQReadAnalogABC
 
 
 class DAQReadAnalog(DAQReadAnalogABC):
@@ -14,14 +25,26 @@ class DAQReadAnalog(DAQReadAnalogABC):
     TIMEOUT = 1.0
     NI_DAQ_BUFFER_SIZE = 1000
     DAQ_TYPE = "mock_sensor"
+    DEFAULT_RATE = 1000
+    STALL_ENV = "PYFORCEDAQ_MOCK_STALL"
+    CAPABILITIES = DAQCapabilities(block_read=True,
+                                   read_into_buffer=True,
+                                   hardware_timestamps=True,
+                                   calibrated=True)
 
     def __init__(self, configuration=None,
                  read_array_size_in_samples=None):
         self.read_array_size_in_samples = read_array_size_in_samples
+        if configuration is None:
+            self.rate = DAQReadAnalog.DEFAULT_RATE
+        else:
+            self.rate = configuration.rate
         self._task_is_started = False
-        self._last_time = 0
+        self._start_time = local_clock()
         self._sample_cnt = 0
-        self._simulation_timer = StopWatch()
+        self._stall_interval, self._stall_duration = _stall_settings(
+            os.environ.get(DAQReadAnalog.STALL_ENV, ""))
+        self._next_stall = 0.0
         txt = "Using mock sensor"
         logging.warning(txt)
         print(txt)
@@ -39,8 +62,9 @@ class DAQReadAnalog(DAQReadAnalogABC):
 
         if not self._task_is_started:
             self._task_is_started = True
-            self._simulation_timer = StopWatch() #reset
+            self._start_time = local_clock()
             self._sample_cnt = 0
+            self._next_stall = self._start_time + self._stall_interval
 
     def stop_data_acquisition(self):
         """ Stop data acquisition of the NI device
@@ -49,34 +73,69 @@ class DAQReadAnalog(DAQReadAnalogABC):
         if self._task_is_started:
             self._task_is_started = False
 
+    def _n_new_samples(self) -> int:
+        """waits until at least one new sample is available and returns the
+        number of available samples"""
+        if self._stall_interval > 0 and local_clock() >= self._next_stall:
+            sleep(self._stall_duration)
+            self._next_stall += self._stall_interval
+        while True:
+            elapsed = local_clock() - self._start_time
+            n_new_samples = int(elapsed * self.rate) - self._sample_cnt
+            if n_new_samples > DAQReadAnalog.NI_DAQ_BUFFER_SIZE:
+                # buffer overrun: the oldest samples are lost
+                self._sample_cnt += n_new_samples - DAQReadAnalog.NI_DAQ_BUFFER_SIZE
+                n_new_samples = DAQReadAnalog.NI_DAQ_BUFFER_SIZE
+            if n_new_samples > 0:
+                return n_new_samples
+            sleep((self._sample_cnt + 1) / self.rate - elapsed)
+
+    def _simulate(self, n_samples: int) -> NDArray[np.float64]:
+        """simulated sensor data of the next n samples"""
+        x = np.arange(self._sample_cnt + 1, self._sample_cnt + n_samples + 1) / self.rate
+        self._sample_cnt += n_samples
+        rtn = np.zeros((n_samples, 8))
+        rtn[:, 0] = np.sin(x / 2)
+        rtn[:, 1] = np.cos(x)
+        rtn[:, 2] = np.sin(x)
+        rtn[:, 0:3] = 20 + rtn[:, 0:3] * 10
+        return rtn
+
     def read_analog(self) -> NDArray[np.float64]:
         """Reading data
 
-        Reading data from NI device
-
-        Parameter
-        ---------
-        array_size_in_samps : int
-            the array size in number of samples
+        Reading all available data from the mock device
 
         Returns
         -------
         read_buffer : numpy array
-            the read data
-        read_samples : int
-            the number of read samples
+            the read data (samples x channels)
 
         """
 
-        # fill in data
         if not self._task_is_started:
-            return np.array([])
-
-        n_new_samples = int(self._simulation_timer.time_ms) - self._sample_cnt
-        while n_new_samples <= 0: # wait until new sample is available
-            n_new_samples = int(self._simulation_timer.time_ms) - self._sample_cnt
+            return np.empty((0, 8))
+        return self._simulate(self._n_new_samples())
 
-        self._sample_cnt += 1
-        x = self._sample_cnt / 1000
-        y = 20 + np.array((np.sin(x/2), np.cos(x), np.sin(x)))*10
-        return np.atleast_2d(np.append(y, np.zeros(5)))
+    def read_into(self, buffer: NDArray[np.float64]) -> int:
+        if not self._task_is_started:
+            return 0
+        n = min(self._n_new_samples(), len(buffer))
+        buffer[:n] = self._simulate(n)
+        return n
+
+    def sample_times(self, n_samples: int) -> NDArray[np.float64]:
+        k = np.arange(self._sample_cnt - n_samples + 1, self._sample_cnt + 1)
+        return self._start_time + k / self.rate
+
+
+def _stall_settings(txt: str) -> tuple[float, float]:
+    """interval and duration of the stalls ("<interval>:<duration>")"""
+    if len(txt) == 0:
+        return 0.0, 0.0
+    try:
+        interval, duration = (float(x) for x in txt.split(":"))
+    except ValueError:
+        raise ValueError(f"Invalid {DAQReadAnalog.STALL_ENV} '{txt}', "
+                         "expected '<interval>:<duration>'") from None
+    return interval, duration
@@ -1,15 +1,17 @@
 import nidaqmx
 import numpy as np
 from nidaqmx import constants as nidaq_consts
+from nidaqmx.stream_readers import AnalogMultiChannelReader
 from numpy.typing import NDArray
 
 from ..settings import SensorSettings
-from . import DAQReadAnalogABC
+from . import DAQCapabilities, DAQReadAnalogABC
 
 
 class DAQReadAnalog(nidaqmx.Task, DAQReadAnalogABC):
     NUM_SAMPS_PER_CHAN = 1
     TIMEOUT = 1
+    CAPABILITIES = DAQCapabilities(block_read=True, read_into_buffer=True)
 
     def __init__(
         self, configuration: SensorSettings,
@@ -39,12 +41,17 @@ class DAQReadAnalog(nidaqmx.Task, DAQReadAnalogABC):
             sample_mode=nidaq_consts.AcquisitionType.CONTINUOUS,
             samps_per_chan=1000 # use for buffering
         )
+        # a buffer overrun overwrites the oldest unread samples instead of
+        # stopping the task, the sample loss is detected by the SampleMonitor
+        self.in_stream.over_write = nidaq_consts.OverwriteMode.OVERWRITE_UNREAD_SAMPLES
         print("devices")
 
         self._task_is_started = False
         self.read_array_size_in_samples = read_array_size_in_samples
 
         self.sample_cnt = 0
+        self._reader = AnalogMultiChannelReader(self.in_stream)
+        self._channel_buffer = np.empty(0, dtype=np.float64)
 
     @property
     def is_acquiring_data(self) -> bool:
@@ -92,3 +99,24 @@ class DAQReadAnalog(nidaqmx.Task, DAQReadAnalogABC):
         np_data = np.asarray(data).T
         self.sample_cnt += len(np_data)
         return np_data
+
+    def read_into(self, buffer: NDArray[np.float64]) -> int:
+        """Reading all available samples (at least one) into the buffer
+        (samples x channels) without allocating new arrays.
+
+        Returns the number of samples read.
+        """
+
+        n_channels = buffer.shape[1]
+        if len(self._channel_buffer) != buffer.size:
+            self._channel_buffer = np.empty(buffer.size, dtype=np.float64)
+
+        n = min(max(self.in_stream.avail_samp_per_chan, 1), len(buffer))
+        # stream reader requires contiguous channels x samples array
+        channel_data = self._channel_buffer[:n * n_channels].reshape(n_channels, n)
+        self._reader.read_many_sample(channel_data,
+                                      number_of_samples_per_channel=n,
+                                      timeout=self.TIMEOUT)
+        buffer[:n] = channel_data.T
+        self.sample_cnt += n
+        return n
@@ -7,62 +7,138 @@ __author__ = "Oliver Lindemann"
 
 import atexit
 import logging
+import threading
+from multiprocessing import Queue
 from pathlib import Path
-from time import asctime, localtime
+from time import asctime, localtime, strftime
 
-from .. import APPNAME, __version__, constants
-from ..tools import lsl
+from .. import APPNAME, __version__, init_logging
+from ..tools import lsl, profiling
+from ..tools.event_ring import EventRing
 from ..tools.file_writer import unique_file_path
+from ..tools.segments import manifest_path, unique_segmented_path
+from ..tools.sensor_files import (
+    sensor_file_path,
+    unique_sensors_path,
+    write_sensors_manifest,
+)
+from ..tools.stats import StageStats
+from .force_stream import ForceStreamSubscribers
+from .sample_ring import SampleRing, shared_memory_name
 from .sensor import SensorDataWriter
 from .sensor_process import SensorProcess
 from .settings import RecordingSettings, SensorSettings
-from .types import ForceSensorData
+from .stream_server import StreamServerProcess
+from .types import ChannelMask
+
+logger = logging.getLogger()
 
 
 class DataRecorder:
     """handles multiple sensors, file writing and process management, LSL stream for events"""
 
+    SHARED_MEMORY_SECONDS = 10  # size of the shared memory sample rings
+
     def __init__(
         self,
         recording_settings: RecordingSettings,
-        force_sensor_settings: SensorSettings | list[SensorSettings]):
+        force_sensor_settings: SensorSettings | list[SensorSettings],
+        profile_folder: str | Path | None = None):
         """queue_data will be saved
         see sensorprocess.__init__
 
         polling_priority has to be types.PollingPriority.{HIGH},
         {REALTIME} or {NORMAL} or None
 
-        You can change the used modules by settings the following constants before creating the
-        DataRecorder instance:
-            * set constants.DAQ_TYPE to constants.DaqType.NIDAQMX or
-                            constants.DaqType.MOCK_SENSOR
+        The DAQ backend is defined by recording_settings.daq_backend
+        (e.g. "nidaqmx" or "mock", see lib.daq.available_backends).
+
+        With recording_settings.writer_per_sensor, each sensor has its own
+        file writer process and data file (see tools.sensor_files).
+
+        If recording_settings.profile is set, all processes are profiled
+        and the profiles are written to a new subfolder of profile_folder
+        (default: recording_settings.profile_folder), see tools.profiling.
         """
 
+        init_logging()
         if not isinstance(force_sensor_settings, list):
             force_sensor_settings = [force_sensor_settings]
 
         self.recording_settings = recording_settings
+        if len(recording_settings.profile) > 0:
+            if profile_folder is None:
+                profile_folder = recording_settings.profile_folder
+            self.profile_folder = Path(profile_folder) / strftime("%Y%m%d_%H%M%S")
+        else:
+            self.profile_folder = None
+        # file writers, run until quit (see open_data_file)
+        self.file_writers: list[SensorDataWriter] = []
         if recording_settings.save_data:
-            self.file_writer = SensorDataWriter(recording_settings)
-            queue = self.file_writer.queue
+            if recording_settings.writer_per_sensor:
+                for fs in force_sensor_settings:
+                    writer = SensorDataWriter(recording_settings, sensor=fs)
+                    writer.profiler = self.profiler(f"file_writer_{fs.device_label}")
+                    self.file_writers.append(writer)
+            else:
+                writer = SensorDataWriter(recording_settings)
+                writer.profiler = self.profiler("file_writer")
+                self.file_writers.append(writer)
+            for writer in self.file_writers:
+                writer.start()
+        self.data_file: Path | None = None  # path returned by open_data_file
+        # subscribers of the binary UDP force stream, the table has to be
+        # passed to the UDPConnectionProcess (force_stream)
+        self.force_stream: ForceStreamSubscribers | None = None
+        if recording_settings.udp_force_stream:
+            self.force_stream = ForceStreamSubscribers()
+        # software trigger of all sensors
+        self.event_ring = EventRing()
+        # local streaming server
+        if len(recording_settings.stream_server) > 0:
+            self.stream_server = StreamServerProcess(
+                address=recording_settings.stream_server,
+                policy=recording_settings.stream_policy,
+                max_frames=recording_settings.stream_buffer_frames,
+                drop_timeout=recording_settings.stream_drop_timeout,
+                n_inputs=len(force_sensor_settings))
+            self.stream_server.profiler = self.profiler("stream_server")
+            self.stream_server.start()
+            stream_inputs = self.stream_server.inputs
         else:
-            self.file_writer = None
-            queue = None
+            self.stream_server = None
+            stream_inputs = [None] * len(force_sensor_settings)
+
+        # sample gaps detected by the sensor processes (for the events LSL stream)
+        self._gap_events = Queue() if recording_settings.lsl_stream else None
 
         # create sensor processes
         self.force_sensor_processes: list[SensorProcess] = []
-        event_trigger = []
-        for fs in force_sensor_settings:
+        self.sample_rings: list[SampleRing] = []
+        for fs, stream_input in zip(force_sensor_settings, stream_inputs):
             if not isinstance(fs, SensorSettings):
                 raise TypeError("Recorder needs a list of Force Sensor Settings!")
             else:
+                queue = self._writer_of(fs).queue if self.file_writers else None
+                if recording_settings.shared_memory:
+                    ring = SampleRing(name=shared_memory_name(fs.device_label),
+                                      capacity=int(DataRecorder.SHARED_MEMORY_SECONDS * fs.rate),
+                                      sensor_id=fs.sensor_id, rate=fs.rate)
+                    self.sample_rings.append(ring)
+                    shm_name = ring.name
+                else:
+                    shm_name = None
                 fst = SensorProcess(
                     sensor_settings=fs,
                     recording_settings=recording_settings,
                     file_writer_queue=queue,
-                    daq_type=constants.DAQ_TYPE)
+                    event_ring=self.event_ring,
+                    force_stream=self.force_stream,
+                    stream_input=stream_input,
+                    shared_memory_name=shm_name,
+                    gap_events=self._gap_events)
+                fst.profiler = self.profiler(f"sensor_{fs.device_label}")
                 fst.start()
-                event_trigger.append(fst.event_trigger)
                 self.force_sensor_processes.append(fst)
         # LSL stream
         if self.recording_settings.lsl_stream:
@@ -77,13 +153,36 @@ class DataRecorder:
                 )
         else:
             self.lsl_events_stream = None
+        if self._gap_events is not None:
+            threading.Thread(target=self._relay_gap_events, daemon=True).start()
+
+        # latency stats of other components (e.g. UDP connection, GUI)
+        self._stats: list[StageStats] = []
+        self._stop_stats_log = threading.Event()
+        if recording_settings.stats_log_interval > 0:
+            threading.Thread(target=self._log_stats, daemon=True,
+                             args=(recording_settings.stats_log_interval,)).start()
 
+        self._quit_done = False
         atexit.register(self.quit)
 
+    @property
+    def file_writer(self) -> SensorDataWriter | None:
+        """the file writer (the first one, if writer_per_sensor)"""
+        return self.file_writers[0] if self.file_writers else None
+
+    def _writer_of(self, sensor_settings: SensorSettings) -> SensorDataWriter:
+        """file writer of a sensor"""
+        for writer in self.file_writers:
+            if writer.sensor is None or writer.sensor.device_label == sensor_settings.device_label:
+                return writer
+        raise ValueError(f"No file writer for {sensor_settings.device_label}")
+
     @property
     def has_file_writer(self):
         """Property indicates whether a data file is open"""
-        return isinstance(self.file_writer, SensorDataWriter) and self.file_writer.is_alive()
+        return len(self.file_writers) > 0 and \
+            all(w.is_open and w.is_alive() for w in self.file_writers)
 
     @property
     def is_alive(self):
@@ -98,12 +197,72 @@ class DataRecorder:
         """Property indicates whether the recording is started or paused"""
         if  self.has_file_writer:
             for fsp in self.force_sensor_processes:
-                if not fsp.is_saving:
+                if not fsp.is_saving():
                     return False
             return True # all sensor processes are saving, file writer is alive
         else:
             return False
 
+    @property
+    def writer_lag(self) -> float:
+        """lag of the file writer in seconds (0, if no file writer), the
+        maximum, if writer_per_sensor"""
+        return max((w.queue.lag for w in self.file_writers), default=0.0)
+
+    @property
+    def writer_is_lagging(self) -> bool:
+        """Property indicates whether the file writer lags more than
+        recording_settings.writer_lag_warning seconds"""
+        return self.writer_lag > self.recording_settings.writer_lag_warning
+
+    @property
+    def shared_memory_names(self) -> list[str]:
+        """names of the shared memory of the sensors (see pyforcedaq.client)"""
+        return [ring.name for ring in self.sample_rings]
+
+    def profiler(self, role: str) -> profiling.ProcessProfiler | None:
+        """profiler for a process (e.g. UDPConnectionProcess.profiler), None
+        if profiling is off"""
+        if self.profile_folder is None:
+            return None
+        return profiling.ProcessProfiler(self.recording_settings.profile, role,
+                                         self.profile_folder)
+
+    def register_stats(self, stats: StageStats) -> None:
+        """adds the latency stats of a component (e.g. UDPConnectionProcess.stats)
+        to the stats of the recorder"""
+        self._stats.append(stats)
+
+    def all_stats(self) -> list[StageStats]:
+        """latency stats of the sensor processes, the file writers and the
+        registered components"""
+        rtn = [fsp.stats for fsp in self.force_sensor_processes]
+        rtn.extend(w.stats for w in self.file_writers)
+        return rtn + self._stats
+
+    def stats(self) -> dict[str, dict[str, dict[str, float]]]:
+        """latency stats of all stages: component -> stage -> summary (n,
+        mean, p50, p99 and max in milliseconds, see LatencyHistogram.summary)"""
+        return {s.name: s.summary() for s in self.all_stats()}
+
+    def _relay_gap_events(self) -> None:
+        """sends the sample gaps to the events LSL stream"""
+        while True:
+            gap = self._gap_events.get()  # type: ignore
+            if gap is None or self.lsl_events_stream is None:
+                break
+            self.lsl_events_stream.push_sample(
+                [(f"Sample gap {gap.device_label}: {gap.n_lost} samples lost "
+                  f"before {gap.time:.6f}")])
+
+    def _log_stats(self, interval: float) -> None:
+        while not self._stop_stats_log.wait(interval):
+            self.log_stats()
+
+    def log_stats(self) -> None:
+        """writes the latency stats to the log"""
+        logger.info("Latency stats\n%s", "\n".join(str(s) for s in self.all_stats()))
+
     @property
     def sensor_settings_list(self):
         return list(map(lambda x: x.sensor_settings, self.force_sensor_processes))
@@ -113,19 +272,44 @@ class DataRecorder:
 
         Notes
         -----
-        Will be automatically called at exit.
-
+        Will be automatically called at exit. The stream server, the shared
+        memory and the data file are also released, if the sensor processes
+        died.
         """
 
-        if not self.is_alive:
+        if self._quit_done:
             return
-
-        self.pause_saving()
-        for fsp in self.force_sensor_processes:
-            fsp.join()
+        self._quit_done = True
+        self._stop_stats_log.set()
+        try:
+            if self.is_alive:
+                self.pause_saving()
+            for fsp in self.force_sensor_processes:
+                fsp.join()
+        finally:
+            self._release()
+        self.log_stats()
+        if self.profile_folder is not None and self.profile_folder.is_dir():
+            txt = profiling.summary(self.profile_folder)
+            logger.info("Profiles %s\n%s", self.profile_folder, txt)
+            print(f"Profiles: {self.profile_folder}\n{txt}")
+
+        logger.info("Quit recording")
+
+    def _release(self) -> None:
+        """stops the stream server, removes the sample rings, closes the data
+        file and waits for the file writers"""
+        if self._gap_events is not None:
+            self._gap_events.put(None)
+        if self.stream_server is not None:
+            self.stream_server.quit()
+        for ring in self.sample_rings:
+            ring.unlink()
+        self.sample_rings = []
         self.close_data_file()
-
-        logging.info("Quit recording")
+        for writer in self.file_writers:
+            if writer.is_alive():
+                writer.join()
 
     def start_saving(self) -> None:
         """Start polling process and record
@@ -153,10 +337,21 @@ class DataRecorder:
         # pause polling
         for fsp in self.force_sensor_processes:
             fsp.pause_saving()
+        if self.recording_settings.writer_flush_on_pause and self.has_file_writer:
+            for writer in self.file_writers:
+                writer.flush()
         if self.lsl_events_stream is not None:
             self.lsl_events_stream.push_sample(["Pause saving"])
 
 
+    def push_event(self, code: int = 1, time: float | None = None) -> None:
+        """software trigger for all sensors
+
+        The code is written to the trigger1 channel of the first sample at
+        or after the time of the event (local_clock, default: now).
+        """
+        self.event_ring.push(code=code, time=time)
+
     def determine_biases(self) -> None:
         for x in self.force_sensor_processes:
             x.determine_bias()
@@ -174,7 +369,9 @@ class DataRecorder:
     ) -> Path | None:
         """Create a data file
 
-        Only if data file has been opened, data will be saved!
+        Only if data file has been opened, data will be saved! An open data
+        file is closed before (see close_data_file), thus several files can
+        be recorded in sequence with the same recorder.
 
         Parameters
         ----------
@@ -191,62 +388,95 @@ class DataRecorder:
         Returns
         -------
         file_path : Path
-                full path the actually used file (incl. timestamp)
+                full path the actually used file (incl. timestamp). For
+                segmented recordings (settings segment_size or
+                segment_duration), the path of the manifest. With
+                writer_per_sensor, the path of the sensor manifest.
 
         """
 
-        if not isinstance(self.file_writer, SensorDataWriter):
+        if len(self.file_writers) == 0:
             return
+        if any(w.is_open for w in self.file_writers):
+            self.close_data_file()
 
         # create filename
         file_path = Path(file_path)
         if self.recording_settings.zip_data:
-            file_path = unique_file_path(file_path.with_suffix(".csv.bz2"))
+            file_path = file_path.with_suffix(".csv.bz2")
         else:
-            file_path = unique_file_path(file_path.with_suffix(".csv"))
-
-        self.file_writer.set_file(file_path, append_mode=False)
-        self.file_writer.start()
-        logging.info("new file: %s", file_path)
-
-        self.file_writer.queue.put(
-            f"Recorded at {asctime(localtime())} with {APPNAME} {__version__}\n")
-
-        for s in self.sensor_settings_list:
-            txt = f" Sensor: label={s.device_label}, cal-file={s.calibration_file_name}\n"
-            self.file_writer.queue.put(txt)
-
-        if len(comment_line) > 0:
-            self.file_writer.queue.put(comment_line + "\n")
-
-        if varnames:
-            write_forces = self.recording_settings.array_write_forces()
-            write_trigger = self.recording_settings.array_write_trigger()
-            write_deviceid = len(self.recording_settings.sensors) > 1
-            line = "time,"
-            if write_deviceid:
-                line += "device_tag,"
-            for x in range(6):
-                if write_forces[x]:
-                    line += ForceSensorData.forces_names[x] + ","
-            if write_trigger[0]:
-                line += "trigger1,"
-            if write_trigger[1]:
-                line += "trigger2,"
-            self.file_writer.queue.put(line[:-1] + "\n")
-
+            file_path = file_path.with_suffix(".csv")
+        per_sensor = self.recording_settings.writer_per_sensor
+        segmented = self.file_writers[0].is_segmented
+        if per_sensor:
+            file_path = unique_sensors_path(file_path, [w.sensor.device_label  # type: ignore
+                                                        for w in self.file_writers])
+        elif segmented:
+            file_path = unique_segmented_path(file_path)
+        else:
+            file_path = unique_file_path(file_path)
+
+        file_rate = self.recording_settings.output_rate("file")
+        mask = ChannelMask.from_settings(self.recording_settings)
+        files = []
+        for writer in self.file_writers:
+            header = [f"Recorded at {asctime(localtime())} with {APPNAME} {__version__}\n"]
+            for s in self.sensor_settings_list:
+                if writer.sensor is not None and writer.sensor.device_label != s.device_label:
+                    continue
+                txt = f" Sensor: label={s.device_label}, cal-file={s.calibration_file_name}"
+                if file_rate != s.rate:
+                    txt += f", rate={file_rate} Hz (decimated)"
+                header.append(txt + "\n")
+
+            if len(comment_line) > 0:
+                header.append(comment_line + "\n")
+
+            if varnames:
+                names = ["time"]
+                if writer.sensor is None and len(self.recording_settings.sensors) > 1:
+                    names.append("device_tag")
+                names += mask.force_names + mask.trigger_names
+                header.append(",".join(names) + "\n")
+
+            if writer.sensor is None:
+                path = file_path
+            else:
+                path = sensor_file_path(file_path, writer.sensor.device_label)
+            writer.open_file(path, append_mode=False, header=header, wait=False)
+            logger.info("new file: %s", path)
+            if segmented:
+                path = manifest_path(path)
+            files.append(path)
+        for writer in self.file_writers:
+            writer.wait_done()
+
+        if per_sensor:
+            file_path = write_sensors_manifest(
+                file_path, [(w.sensor.sensor_id, w.sensor.device_label, fl)  # type: ignore
+                            for w, fl in zip(self.file_writers, files)])
+        else:
+            file_path = files[0]
+        self.data_file = file_path
         return file_path
 
     def close_data_file(self) -> None:
         """Close the data file
 
-        Afterwards data will not be saved anymore.
+        Afterwards data will not be saved anymore. Returns after all data
+        have been written and the file is closed.
 
         """
-        if isinstance(self.file_writer, SensorDataWriter):
+        if any(w.is_open for w in self.file_writers):
             self.pause_saving()
-            self.file_writer.close_file()
-            if self.file_writer.is_alive():
-                self.file_writer.join()
-            self.file_writer.set_file("")
+            # wait for the last blocks of the sensor processes of each writer
+            for writer in self.file_writers:
+                writer.close_file(
+                    paused={fsp.sensor_settings.sensor_id: fsp.pause_requests
+                            for fsp in self.force_sensor_processes
+                            if self._writer_of(fsp.sensor_settings) is writer},
+                    wait=False)
+            for writer in self.file_writers:
+                writer.wait_done()
+            self.data_file = None
 
@@ -0,0 +1,92 @@
+"""Decimation of the sensor data for sinks with lower output rates
+
+The sensor process acquires with the sampling rate and passes the data to
+each sink (data file, LSL, display, UDP force stream) with the output rate
+of the sink (RecordingSettings.output_rate). The data are decimated once per
+distinct output rate and shared between the sinks with the same rate.
+
+Before decimation, the forces are low-pass filtered (Butterworth, cutoff 0.4
+x output rate) to avoid aliasing. The filter is causal, thus the forces lag
+the time stamps by the group delay of the filter (a few output samples).
+Trigger are not filtered: each kept sample takes the largest trigger value
+of the samples since the previous kept sample, thus a short trigger pulse is
+moved to the next kept sample. The trigger columns are analog inputs, which
+are nonzero on most samples, thus nothing is carried beyond the next kept
+sample.
+"""
+
+__author__ = "Oliver Lindemann"
+
+import numpy as np
+
+from ..tools.filters import SOSFilter, butter_lowpass_sos
+from .types import ForceSensorBlock
+
+
+def decimation_factor(rate: float, out_rate: float) -> int:
+    """decimation factor for an output rate
+
+    Raises ValueError, if the output rate is not an integer divisor of the
+    rate.
+    """
+    # float/int: the settings might contain tomlkit numbers
+    factor = round(float(rate) / float(out_rate)) if out_rate > 0 else 0
+    if factor < 1 or abs(factor * out_rate - rate) > 1e-9 * rate:
+        raise ValueError(f"Output rate {out_rate} Hz is not an integer divisor "
+                         f"of the sampling rate {rate} Hz")
+    return factor
+
+
+class Decimator:
+    """Anti-aliased decimation of ForceSensorBlocks by an integer factor"""
+
+    FILTER_ORDER = 8
+    CUTOFF = 0.4  # relative to the output rate
+
+    def __init__(self, rate: float, out_rate: float, n_channels: int = 6):
+        """Raises ValueError, if the output rate is not an integer divisor of
+        the rate."""
+        factor = decimation_factor(rate, out_rate)
+        self.rate = rate
+        self.out_rate = out_rate
+        self.factor = factor
+        if factor > 1:
+            sos = butter_lowpass_sos(Decimator.CUTOFF * out_rate, rate, Decimator.FILTER_ORDER)
+            self._filter = SOSFilter(sos, n_channels)
+        else:
+            self._filter = None
+        self._next = 0  # index of the next kept sample in the next block
+        # largest trigger values after the last kept sample (per channel)
+        self._carry: np.ndarray | None = None
+
+    def process(self, block: ForceSensorBlock) -> ForceSensorBlock:
+        """decimates a block, the block might be empty"""
+        if self._filter is None:
+            return block
+        n = len(block.times)
+        forces = self._filter.process(block.forces)
+        idx = np.arange(self._next, n, self.factor)
+        self._next = (self._next - n) % self.factor
+
+        return ForceSensorBlock(times=block.times[idx],
+                                forces=forces[idx],
+                                trigger=self._decimate_trigger(block.trigger, idx),
+                                sensor_id=block.sensor_id)
+
+    def _decimate_trigger(self, trigger: np.ndarray, idx: np.ndarray) -> np.ndarray:
+        if len(idx) == 0:
+            if len(trigger) > 0:
+                self._carry = self._max(self._carry, trigger.max(axis=0))
+            return np.zeros((0, trigger.shape[1]), dtype=trigger.dtype)
+        # window of a kept sample: samples after the previous kept sample
+        starts = np.r_[0, idx[:-1] + 1]
+        rtn = np.maximum.reduceat(trigger[:idx[-1] + 1], starts, axis=0)
+        if self._carry is not None:
+            rtn[0] = np.maximum(rtn[0], self._carry)
+        tail = trigger[idx[-1] + 1:]
+        self._carry = tail.max(axis=0) if len(tail) > 0 else None
+        return rtn
+
+    @staticmethod
+    def _max(a: np.ndarray | None, b: np.ndarray) -> np.ndarray:
+        return b if a is None else np.maximum(a, b)
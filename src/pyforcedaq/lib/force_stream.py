@@ -0,0 +1,314 @@
+"""Binary force streaming via UDP
+
+Remote PCs that do not run LSL can subscribe to the live forces. The client
+sends a subscribe command to the UDP server of forceDAQ (UDPConnectionProcess,
+port 5005)
+
+    $subscribe <decimation>     e.g. b"$subscribe 10" (default: 1)
+    $unsubscribe
+
+and the server replies UDPConnection.COMMAND_REPLY. The sensor processes
+then send the forces of every n-th sample (decimation) as binary packets to
+the address of the subscriber.
+
+Packet layout (little endian):
+
+    header   2s  magic b"FD"
+             B   protocol version
+             B   sensor_id
+             I   sequence number (per subscriber and sensor)
+             H   number of samples (n)
+    samples  n x (d  time (local_clock),
+                  6f Fx, Fy, Fz, Tx, Ty, Tz)
+
+A gap in the sequence numbers indicates lost packets.
+
+Force streaming is off by default (RecordingSettings.udp_force_stream).
+"""
+
+__author__ = "Oliver Lindemann"
+
+import ctypes as ct
+import socket
+import struct
+from multiprocessing import Array, Value
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ..tools.clock import local_clock
+from .types import ForceSensorBlock
+
+MAGIC = b"FD"
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("<2sBBIH")
+SAMPLE_DTYPE = np.dtype([("time", "<f8"), ("forces", "<f4", (6,))])
+MAX_SAMPLES_PER_PACKET = 40  # 1290 bytes, fits into a single ethernet frame
+
+SUBSCRIBE = b"$subscribe"
+UNSUBSCRIBE = b"$unsubscribe"
+_COMMAND_REPLY = b"$ok"  # UDPConnection.COMMAND_REPLY
+
+
+def pack_force_packets(sensor_id: int, seq: int,
+                       times: NDArray[np.float64],
+                       forces: NDArray[np.float64]) -> list[bytes]:
+    """packs the samples into packets of at most MAX_SAMPLES_PER_PACKET
+    samples. The packets get the sequence numbers seq, seq+1, ..."""
+
+    samples = np.empty(len(times), dtype=SAMPLE_DTYPE)
+    samples["time"] = times
+    samples["forces"] = forces
+    rtn = []
+    for i in range(0, len(samples), MAX_SAMPLES_PER_PACKET):
+        chunk = samples[i:i + MAX_SAMPLES_PER_PACKET]
+        header = HEADER.pack(MAGIC, PROTOCOL_VERSION, sensor_id,
+                             seq & 0xFFFFFFFF, len(chunk))
+        rtn.append(header + chunk.tobytes())
+        seq += 1
+    return rtn
+
+
+def unpack_force_packet(packet: bytes) -> tuple[int, int, NDArray]:
+    """returns sensor_id, sequence number and the samples (structured array
+    with the fields "time" and "forces")
+
+    Raises ValueError, if the data are not a valid force packet.
+    """
+
+    if len(packet) < HEADER.size:
+        raise ValueError("Not a force packet")
+    magic, version, sensor_id, seq, n = HEADER.unpack_from(packet)
+    if magic != MAGIC or version != PROTOCOL_VERSION or \
+            len(packet) != HEADER.size + n * SAMPLE_DTYPE.itemsize:
+        raise ValueError("Not a force packet")
+    return sensor_id, seq, np.frombuffer(packet, dtype=SAMPLE_DTYPE,
+                                         count=n, offset=HEADER.size)
+
+
+def parse_subscribe_command(data: bytes) -> int | None:
+    """returns the decimation of a subscribe command or None, if the data
+    are not a valid subscribe command"""
+    if not data.startswith(SUBSCRIBE):
+        return None
+    arg = data[len(SUBSCRIBE):].strip()
+    if len(arg) == 0:
+        return 1
+    try:
+        decimation = int(arg)
+    except ValueError:
+        return None
+    if decimation < 1 or decimation > 0xFFFF:
+        return None
+    return decimation
+
+
+class _SubscriberSlot(ct.Structure):
+    _fields_ = [("ip", ct.c_uint32),
+                ("port", ct.c_uint16),
+                ("decimation", ct.c_uint16)]  # 0: free slot
+
+
+class ForceStreamSubscribers:
+    """Table of the subscribers of the force stream in shared memory
+
+    The table is modified by the UDP server process and read by the sensor
+    processes. The sensor processes check only the version counter per
+    block and read the table only if it has changed.
+    """
+
+    MAX_SUBSCRIBERS = 8
+
+    def __init__(self):
+        self._slots = Array(_SubscriberSlot, ForceStreamSubscribers.MAX_SUBSCRIBERS,
+                            lock=False)
+        self.version = Value(ct.c_uint32, 0, lock=False)
+
+    def _find(self, address: tuple[str, int]) -> int | None:
+        ip = _ip_to_int(address[0])
+        for i, s in enumerate(self._slots):
+            if s.decimation > 0 and s.ip == ip and s.port == address[1]:
+                return i
+        return None
+
+    def add(self, address: tuple[str, int], decimation: int = 1) -> bool:
+        """adds or updates a subscriber. Returns False, if the table is full"""
+        idx = self._find(address)
+        if idx is None:
+            free = [i for i, s in enumerate(self._slots) if s.decimation == 0]
+            if len(free) == 0:
+                return False
+            idx = free[0]
+        slot = self._slots[idx]
+        slot.ip = _ip_to_int(address[0])
+        slot.port = address[1]
+        slot.decimation = decimation
+        self.version.value += 1
+        return True
+
+    def remove(self, address: tuple[str, int]) -> None:
+        idx = self._find(address)
+        if idx is not None:
+            self._slots[idx].decimation = 0
+            self.version.value += 1
+
+    def clear(self) -> None:
+        for s in self._slots:
+            s.decimation = 0
+        self.version.value += 1
+
+    def subscribers(self) -> list[tuple[tuple[str, int], int]]:
+        """list of (address, decimation)"""
+        return [((_int_to_ip(s.ip), s.port), s.decimation)
+                for s in self._slots if s.decimation > 0]
+
+    def __len__(self) -> int:
+        return sum(1 for s in self._slots if s.decimation > 0)
+
+
+class _Target:
+    __slots__ = ("address", "decimation", "phase", "seq")
+
+    def __init__(self, address: tuple[str, int], decimation: int):
+        self.address = address
+        self.decimation = decimation
+        self.phase = 0  # samples to skip until the next sent sample
+        self.seq = 0
+
+
+class ForceStreamSender:
+    """Sends the force blocks of one sensor to all subscribers (used in the
+    sensor process)"""
+
+    def __init__(self, subscribers: ForceStreamSubscribers, sensor_id: int):
+        self.sensor_id = sensor_id
+        self._subscribers = subscribers
+        self._version = None
+        self._targets: list[_Target] = []
+        self._socket: socket.socket | None = None
+
+    def _update_targets(self) -> None:
+        self._version = self._subscribers.version.value
+        previous = {t.address: t for t in self._targets}
+        self._targets = []
+        for address, decimation in self._subscribers.subscribers():
+            target = previous.get(address)
+            if target is None:
+                target = _Target(address, decimation)
+            target.decimation = decimation
+            self._targets.append(target)
+
+        if len(self._targets) > 0 and self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.setblocking(False)
+
+    def send(self, block: ForceSensorBlock) -> None:
+        if self._subscribers.version.value != self._version:
+            self._update_targets()
+        n = len(block)
+        if n == 0:
+            return
+        for target in self._targets:
+            if target.phase >= n:
+                target.phase -= n
+                continue
+            idx = slice(target.phase, n, target.decimation)
+            times = block.times[idx]
+            target.phase = target.phase + len(times) * target.decimation - n
+            for packet in pack_force_packets(self.sensor_id, target.seq,
+                                             times, block.forces[idx]):
+                target.seq += 1
+                try:
+                    self._socket.sendto(packet, target.address)  # type: ignore
+                except OSError:
+                    pass  # packet lost, the subscriber sees the gap in seq
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class ForceStreamClient:
+    """Client that subscribes to the force stream of a forceDAQ UDP server
+
+    Example::
+
+        client = ForceStreamClient(server_ip, decimation=10)
+        if client.subscribe():
+            while True:
+                packet = client.receive(timeout=1.0)
+                if packet is not None:
+                    sensor_id, samples = packet
+                    print(sensor_id, samples["time"], samples["forces"])
+    """
+
+    def __init__(self, server_ip: str, udp_port: int = 5005,
+                 decimation: int = 1, ip: str = ""):
+        self.server = (server_ip, udp_port)
+        self.decimation = decimation
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((ip, 0))
+        self._next_seq: dict[int, int] = {}
+        self.lost_packets: dict[int, int] = {}  # sensor_id -> n lost packets
+        self.received_packets = 0
+
+    def close(self) -> None:
+        self._socket.close()
+
+    def subscribe(self, timeout: float = 1.0) -> bool:
+        cmd = SUBSCRIBE + b" %d" % self.decimation
+        return self._command(cmd, timeout)
+
+    def unsubscribe(self, timeout: float = 1.0) -> bool:
+        return self._command(UNSUBSCRIBE, timeout)
+
+    def _command(self, cmd: bytes, timeout: float) -> bool:
+        self._socket.sendto(cmd, self.server)
+        t_end = local_clock() + timeout
+        while True:
+            remaining = t_end - local_clock()
+            if remaining <= 0:
+                return False
+            self._socket.settimeout(remaining)
+            try:
+                data, sender = self._socket.recvfrom(65535)
+            except (TimeoutError, BlockingIOError):
+                return False
+            if sender == self.server and data == _COMMAND_REPLY:
+                return True
+            self._handle_packet(data)  # force packets are not discarded
+
+    def receive(self, timeout: float | None = None) -> tuple[int, NDArray] | None:
+        """returns sensor_id and samples of the next force packet or None,
+        if no packet arrived within timeout seconds"""
+        self._socket.settimeout(timeout)
+        while True:
+            try:
+                data, _ = self._socket.recvfrom(65535)
+            except (TimeoutError, BlockingIOError):
+                return None
+            rtn = self._handle_packet(data)
+            if rtn is not None:
+                return rtn
+
+    def _handle_packet(self, data: bytes) -> tuple[int, NDArray] | None:
+        try:
+            sensor_id, seq, samples = unpack_force_packet(data)
+        except ValueError:
+            return None
+        expected = self._next_seq.get(sensor_id, seq)
+        if seq != expected:
+            lost = (seq - expected) & 0xFFFFFFFF
+            self.lost_packets[sensor_id] = self.lost_packets.get(sensor_id, 0) + lost
+        self._next_seq[sensor_id] = (seq + 1) & 0xFFFFFFFF
+        self.received_packets += 1
+        return sensor_id, samples
+
+
+def _ip_to_int(ip: str) -> int:
+    return int.from_bytes(socket.inet_aton(ip), "big")
+
+
+def _int_to_ip(ip: int) -> str:
+    return socket.inet_ntoa(ip.to_bytes(4, "big"))
@@ -0,0 +1,130 @@
+"""Detection of sample loss and DAQ backlog
+
+The sensor process compares the number of acquired samples with the number
+of samples expected from the sampling rate and the elapsed time since the
+start of the acquisition (SampleMonitor).
+
+backlog: samples that have been acquired by the DAQ device but not yet read
+    (age of the oldest unread sample, histogram "daq_backlog"). A growing
+    backlog indicates that the polling loop can not keep up with the rate.
+gap: samples that are missing after a read of all available samples, e.g.
+    because the buffer of the DAQ device overran. Gaps are counted (counters
+    "gaps" and "lost_samples"), written as comment to the data file
+    (see GAP_COMMENT) and sent to the events LSL stream by the DataRecorder.
+
+For backends with hardware timestamps, gaps are detected as jumps of the
+sample times, which locates the gap exactly. Otherwise, the expected number
+of samples is based on local_clock, thus deficits smaller than TOLERANCE
+seconds plus the maximum clock drift (DRIFT) are not considered as gap, and
+gaps can only be detected for backends that read all available samples at
+once (DAQCapabilities.block_read).
+"""
+
+__author__ = "Oliver Lindemann"
+
+from dataclasses import dataclass
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ..tools.stats import StageStats
+from .types import TAG_COMMENTS
+
+GAP_COMMENT = TAG_COMMENTS + "gap: sensor_id={sensor_id}, time={time:.6f}, lost_samples={n_lost}"
+
+
+@dataclass(frozen=True)
+class SampleGap:
+    """lost samples before the sample at time (local_clock)"""
+    device_label: str
+    sensor_id: int
+    time: float
+    n_lost: int
+
+    def comment(self) -> str:
+        """comment line for the data file"""
+        return GAP_COMMENT.format(sensor_id=self.sensor_id, time=self.time,
+                                  n_lost=self.n_lost)
+
+
+class SampleMonitor:
+    """Compares the acquired samples with rate x elapsed time"""
+
+    TOLERANCE = 0.05  # seconds
+    DRIFT = 1e-4  # max. relative drift between DAQ clock and local_clock
+
+    def __init__(self, rate: float, stats: StageStats | None = None):
+        """stats: backlog (histogram "daq_backlog") and the counters "gaps"
+        and "lost_samples" are added to stats"""
+        self.rate = float(rate)
+        self.n_acquired = 0
+        self.n_lost = 0
+        self._t_start = 0.0
+        self._last_time = None  # sample time of the last sample
+        if stats is not None:
+            self._backlog = stats.add_stage("daq_backlog")
+            self._gaps = stats.add_counter("gaps")
+            self._lost = stats.add_counter("lost_samples")
+        else:
+            self._backlog = None
+            self._gaps = None
+            self._lost = None
+
+    def start(self, time: float) -> None:
+        """start of the acquisition (local_clock)"""
+        self._t_start = time
+        self.n_acquired = 0
+        self.n_lost = 0
+        self._last_time = None
+
+    def update(self, n_samples: int, complete: bool, time: float,
+               sample_times: NDArray[np.float64] | None = None) -> tuple[int, int]:
+        """processes a read of n_samples at time (local_clock)
+
+        complete: the read returned all available samples
+        sample_times: hardware timestamps of the samples, if available
+
+        Returns the number of lost samples and the index of the first sample
+        after the gap, if a new gap has been detected, otherwise (0, 0).
+        """
+        elapsed = time - self._t_start
+        expected = elapsed * self.rate
+        if self._backlog is not None:
+            backlog = expected - self.n_acquired - self.n_lost
+            self._backlog.add(max(backlog, 0.0) / self.rate)
+        self.n_acquired += n_samples
+
+        if sample_times is not None:
+            return self._check_sample_times(sample_times)
+        if not complete:
+            return 0, 0  # backlog, samples are still available
+        deficit = expected - self.n_acquired - self.n_lost
+        if deficit <= (SampleMonitor.TOLERANCE + SampleMonitor.DRIFT * elapsed) * self.rate:
+            return 0, 0
+        n_lost = round(deficit)
+        self._count(n_lost, 1)
+        return n_lost, 0
+
+    def _check_sample_times(self, sample_times: NDArray[np.float64]) -> tuple[int, int]:
+        if len(sample_times) == 0:
+            return 0, 0
+        if self._last_time is None:
+            intervals = np.diff(sample_times)
+            offset = 1
+        else:
+            intervals = np.diff(sample_times, prepend=self._last_time)
+            offset = 0
+        self._last_time = sample_times[-1]
+        missing = np.round(intervals * self.rate).astype(np.int64) - 1
+        jumps = np.flatnonzero(missing > 0)
+        if len(jumps) == 0:
+            return 0, 0
+        n_lost = int(missing[jumps].sum())
+        self._count(n_lost, len(jumps))
+        return n_lost, int(jumps[0]) + offset
+
+    def _count(self, n_lost: int, n_gaps: int) -> None:
+        self.n_lost += n_lost
+        if self._gaps is not None:
+            self._gaps.add(n_gaps)
+            self._lost.add(n_lost)  # type: ignore
@@ -0,0 +1,131 @@
+"""Live sensor data in named shared memory
+
+Each sensor process writes its samples into a ring buffer in a named shared
+memory block (see DataRecorder.shared_memory_names). Other processes read the
+samples with pyforcedaq.client.SharedMemoryClient.
+
+Layout (native byte order):
+
+    header   8s  magic b"FDAQRNG1"
+             q   capacity (samples)
+             q   sensor_id
+             d   sampling rate
+             q   number of written samples (updated after the samples)
+             q   process id of the owner (the recording)
+    samples  capacity x SAMPLE_DTYPE, starting at DATA_OFFSET
+"""
+
+__author__ = "Oliver Lindemann"
+
+import os
+import struct
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .types import ForceSensorBlock
+
+MAGIC = b"FDAQRNG1"
+HEADER = struct.Struct("=8sqqdqq")
+N_WRITTEN_OFFSET = 32
+DATA_OFFSET = 64
+SAMPLE_DTYPE = np.dtype([("time", "f8"), ("forces", "f8", (6,)),
+                         ("trigger", "f8", (2,))])
+
+
+def shared_memory_name(device_label: str) -> str:
+    """name of the shared memory of a sensor"""
+    return f"pyforcedaq_{device_label}"
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """attaches to an existing shared memory block without taking over its
+    ownership (the block is not removed, if this process ends)"""
+    return shared_memory.SharedMemory(name=name, track=False)
+
+
+def _process_exists(pid: int) -> bool:
+    if os.name == "nt":
+        return True  # Windows removes shared memory with its last handle
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def ring_views(shm: shared_memory.SharedMemory) -> tuple[np.ndarray, np.ndarray]:
+    """returns a view of the number of written samples (array of length 1)
+    and of the sample data
+
+    Raises ValueError, if the shared memory is not a sample ring.
+    """
+    magic, capacity, _, _, _, _ = HEADER.unpack_from(shm.buf)
+    if magic != MAGIC:
+        raise ValueError(f"Shared memory {shm.name} is not a pyForceDAQ sample ring")
+    n_written = np.ndarray((1,), dtype=np.int64, buffer=shm.buf, offset=N_WRITTEN_OFFSET)
+    data = np.ndarray((capacity,), dtype=SAMPLE_DTYPE, buffer=shm.buf, offset=DATA_OFFSET)
+    return n_written, data
+
+
+class SampleRing:
+    """Owner of the shared memory of a sample ring (creates and removes it)
+
+    Raises RuntimeError, if the shared memory exists and its owner is
+    running or unknown. A block left over from a crashed recording is
+    removed.
+    """
+
+    def __init__(self, name: str, capacity: int, sensor_id: int, rate: float):
+        size = DATA_OFFSET + capacity * SAMPLE_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            old = attach(name)
+            magic, _, _, _, _, pid = HEADER.unpack_from(old.buf)
+            if magic != MAGIC or pid <= 0 or _process_exists(pid):
+                old.close()
+                raise RuntimeError(f"Shared memory {name} is used by another process "
+                                   f"(pid {pid}), e.g. a recording with the same sensor")
+            old.close()
+            old.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, capacity, sensor_id, rate, 0, os.getpid())
+        self.name = name
+        self.capacity = capacity
+
+    def unlink(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SampleRingWriter:
+    """Writes sample blocks into a sample ring (used in the sensor process)"""
+
+    def __init__(self, name: str):
+        self._shm = attach(name)
+        self._n_written, self._data = ring_views(self._shm)
+        self.capacity = len(self._data)
+
+    def write(self, block: ForceSensorBlock) -> None:
+        n = len(block)
+        start = 0
+        if n > self.capacity:
+            start = n - self.capacity
+        n_written = int(self._n_written[0]) + start
+        while start < n:
+            pos = n_written % self.capacity
+            k = min(n - start, self.capacity - pos)
+            chunk = self._data[pos:pos + k]
+            chunk["time"] = block.times[start:start + k]
+            chunk["forces"] = block.forces[start:start + k]
+            chunk["trigger"] = block.trigger[start:start + k]
+            start += k
+            n_written += k
+        self._n_written[0] = n_written  # publish samples
+
+    def close(self) -> None:
+        del self._n_written, self._data  # release buffer views
+        self._shm.close()
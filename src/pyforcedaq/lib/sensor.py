@@ -3,35 +3,75 @@
 Per default the NIDAQMX library is installed and access the NI instruments data.
 
 Uses the atiiaftt library for converting voltages to force data, if installed.
+
+Hardware libraries (nidaqmx, atiiaftt) are imported on first use only.
 """
 
 __author__ = "Oliver Lindemann"
 
+from collections.abc import Sequence
 from pathlib import Path
+from time import perf_counter
 
-import atiiaftt
 import numpy as np
 from numpy.typing import NDArray
 
-from ..constants import DaqType
 from ..tools.clock import local_clock
 from ..tools.data import DataBuffer
-from ..tools.file_writer import AbstractFileWriter
-from .daq import mock_daq, ni_daq
+from ..tools.file_writer import NEWLINE, AbstractFileWriter
+from ..tools.stats import StageStats
+from .daq import get_backend
 from .settings import RecordingSettings, SensorSettings
-from .types import ForceSensorData
+from .types import ChannelMask, ForceSensorBlock, ForceSensorData
 
 
 class CalibrationConverter:
 
     def __init__(self, calibration_file: str | Path):
+        import atiiaftt
+
         self._ftsensor = atiiaftt.FTSensor(str(calibration_file), index=1)
 
+        self._read_coefficients()
+
     def convertToFT(self, voltages:NDArray) -> list:
         return self._ftsensor.convertToFt(voltages.tolist()) #TODO: to list needed?
 
+    def convert_block(self, voltages: NDArray) -> NDArray[np.float64]:
+        """converts a block of voltages (samples x channels) to force data
+
+        Same math as ConvertToFT of the ATI C library, but applied to all
+        samples at once with a single matrix multiplication.
+        """
+
+        gauges = voltages[:, :self._n_gauges]
+        if self._temp_comp and voltages.shape[1] > self._n_gauges:
+            dt = voltages[:, self._n_gauges, np.newaxis] - self._thermistor
+            gauges = ((gauges + self._bias_slopes * dt) /
+                      (1 - self._gain_slopes * dt)) - self._tc_bias
+        else:
+            gauges = gauges - self._bias
+        return gauges @ self._matrix.T
+
     def bias(self, bias_values: NDArray) -> None:
         self._ftsensor.bias(bias_values.tolist())
+        self._read_coefficients()
+
+    def _read_coefficients(self) -> None:
+        """copies the conversion coefficients of the C library"""
+
+        cal = self._ftsensor.calibration
+        rt = cal.rt
+        n = rt.NumChannels - 1  # last channel is the thermistor
+        self._n_gauges = n
+        self._matrix = np.array([list(rt.working_matrix[i])[:n]
+                                 for i in range(rt.NumAxes)], dtype=np.float64)
+        self._bias = np.array(list(rt.bias_vector)[:n], dtype=np.float64)
+        self._tc_bias = np.array(list(rt.TCbias_vector)[:n], dtype=np.float64)
+        self._bias_slopes = np.array(list(rt.bias_slopes)[:n], dtype=np.float64)
+        self._gain_slopes = np.array(list(rt.gain_slopes)[:n], dtype=np.float64)
+        self._thermistor = float(rt.thermistor)
+        self._temp_comp = bool(cal.cfg.TempCompEnabled)
 
 class Sensor:
 
@@ -39,26 +79,32 @@ class Sensor:
     SENSOR_CHANNELS = range(0, 5 + 1)
     # channel 7 for trigger   synchronization validation
     TRIGGER_CHANNELS = range(5, 6 + 1) # TODO remove deprecated trigger channel support
+    READ_BUFFER_SAMPLES = 1000 # max. number of samples per read
 
     def __init__(self, s_settings: SensorSettings,
-                 daq_type: DaqType,
-                 history_size: int):
-        """history_size: number of raw samples to keep in the history needed for determining the bias"""
+                 daq_backend: str,
+                 history_size: int,
+                 stats: StageStats | None = None):
+        """history_size: number of raw samples to keep in the history needed for determining the bias
+        daq_backend: name of the registered DAQ backend (see lib.daq)
+        stats: durations of the stages "daq_read" and "conversion" are
+            added to the histograms of stats
+        """
 
         assert isinstance(s_settings, SensorSettings)
         assert len(self.SENSOR_CHANNELS) == len(ForceSensorData.forces_names)
 
         n_channels = len(self.SENSOR_CHANNELS) + len(self.TRIGGER_CHANNELS)
-        if daq_type == DaqType.NIDAQMX:
-            self.daq = ni_daq.DAQReadAnalog(configuration=s_settings,
-                                     read_array_size_in_samples=n_channels)
-        elif daq_type == DaqType.MOCK_SENSOR:
-            self.daq = mock_daq.DAQReadAnalog(configuration=s_settings,
-                                     read_array_size_in_samples=n_channels)
-        else:
-            raise RuntimeError(f"Unsupported daq_type: {daq_type}")
-
-        if daq_type == DaqType.MOCK_SENSOR:
+        self._n_channels = n_channels
+        backend = get_backend(daq_backend)
+        self.daq = backend(configuration=s_settings,
+                           read_array_size_in_samples=n_channels)
+        self.capabilities = backend.CAPABILITIES
+        if self.capabilities.read_into_buffer:
+            self._read_buffer = np.empty((Sensor.READ_BUFFER_SAMPLES, n_channels),
+                                         dtype=np.float64)
+
+        if self.capabilities.calibrated:
             self._calib_converter = None
         else:
             cal_file = s_settings.calibration_folder / s_settings.calibration_file_name
@@ -84,6 +130,15 @@ class Sensor:
         # for bias determination
         self.raw_sample_history = DataBuffer(maxlen=history_size) # unbiased samples
         self.bias = np.zeros(len(Sensor.SENSOR_CHANNELS), dtype=np.float64)
+        # the last read returned all available samples (see SampleMonitor)
+        self.last_read_complete = False
+
+        if stats is not None:
+            self._read_stats = stats.add_stage("daq_read")
+            self._conversion_stats = stats.add_stage("conversion")
+        else:
+            self._read_stats = None
+            self._conversion_stats = None
 
     def determine_bias(self):
         """determines bias based on the last raw samples"""
@@ -92,47 +147,78 @@ class Sensor:
         if self._calib_converter is not None:
             self._calib_converter.bias(self.bias)
 
-    def poll_data(self) -> list[ForceSensorData]:
+    def _read_raw(self) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """reads the raw data (samples x channels) and the sample times
+        using the fastest code path that the DAQ backend supports"""
+
+        if self.capabilities.read_into_buffer:
+            n = self.daq.read_into(self._read_buffer)
+            raw = self._read_buffer[:n]
+            self.last_read_complete = n < len(self._read_buffer)
+        else:
+            raw = self.daq.read_analog()
+            self.last_read_complete = self.capabilities.block_read
+            if raw.size == 0:
+                raw = raw.reshape(0, self._n_channels)
+            else:
+                raw = np.atleast_2d(raw)
+
+        if self.capabilities.hardware_timestamps:
+            times = self.daq.sample_times(len(raw))
+        else:
+            times = np.full(len(raw), local_clock())
+        return raw, times
+
+    def poll_block(self) -> ForceSensorBlock:
         """Polling data
 
-        Reading data from NI device and converting voltages to force data using
-        the calibration converter.
+        Reading all available data from the DAQ device and converting voltages
+        to force data using the calibration converter.
 
         Returns
         -------
-        data: ForceSensorData
-            the converted force data as ForceSensorData object
-
+        data: ForceSensorBlock
+            the converted force data of all new samples
         """
 
-        npdata_2d = self.daq.read_analog()
-        t = local_clock()
-        rtn = []
-        for data in npdata_2d:
+        t0 = perf_counter()
+        raw, times = self._read_raw()
+        t1 = perf_counter()
+        raw_samples = raw[:, Sensor.SENSOR_CHANNELS.start:Sensor.SENSOR_CHANNELS.stop]
+        self.raw_sample_history.extend(raw_samples)
 
-            raw_samples = data[Sensor.SENSOR_CHANNELS]
-            self.raw_sample_history.append(raw_samples)
+        # bias correction of raw samples and conversion to force data, if needed
+        if self.convert_to_FT and self._calib_converter is not None:
+            forces = self._calib_converter.convert_block(raw_samples)
+        else:
+            forces = raw_samples - self.bias
 
-            # bias correction of raw samples and conversion to force data, if needed
-            if self.convert_to_FT and self._calib_converter is not None:
-                forces = np.asarray(
-                    self._calib_converter.convertToFT(voltages=raw_samples)
-                )
-            else:
-                # array
-                forces = raw_samples - self.bias
+        # reverse scaling if needed
+        forces = forces * self._reverse_vector
 
-            # reverse scaling if needed
-            forces = forces * self._reverse_vector
+        # TODO: remove deprecated hardware trigger channel support
+        trigger = raw[:, Sensor.TRIGGER_CHANNELS.start:Sensor.TRIGGER_CHANNELS.stop].copy()
 
-            rtn.append(ForceSensorData(
-                forces=forces,
-                time=t,
-                sensor_id=self.sensor_id,
-                trigger=data[Sensor.TRIGGER_CHANNELS]
-            )) # TODO: remove deprecated hardware trigger channel support
+        if self._read_stats is not None and len(raw) > 0:
+            self._read_stats.add(t1 - t0)
+            self._conversion_stats.add(perf_counter() - t1)  # type: ignore
+        return ForceSensorBlock(times=times, forces=forces, trigger=trigger,
+                                sensor_id=self.sensor_id)
 
-        return rtn
+    def poll_data(self) -> list[ForceSensorData]:
+        """Polling data
+
+        Reading data from NI device and converting voltages to force data using
+        the calibration converter.
+
+        Returns
+        -------
+        data: list of ForceSensorData
+            the converted force data as ForceSensorData objects
+
+        """
+
+        return self.poll_block().samples()
 
 class SensorDataWriter(AbstractFileWriter):
 
@@ -141,27 +227,72 @@ class SensorDataWriter(AbstractFileWriter):
         recording_settings: RecordingSettings,
         filepath: Path|str = "",
         append_mode: bool = False,
-        float_decimal_places: int = 6
+        float_decimal_places: int = 6,
+        sensor: SensorSettings | None = None
     ):
-        """To write to a file from multiple processes. Use SensorDataWriter.queue.put(str) to write file"""
+        """To write to a file from multiple processes. Use SensorDataWriter.queue.put(str) to write file
 
-        super().__init__(filepath=Path(filepath), append_mode=append_mode)
+        sensor: writer of a single sensor (see RecordingSettings.writer_per_sensor),
+            the data have no device_tag column
 
-        self._write_forces = recording_settings.array_write_forces()
-        self._write_trigger = recording_settings.array_write_trigger()
-        self._write_deviceid = len(recording_settings.sensors) > 1
-        self._decimal_places = float_decimal_places
+        Blocks (ForceSensorBlock) contain only the written channels, the mask
+        of the settings is applied by the sensor process (see
+        ChannelMask.apply and lib.sinks.QueueSink). Single samples
+        (ForceSensorData) are masked by the writer.
+        """
 
-    def to_csv(self, data: ForceSensorData) -> str:
-        """converts data to string."""
+        super().__init__(filepath=filepath, append_mode=append_mode,
+                         queue_size=recording_settings.writer_queue_size,
+                         lag_warning=recording_settings.writer_lag_warning,
+                         segment_size=int(recording_settings.segment_size * 1e6),
+                         segment_duration=recording_settings.segment_duration,
+                         buffer_size=recording_settings.writer_buffer_size,
+                         flush_interval=recording_settings.writer_flush_interval,
+                         fsync=recording_settings.writer_fsync,
+                         index_interval=recording_settings.index_interval,
+                         pyramid_bins=recording_settings.pyramid_bins,
+                         name="File writer" if sensor is None else
+                              f"File writer {sensor.device_label}")
+
+        self._mask = ChannelMask.from_settings(recording_settings)
+        self.sensor = sensor
+        self._write_deviceid = sensor is None and len(recording_settings.sensors) > 1
+        self._decimal_places = float_decimal_places
 
+    def to_csv(self, data: ForceSensorData | ForceSensorBlock) -> str:
+        """converts data to string. A block is converted to one line per sample."""
+
+        if isinstance(data, ForceSensorBlock):
+            return NEWLINE.join(self._format_row(float(t), data.sensor_id, f, tr)
+                                for t, f, tr in zip(data.times, data.forces, data.trigger))
+        return self._format_row(data.time, data.sensor_id,
+                                data.forces[self._mask.forces],
+                                data.trigger[self._mask.trigger])
+
+    def data_times(self, data: ForceSensorData | ForceSensorBlock) -> Sequence[float]:
+        if isinstance(data, ForceSensorBlock):
+            return data.times
+        return (data.time,)
+
+    def data_values(self, data: ForceSensorData | ForceSensorBlock
+                    ) -> tuple[int, NDArray[np.float64]]:
+        if isinstance(data, ForceSensorBlock):
+            return data.sensor_id, data.forces
+        return data.sensor_id, data.forces[self._mask.forces].reshape(1, -1)
+
+    @property
+    def value_names(self) -> list[str]:
+        return self._mask.force_names
+
+    def _format_row(self, time: float, sensor_id: int,
+                    forces: NDArray[np.float64], trigger: NDArray[np.float64]) -> str:
         float_format = "{0:." + str(self._decimal_places) + "f},"
-        txt = f"{data.time},"
+        txt = f"{time},"
         if self._write_deviceid:
-            txt += f"{data.sensor_id},"
-        for x in data.forces[self._write_forces]:
+            txt += f"{sensor_id},"
+        for x in forces:
             txt += float_format.format(x)
-        for x in data.trigger[self._write_trigger]:
+        for x in trigger:
             if isinstance(x, int):
                 txt += f"{x},"
             else:
@@ -3,16 +3,35 @@ __author__ = "Oliver Lindemann"
 import atexit
 import ctypes as ct
 import logging
-from multiprocessing import Array, Event, Process, Queue, Value
-from typing import Optional
+from multiprocessing import Array, Event, Process, RawValue, Value
+from multiprocessing.queues import Queue
 
 import numpy as np
 from numpy import typing as npt
 
-from ..constants import DaqType
-from ..tools import lsl
+from .. import init_logging
+from ..tools.clock import local_clock
+from ..tools.control_word import ControlWord
+from ..tools.event_ring import EventRing
+from ..tools.file_writer import NEWLINE, SourcePaused
+from ..tools.profiling import ProcessProfiler, profiled
+from ..tools.stats import StageStats
+from .force_stream import ForceStreamSubscribers
+from .sample_monitor import SampleGap, SampleMonitor
 from .sensor import Sensor
 from .settings import RecordingSettings, SensorSettings
+from .sinks import (
+    ChannelMask,
+    ForceStreamSink,
+    LSLSink,
+    QueueSink,
+    SampleRingSink,
+    Sink,
+    SinkPipeline,
+    StreamServerSink,
+    ValuesSink,
+)
+from .stream_server import StreamInput
 
 logger = logging.getLogger()
 
@@ -21,15 +40,44 @@ class SensorProcess(Process):
     DETERMINE_BIAS_SAMPLES = 20
     INIT_SAMPLES = 100
 
+    # bits of the control word
+    QUIT = 1
+    SAVING = 2
+    BIAS_REQUEST = 4
+
     def __init__(
         self,
         sensor_settings: SensorSettings,
         recording_settings: RecordingSettings,
-        file_writer_queue: Optional[Queue],
-        daq_type: DaqType
+        file_writer_queue: Queue | None,
+        event_ring: EventRing | None = None,
+        force_stream: ForceStreamSubscribers | None = None,
+        stream_input: StreamInput | None = None,
+        shared_memory_name: str | None = None,
+        sinks: list[Sink] | None = None,
+        gap_events: Queue | None = None
     ):
         """ForceSensorProcess
 
+        The DAQ backend is defined by recording_settings.daq_backend.
+
+        event_ring: software trigger (time, code) that are merged into the
+            trigger1 channel of the samples (see EventRingReader.assign)
+
+        force_stream: subscribers of the binary UDP force stream (see
+            lib.force_stream), the process sends the forces to all subscribers
+
+        stream_input: input of the local streaming server (see
+            lib.stream_server)
+
+        shared_memory_name: name of the sample ring in shared memory for
+            the live data (see lib.sample_ring)
+
+        sinks: additional outputs of the forces (see lib.sinks)
+
+        gap_events: queue for the detected sample gaps (SampleGap, see
+            lib.sample_monitor)
+
         return_buffered_data_after_pause: does not write shared data queue continuously and
             writes it the buffer data to queue only after pause (or stop)
 
@@ -45,21 +93,37 @@ class SensorProcess(Process):
 
         super().__init__()
 
-        self._daq_type = daq_type
         self.sensor_settings = sensor_settings
         self.recording_settings = recording_settings
         self._file_writer_queue = file_writer_queue
-
-        self.event_trigger = Event()  #  software trigger
+        self._event_ring = event_ring
+        self._force_stream = force_stream
+        self._stream_input = stream_input
+        self._shared_memory_name = shared_memory_name
+        self._gap_events = gap_events
 
         self._dat = Array(ct.c_double, 6)
         self._np_dat = np.frombuffer(
             self._dat.get_obj(), dtype=np.float64
         )  # numpy view
+        # outputs, raises ValueError for invalid output rates or filters
+        self._sinks = self._create_sinks() + (sinks if sinks is not None else [])
+        # latency histograms of the stages (the stages of the Sensor are
+        # added here, as the Sensor is created in the process)
+        self.stats = StageStats(f"Sensor {sensor_settings.device_label}",
+                                ["daq_read", "conversion"])
+        self._pipeline = SinkPipeline(self._sinks, self.sensor_settings.rate, stats=self.stats)
+        self._monitor = SampleMonitor(self.sensor_settings.rate, stats=self.stats)
         self._total_sample_cnt = Value(ct.c_int64, 0)
+        # control flags, read by the polling loop once per block
+        self._control = ControlWord()
+        # number of pause requests, acknowledged by the polling loop in the
+        # file writer queue (see pause_requests)
+        self._pause_request = RawValue(ct.c_int64, 0)
+        # only for waiting until the bias is determined (see DataRecorder)
         self.flag_sensor_bias_is_determined = Event()
-        self._flag_quit_request = Event()
-        self.__flag_is_saving = Event()
+        # set before start to profile the process (see tools.profiling)
+        self.profiler: ProcessProfiler | None = None
 
         atexit.register(self.join)
 
@@ -111,60 +175,95 @@ class SensorProcess(Process):
         with self._total_sample_cnt.get_lock():
             return int(self._total_sample_cnt.value)  # type: ignore
 
+    def get_lost_sample_cnt(self) -> int:
+        """number of lost samples (see lib.sample_monitor)"""
+        return self.stats.counters["lost_samples"].value
+
     def determine_bias(self):
         self.flag_sensor_bias_is_determined.clear()
+        self._control.set(SensorProcess.BIAS_REQUEST)
 
     def start_saving(self):
         if self._file_writer_queue is not None:
-            self.__flag_is_saving.set()
+            self._control.set(SensorProcess.SAVING)
 
     def pause_saving(self):
-        self.__flag_is_saving.clear()
+        if self.is_saving():
+            self._control.clear(SensorProcess.SAVING)
+            self._pause_request.value += 1
+
+    @property
+    def pause_requests(self) -> int:
+        """number of pause requests (pause_saving while saving)
+
+        The polling loop acknowledges each request with a SourcePaused item
+        (source: sensor_id) in the file writer queue, which follows the last
+        block of the saving period (see AbstractFileWriter.close_file).
+        """
+        return self._pause_request.value
+
+    def _acknowledge_pause(self, request: int) -> None:
+        if self._file_writer_queue is not None:
+            self._file_writer_queue.put(SourcePaused(self.sensor_settings.sensor_id, request))
 
     def is_saving(self) -> bool:
-        return self.__flag_is_saving.is_set()
+        return self._control.is_set(SensorProcess.SAVING)
 
     def quit(self):
-        self._flag_quit_request.set()
+        self._control.set(SensorProcess.QUIT)
 
     def join(self, timeout=None):
-        self._flag_quit_request.set()
+        self._control.set(SensorProcess.QUIT)
         super().join(timeout)
 
+    def _create_sinks(self) -> list[Sink]:
+        """sinks of the recording settings"""
+        rs = self.recording_settings
+        sinks: list[Sink] = [ValuesSink(self._dat, rate=rs.output_rate("display"),
+                                        filter_spec=rs.filter_display)]
+        if rs.lsl_stream:
+            sinks.append(LSLSink(self.sensor_settings.device_label, rate=rs.output_rate("lsl"),
+                                 mask=ChannelMask.from_settings(rs), filter_spec=rs.filter_lsl))
+        if self._file_writer_queue is not None:
+            sinks.append(QueueSink(self._file_writer_queue, rate=rs.output_rate("file"),
+                                   mask=ChannelMask.from_settings(rs),
+                                   filter_spec=rs.filter_file))
+        if self._force_stream is not None:
+            sinks.append(ForceStreamSink(self._force_stream, self.sensor_settings.sensor_id,
+                                         rate=rs.output_rate("udp")))
+        if self._stream_input is not None:
+            sinks.append(StreamServerSink(self._stream_input, rate=self.sensor_settings.rate))
+        if self._shared_memory_name is not None:
+            sinks.append(SampleRingSink(self._shared_memory_name, rate=self.sensor_settings.rate))
+        return sinks
+
+    def _report_gap(self, gap: SampleGap, saving: bool) -> None:
+        logger.warning("Sample gap, %s: %d samples lost before %.3f",
+                       gap.device_label, gap.n_lost, gap.time)
+        if saving and self._file_writer_queue is not None:
+            self._file_writer_queue.put(gap.comment() + NEWLINE)
+        if self._gap_events is not None:
+            self._gap_events.put(gap)
+
+    @profiled
     def run(self):
+        init_logging()  # not inherited with the spawn start method
         sensor = Sensor(self.sensor_settings,
-                        daq_type=self._daq_type,
-                        history_size=SensorProcess.DETERMINE_BIAS_SAMPLES)
-
-        stream_forces = self.recording_settings.array_write_forces()
-        stream_trigger = self.recording_settings.array_write_trigger()
-
-        ## create init LSL
-        lsl_data_steam = None
-        lsl_hardware_trigger_stream = None
-        if self.recording_settings.lsl_stream:
-            lsl_data_steam = lsl.init_stream(
-                name=f"Force_{sensor.device_label}",
-                content_type="force",
-                n_channels=sum(stream_forces),
-                stream_id=f"RF_{sensor.device_label}",
-                freq=self.sensor_settings.rate,
-                channel_format=lsl.cf_double64,
-                metadata={"sensor_label": self.sensor_settings.device_label},
-            )
-
-            n_hardware_trigger = sum(stream_trigger)
-            if n_hardware_trigger > 0:
-                lsl_hardware_trigger_stream = lsl.init_stream(
-                    name=f"Trigger_{sensor.device_label}",
-                    content_type="Marker",
-                    n_channels=n_hardware_trigger,
-                    stream_id=f"Tr_{sensor.device_label}",
-                    channel_format=lsl.cf_double64,
-                    freq=self.sensor_settings.rate,
-                )
+                        daq_backend=self.recording_settings.daq_backend,
+                        history_size=SensorProcess.DETERMINE_BIAS_SAMPLES,
+                        stats=self.stats)
+
+        if self._event_ring is not None:
+            events = self._event_ring.reader()
+        else:
+            events = None
+        pipeline = self._pipeline
+        pipeline.open()
+        monitor = self._monitor
+        hardware_timestamps = sensor.capabilities.hardware_timestamps
 
         sensor.daq.start_data_acquisition()
+        monitor.start(local_clock())
         logger.info(
             "Sensor start, %s, pid %s",
             sensor.device_label,
@@ -173,50 +272,64 @@ class SensorProcess(Process):
         # FIXME  check logging and console output
 
         # polling loop
-        self.pause_saving()
-        self._flag_quit_request.clear()
+        self._control.clear(SensorProcess.SAVING | SensorProcess.BIAS_REQUEST)
         self.flag_sensor_bias_is_determined.clear()
         init_samples = SensorProcess.INIT_SAMPLES
-
-        while not self._flag_quit_request.is_set():
-
-            data = sensor.poll_data()
-            for d in data:
-                if self.event_trigger.is_set():
-                    self.event_trigger.clear()
-                    d.trigger[0] = 1 # FIXME LSL marker stream
-
-                if init_samples > 0:
-                    # initial samples that are used and merely used bias determination, do not write to LSL or file writer queue
-                    init_samples -= 1
-                    if init_samples <= 0:
-                        sensor.determine_bias()
-                    continue
-
-                ## LSL
-                if lsl_data_steam is not None:
-                    lsl_data_steam.push_sample(d.forces[stream_forces])
-                if lsl_hardware_trigger_stream is not None:
-                    tr = d.trigger[stream_trigger]
-                    if any(tr):  # only stream if at least one trigger is active
-                        lsl_hardware_trigger_stream.push_sample(tr)
-
-                # write to shared memory and file writer queue
-                with self._total_sample_cnt.get_lock():
-                    self._total_sample_cnt.value += 1 # type: ignore
-                with self._dat.get_lock():
-                    self._dat[:] = d.forces
-
-                if self.is_saving() and self._file_writer_queue is not None:
-                    self._file_writer_queue.put(d)
-
-                if not self.flag_sensor_bias_is_determined.is_set():
-                    # new baseline requested
+        control = self._control.value
+        acknowledged = 0  # pause request acknowledged by the loop
+
+        while not control & SensorProcess.QUIT:
+
+            block = sensor.poll_block()
+            # the pause request is read before the control word, thus the
+            # SAVING flag is cleared, if the request is new
+            pause_request = self._pause_request.value
+            control = self._control.value
+            n = len(block)
+            if n == 0:
+                continue
+            n_lost, idx = monitor.update(n, sensor.last_read_complete, local_clock(),
+                                         block.times if hardware_timestamps else None)
+            if n_lost > 0:
+                self._report_gap(SampleGap(device_label=sensor.device_label,
+                                           sensor_id=sensor.sensor_id,
+                                           time=float(block.times[idx]),
+                                           n_lost=n_lost),
+                                 saving=bool(control & SensorProcess.SAVING))
+            if events is not None:
+                idx, codes = events.assign(block.times)
+                block.trigger[idx, 0] = codes
+
+            if init_samples > 0:
+                # initial samples are merely used for bias determination, do
+                # not write to LSL or file writer queue
+                init_samples -= n
+                if init_samples <= 0:
                     sensor.determine_bias()
                     self.flag_sensor_bias_is_determined.set()
+                if pause_request > acknowledged:
+                    self._acknowledge_pause(pause_request)
+                    acknowledged = pause_request
+                continue
+
+            pipeline.write(block, saving=bool(control & SensorProcess.SAVING))
+            if pause_request > acknowledged and not control & SensorProcess.SAVING:
+                # after the last block of the saving period
+                self._acknowledge_pause(pause_request)
+                acknowledged = pause_request
+            with self._total_sample_cnt.get_lock():
+                self._total_sample_cnt.value += n  # type: ignore
+
+            if control & SensorProcess.BIAS_REQUEST:
+                # new baseline requested
+                sensor.determine_bias()
+                self._control.clear(SensorProcess.BIAS_REQUEST)
+                self.flag_sensor_bias_is_determined.set()
 
         # stop process
-        self.pause_saving()
+        self._control.clear(SensorProcess.SAVING)
+        pipeline.close()
+        self._acknowledge_pause(self._pause_request.value)
         sensor.daq.stop_data_acquisition()
         logger.info("Sensor quit, %s", sensor.device_label)
 
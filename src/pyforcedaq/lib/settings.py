@@ -7,7 +7,7 @@ from typing import Any
 import tomlkit
 from tomlkit.exceptions import NonExistentKey
 
-from ..constants import SETTINGS_FILE_EXTENSION
+from ..constants import DEFAULT_DAQ_BACKEND, SETTINGS_FILE_EXTENSION
 
 
 @dataclass(frozen=True)
@@ -63,8 +63,22 @@ class RecordingSettings(ABCSettings):
 
     calibration_folder: str = "./calibration"
     data_folder: str = "./data"
+    daq_backend: str = DEFAULT_DAQ_BACKEND
 
     lsl_stream: bool = True
+    # local streaming server: "unix:<path>" or "tcp:<host>:<port>", "" = off
+    stream_server: str = ""
+    # full client buffer: "drop_oldest" or "drop_after_timeout" (the buffer
+    # grows and is cut to stream_buffer_frames after stream_drop_timeout
+    # seconds), see lib.stream_server
+    stream_policy: str = "drop_oldest"
+    stream_buffer_frames: int = 1000
+    stream_drop_timeout: float = 0.5
+    # remote PCs can subscribe to the binary UDP force stream (see
+    # lib.force_stream)
+    udp_force_stream: bool = False
+    # live data of each sensor in named shared memory (see pyforcedaq.client)
+    shared_memory: bool = False
     save_data: bool = False
     sampling_rate: int = 1000
 
@@ -79,6 +93,51 @@ class RecordingSettings(ABCSettings):
 
     convert_to_forces: bool = True
     zip_data: bool = False
+    # file writer: blocks in memory before spilling to disk, warning if
+    # the writer lags more than writer_lag_warning seconds
+    writer_queue_size: int = 10000
+    writer_lag_warning: float = 5.0
+    # output buffer of the file writer: written to disk if full, every
+    # writer_flush_interval seconds and when saving is paused (optionally
+    # with fsync)
+    writer_buffer_size: int = 1048576
+    writer_flush_interval: float = 1.0
+    writer_flush_on_pause: bool = True
+    writer_fsync: bool = False
+    # split the data file into segments of segment_size MB (uncompressed)
+    # or segment_duration seconds, 0 = no limit (see tools.segments)
+    segment_size: float = 0
+    segment_duration: float = 0
+    # one file writer process and data file per sensor, tied together by a
+    # sensor manifest (see tools.sensor_files), for many sensors
+    writer_per_sensor: bool = False
+    # samples between the entries of the time index of the data files
+    # (see tools.time_index), e.g. 10000, 0 = no index
+    index_interval: int = 0
+    # bin widths (s) of the min/mean/max pyramid of the data files
+    # (see tools.pyramid), e.g. [0.01, 0.1, 1.0], [] = no pyramid
+    pyramid_bins: list[float] = field(default_factory=list)
+    # online filters of the forces for the data file, the LSL stream and the
+    # display, e.g. "notch:50,lowpass:20:4" (see tools.filters.make_filter),
+    # "" = raw data
+    filter_file: str = ""
+    filter_lsl: str = ""
+    filter_display: str = ""
+    # output rates (Hz) of the data file, the LSL stream, the display and the
+    # UDP force stream, integer divisors of the sampling rate, 0 = sampling
+    # rate (see lib.decimation)
+    rate_file: int = 0
+    rate_lsl: int = 0
+    rate_display: int = 0
+    rate_udp: int = 0
+    # seconds between the latency stats in the log (see
+    # DataRecorder.stats), 0 = off
+    stats_log_interval: float = 60.0
+    # profiling of the processes: "cprofile", "sampling" or "" = off, the
+    # profiles are written to a subfolder of profile_folder (see
+    # tools.profiling)
+    profile: str = ""
+    profile_folder: str = "./profiles"
 
     priority: str | None = "normal"
 
@@ -118,6 +177,13 @@ class RecordingSettings(ABCSettings):
         else:
             return Path(working_dir).absolute() / fld
 
+    def absolute_path_profiles(self, working_dir: str | Path) -> Path:
+        fld = Path(self.profile_folder)
+        if fld.is_absolute():
+            return fld
+        else:
+            return Path(working_dir).absolute() / fld
+
 
     def array_write_forces(self):
         return [
@@ -129,6 +195,13 @@ class RecordingSettings(ABCSettings):
             self.write_Tz,
         ]
 
+    def output_rate(self, sink: str) -> int:
+        """output rate of a sink ("file", "lsl", "display" or "udp")"""
+        rate = getattr(self, f"rate_{sink}")
+        if rate <= 0:
+            return self.sampling_rate
+        return rate
+
     def array_write_trigger(self):
         return [self.write_trigger1, self.write_trigger2]
 
@@ -0,0 +1,305 @@
+"""Outputs of the sensor process (sinks)
+
+A sink receives the blocks of one sensor (e.g. LSL stream, file writer
+queue, display values). Each sink declares at setup its output rate, channel
+mask, batch size and online filter. SinkPipeline decimates each block once
+per distinct output rate (see lib.decimation), applies the filters and
+passes the blocks to the sinks. Sinks that are not used are not created and
+thus do not cost anything.
+
+Sinks are created in the parent process and opened in the sensor process
+(Sink.open), thus process-local resources (sockets, LSL outlets) have to be
+created in open.
+
+To add an output, derive from Sink and pass the sink to the SensorProcess
+(parameter sinks).
+"""
+
+__author__ = "Oliver Lindemann"
+
+from abc import ABC, abstractmethod
+from multiprocessing import Array, Queue
+from time import perf_counter
+
+import numpy as np
+from numpy.typing import NDArray
+
+from ..tools import lsl
+from ..tools.filters import BlockFilter, make_filter
+from ..tools.stats import LatencyHistogram, StageStats
+from .decimation import Decimator
+from .force_stream import ForceStreamSender, ForceStreamSubscribers
+from .sample_ring import SampleRingWriter
+from .stream_server import StreamInput
+from .types import ChannelMask, ForceSensorBlock
+
+
+class Sink(ABC):
+    """Output of the sensor process
+
+    rate: output rate (has to be an integer divisor of the sampling rate)
+    mask: channels of the sink (the sink selects the channels with the
+        precompiled indices, e.g. block.forces[:, mask.forces])
+    batch_size: minimum number of samples per write, smaller blocks are
+        collected
+    filter_spec: online filter of the forces (see tools.filters.make_filter)
+    only_while_saving: the sink receives blocks only while saving
+    """
+
+    name = "sink"  # name of the stage in the latency stats
+
+    def __init__(self, rate: int, mask: ChannelMask | None = None, batch_size: int = 1,
+                 filter_spec: str = "", only_while_saving: bool = False):
+        self.rate = rate
+        self.mask = mask if mask is not None else ChannelMask.all()
+        self.batch_size = batch_size
+        self.filter_spec = filter_spec
+        self.only_while_saving = only_while_saving
+
+    def open(self) -> None:
+        """called in the sensor process before the first block"""
+
+    @abstractmethod
+    def write(self, block: ForceSensorBlock) -> None:
+        """receives a block (at least one sample)"""
+
+    def close(self) -> None:
+        """called in the sensor process after the last block"""
+
+
+class LSLSink(Sink):
+    """LSL streams of the forces and of the samples with active hardware
+    trigger"""
+
+    name = "lsl"
+
+    def __init__(self, device_label: str, rate: int, mask: ChannelMask,
+                 batch_size: int = 1, filter_spec: str = ""):
+        super().__init__(rate, mask, batch_size, filter_spec)
+        self.device_label = device_label
+        self._forces = None
+        self._trigger = None
+
+    def open(self) -> None:
+        self._forces = lsl.init_stream(
+            name=f"Force_{self.device_label}",
+            content_type="force",
+            n_channels=len(self.mask.forces),
+            stream_id=f"RF_{self.device_label}",
+            freq=self.rate,
+            channel_format=lsl.cf_double64,
+            metadata={"sensor_label": self.device_label},
+        )
+        if len(self.mask.trigger) > 0:
+            self._trigger = lsl.init_stream(
+                name=f"Trigger_{self.device_label}",
+                content_type="Marker",
+                n_channels=len(self.mask.trigger),
+                stream_id=f"Tr_{self.device_label}",
+                channel_format=lsl.cf_double64,
+                freq=self.rate,
+            )
+
+    def write(self, block: ForceSensorBlock) -> None:
+        self._forces.push_chunk(block.forces[:, self.mask.forces])  # type: ignore
+        if self._trigger is not None:
+            tr = block.trigger[:, self.mask.trigger]
+            tr = tr[np.any(tr != 0, axis=1)]  # only samples with active trigger
+            if len(tr) > 0:
+                self._trigger.push_chunk(tr)
+
+
+class QueueSink(Sink):
+    """puts the blocks with the channels of the mask into a queue (e.g. of
+    the file writer) while saving"""
+
+    name = "file"
+
+    def __init__(self, queue: Queue, rate: int, mask: ChannelMask | None = None,
+                 filter_spec: str = ""):
+        super().__init__(rate, mask, filter_spec=filter_spec, only_while_saving=True)
+        self.queue = queue
+
+    def write(self, block: ForceSensorBlock) -> None:
+        self.queue.put(self.mask.apply(block))
+
+
+class ValuesSink(Sink):
+    """last sample of the forces in a shared array (display values)"""
+
+    name = "display"
+
+    def __init__(self, values: Array, rate: int, filter_spec: str = ""):  # type: ignore
+        super().__init__(rate, filter_spec=filter_spec)
+        self.values = values
+        self._np_values = None
+
+    def open(self) -> None:
+        self._np_values = np.frombuffer(self.values.get_obj(), dtype=np.float64)  # type: ignore
+
+    def write(self, block: ForceSensorBlock) -> None:
+        with self.values.get_lock():  # type: ignore
+            self._np_values[:] = block.forces[-1]  # type: ignore
+
+
+class ForceStreamSink(Sink):
+    """binary UDP force stream (see lib.force_stream)"""
+
+    name = "udp"
+
+    def __init__(self, subscribers: ForceStreamSubscribers, sensor_id: int, rate: int):
+        super().__init__(rate)
+        self.subscribers = subscribers
+        self.sensor_id = sensor_id
+        self._sender = None
+
+    def open(self) -> None:
+        self._sender = ForceStreamSender(self.subscribers, self.sensor_id)
+
+    def write(self, block: ForceSensorBlock) -> None:
+        self._sender.send(block)  # type: ignore
+
+    def close(self) -> None:
+        if self._sender is not None:
+            self._sender.close()
+
+
+class StreamServerSink(Sink):
+    """local streaming server (see lib.stream_server)"""
+
+    name = "stream_server"
+
+    def __init__(self, stream_input: StreamInput, rate: int):
+        super().__init__(rate)
+        self.stream_input = stream_input
+
+    def write(self, block: ForceSensorBlock) -> None:
+        self.stream_input.put(block)
+
+
+class SampleRingSink(Sink):
+    """sample ring in shared memory (see lib.sample_ring)"""
+
+    name = "shared_memory"
+
+    def __init__(self, shared_memory_name: str, rate: int):
+        super().__init__(rate)
+        self.shared_memory_name = shared_memory_name
+        self._ring = None
+
+    def open(self) -> None:
+        self._ring = SampleRingWriter(self.shared_memory_name)
+
+    def write(self, block: ForceSensorBlock) -> None:
+        self._ring.write(block)  # type: ignore
+
+    def close(self) -> None:
+        if self._ring is not None:
+            self._ring.close()
+
+
+class _Target:
+    """a sink with its filter and collected blocks (batch)"""
+    __slots__ = ("batch", "filter", "n_batch", "sink", "stats")
+
+    def __init__(self, sink: Sink, filt: BlockFilter | None, stats: LatencyHistogram | None):
+        self.sink = sink
+        self.filter = filt
+        self.stats = stats
+        self.batch: list[ForceSensorBlock] = []
+        self.n_batch = 0
+
+    def flush(self) -> None:
+        if self.n_batch > 0:
+            block = ForceSensorBlock(
+                times=np.concatenate([b.times for b in self.batch]),
+                forces=np.concatenate([b.forces for b in self.batch]),
+                trigger=np.concatenate([b.trigger for b in self.batch]),
+                sensor_id=self.batch[0].sensor_id)
+            self.batch = []
+            self.n_batch = 0
+            self.sink.write(block)
+
+
+class SinkPipeline:
+    """Passes the blocks of a sensor to the sinks (used in the sensor process)"""
+
+    def __init__(self, sinks: list[Sink], rate: int, stats: StageStats | None = None):
+        """rate: sampling rate
+        stats: durations of the decimation and of each sink (filter and
+            write, stage "sink_<name>") are added to the histograms of stats
+
+        Raises ValueError, if the rate of a sink is not an integer divisor
+        of the sampling rate or a filter specification is invalid.
+        """
+        self.sinks = sinks
+        self._decimators = {r: Decimator(rate, r) for r in {s.rate for s in sinks}}
+        if stats is not None and any(d.factor > 1 for d in self._decimators.values()):
+            self._decimation_stats = stats.add_stage("decimation")
+        else:
+            self._decimation_stats = None
+        # dispatch tables per output rate: all sinks and sinks only while saving
+        self._targets: dict[int, list[_Target]] = {r: [] for r in self._decimators}
+        self._saving_targets: dict[int, list[_Target]] = {r: [] for r in self._decimators}
+        for s in sinks:
+            hist = stats.add_stage(f"sink_{s.name}") if stats is not None else None
+            target = _Target(s, make_filter(s.filter_spec, s.rate), hist)
+            if s.only_while_saving:
+                self._saving_targets[s.rate].append(target)
+            else:
+                self._targets[s.rate].append(target)
+
+    def open(self) -> None:
+        for s in self.sinks:
+            s.open()
+
+    def write(self, block: ForceSensorBlock, saving: bool) -> None:
+        for rate, decimator in self._decimators.items():
+            if self._decimation_stats is not None and decimator.factor > 1:
+                t = perf_counter()
+                out = decimator.process(block)
+                self._decimation_stats.add(perf_counter() - t)
+            else:
+                out = decimator.process(block)
+            if len(out.times) == 0:
+                continue
+            for target in self._targets[rate]:
+                SinkPipeline._dispatch(target, out, True)
+            for target in self._saving_targets[rate]:
+                SinkPipeline._dispatch(target, out, saving)
+
+    @staticmethod
+    def _dispatch(target: _Target, block: ForceSensorBlock, write: bool) -> None:
+        t = perf_counter()
+        if target.filter is not None:
+            # the filter runs continuously, thus its state is valid when
+            # the sink starts writing
+            block = ForceSensorBlock(times=block.times,
+                                     forces=target.filter.process(block.forces),
+                                     trigger=block.trigger,
+                                     sensor_id=block.sensor_id)
+        if not write:
+            if target.n_batch > 0:
+                target.flush()  # saving stopped
+            return
+        if target.sink.batch_size <= 1:
+            target.sink.write(block)
+        else:
+            target.batch.append(block)
+            target.n_batch += len(block.times)
+            if target.n_batch >= target.sink.batch_size:
+                target.flush()
+        if target.stats is not None:
+            target.stats.add(perf_counter() - t)
+
+    def flush(self) -> None:
+        """writes the collected blocks"""
+        for targets in (self._targets, self._saving_targets):
+            for lst in targets.values():
+                for target in lst:
+                    target.flush()
+
+    def close(self) -> None:
+        self.flush()
+        for s in self.sinks:
+            s.close()
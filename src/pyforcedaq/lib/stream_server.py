@@ -0,0 +1,534 @@
+"""Local streaming server for sample blocks
+
+StreamServerProcess serves the sample blocks of all sensors as binary frames
+via a Unix domain socket or a loopback TCP socket to any number of local
+clients. Clients only connect and read; see StreamClient.
+
+Address: "unix:<path>" or "tcp:<host>:<port>" (e.g. "tcp:127.0.0.1:5006")
+
+Frame layout (little endian):
+
+    header   2s  magic b"FS"
+             B   protocol version
+             B   sensor_id
+             I   number of samples (n)
+             Q   frame number (per sensor, counts also frames dropped
+                 for the client)
+    samples  n x (d   time (local_clock),
+                  6d  Fx, Fy, Fz, Tx, Ty, Tz,
+                  2d  trigger1, trigger2)
+
+Each sensor process passes its blocks through its own StreamInput (a socket
+pair) without blocking: blocks that do not fit into the socket buffer are
+dropped for all clients and counted (StreamServerProcess.dropped_input_blocks).
+
+Each client has a bounded buffer of frames. If the buffer of a client is
+full, the policy of the server decides:
+
+    drop_oldest         the oldest frame of the client is dropped (the
+                        client sees the gap in the frame numbers)
+    drop_after_timeout  no frames are dropped for a client that is slow
+                        for a short time: its buffer grows beyond the limit.
+                        If the buffer of the client stays full for longer
+                        than drop_timeout, the oldest frames are dropped
+                        down to the limit (counted in dropped_frames, the
+                        client sees the gap).
+"""
+
+__author__ = "Oliver Lindemann"
+
+import atexit
+import ctypes as ct
+import logging
+import pickle
+import selectors
+import socket
+import struct
+from collections import deque
+from multiprocessing import Array, Event, Process, RawValue
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .. import init_logging
+from ..tools.clock import local_clock
+from ..tools.profiling import ProcessProfiler, profiled
+from .types import ForceSensorBlock
+
+logger = logging.getLogger()
+
+MAGIC = b"FS"
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBIQ")
+_LENGTH = struct.Struct("<I")  # length of the blocks of the inputs
+SAMPLE_DTYPE = np.dtype([("time", "<f8"), ("forces", "<f8", (6,)),
+                         ("trigger", "<f8", (2,))])
+
+DROP_OLDEST = "drop_oldest"
+DROP_AFTER_TIMEOUT = "drop_after_timeout"
+POLICIES = (DROP_OLDEST, DROP_AFTER_TIMEOUT)
+
+
+def parse_address(address: str) -> tuple[int, str | tuple[str, int]]:
+    """returns socket family and socket address of "unix:<path>" or
+    "tcp:<host>:<port>"
+
+    Raises ValueError for invalid addresses.
+    """
+    kind, _, addr = address.partition(":")
+    if kind == "unix" and len(addr) > 0:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix domain sockets are not supported on this platform")
+        return socket.AF_UNIX, addr
+    if kind == "tcp":
+        host, _, port = addr.rpartition(":")
+        try:
+            return socket.AF_INET, (host or "127.0.0.1", int(port))
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid stream server address: {address}. "
+                     "Use unix:<path> or tcp:<host>:<port>")
+
+
+def pack_frame(block: ForceSensorBlock, frame_number: int) -> bytes:
+    samples = np.empty(len(block), dtype=SAMPLE_DTYPE)
+    samples["time"] = block.times
+    samples["forces"] = block.forces
+    samples["trigger"] = block.trigger
+    return FRAME_HEADER.pack(MAGIC, PROTOCOL_VERSION, block.sensor_id,
+                             len(block), frame_number) + samples.tobytes()
+
+
+class StreamInput:
+    """Input of the stream server for one sensor process
+
+    Blocks are sent (pickled, with length prefix) through a non-blocking
+    socket pair, thus put never blocks the sensor process. Blocks are only
+    passed to the server, if clients are connected.
+    """
+
+    BUFFER_SIZE = 2 ** 20  # bytes, socket buffers
+
+    def __init__(self, n_clients):
+        self._reader, self._writer = socket.socketpair()
+        for sock, opt in ((self._reader, socket.SO_RCVBUF), (self._writer, socket.SO_SNDBUF)):
+            sock.setsockopt(socket.SOL_SOCKET, opt, StreamInput.BUFFER_SIZE)
+            sock.setblocking(False)
+        self.n_clients = n_clients  # shared with the server
+        self.dropped_blocks = RawValue(ct.c_int64, 0)
+        self._tail = b""  # process local: unsent rest of the last block
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_tail"] = b""
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+
+    def put(self, block: ForceSensorBlock) -> bool:
+        """passes a block to the server without blocking. Returns False, if
+        the block was dropped, because the socket buffer is full."""
+        if len(self._tail) > 0 and not self._send(self._tail):
+            if self.n_clients.value > 0:
+                self.dropped_blocks.value += 1
+            return False
+        if self.n_clients.value == 0:
+            return True
+        data = pickle.dumps(block, protocol=pickle.HIGHEST_PROTOCOL)
+        if self._send(_LENGTH.pack(len(data)) + data):
+            return True
+        self.dropped_blocks.value += 1
+        return False
+
+    def _send(self, data: bytes) -> bool:
+        """sends data or a part of it (the rest is kept as tail). False, if
+        nothing was sent"""
+        try:
+            n = self._writer.send(data)
+        except (BlockingIOError, InterruptedError):
+            return False
+        self._tail = data[n:]
+        return True
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+
+class _InputReader:
+    """reads the blocks of a StreamInput in the server"""
+
+    def __init__(self, stream_input: StreamInput):
+        self.input = stream_input
+        self._buffer = bytearray()
+
+    def read(self) -> list[ForceSensorBlock] | None:
+        """returns the complete blocks, None if the input has been closed"""
+        closed = False
+        while True:
+            try:
+                data = self.input._reader.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                break
+            if len(data) == 0:
+                closed = True
+                break
+            self._buffer += data
+        blocks = []
+        pos = 0
+        while len(self._buffer) - pos >= _LENGTH.size:
+            n, = _LENGTH.unpack_from(self._buffer, pos)
+            end = pos + _LENGTH.size + n
+            if end > len(self._buffer):
+                break
+            blocks.append(pickle.loads(self._buffer[pos + _LENGTH.size:end]))
+            pos = end
+        del self._buffer[:pos]
+        return None if closed and len(blocks) == 0 else blocks
+
+
+class _ClientStats(ct.Structure):
+    _fields_ = [("connected", ct.c_bool),
+                ("queued_frames", ct.c_int64),
+                ("lag", ct.c_double),  # age of the oldest queued frame (s)
+                ("max_lag", ct.c_double),
+                ("sent_frames", ct.c_int64),
+                ("dropped_frames", ct.c_int64),
+                ("sent_bytes", ct.c_int64)]
+
+
+class _Client:
+
+    def __init__(self, sock: socket.socket, stats: _ClientStats, max_frames: int):
+        self.socket = sock
+        self.stats = stats
+        self.max_frames = max_frames
+        self.frames: deque[tuple[float, bytes]] = deque()  # (enqueue time, frame)
+        self._view: memoryview | None = None  # unsent rest of current frame
+        self.full_since: float | None = None
+        self.dropping = False  # full for longer than the drop timeout
+        stats.connected = True
+        stats.queued_frames = 0
+        stats.lag = 0
+        stats.max_lag = 0
+        stats.sent_frames = 0
+        stats.dropped_frames = 0
+        stats.sent_bytes = 0
+
+    @property
+    def is_full(self) -> bool:
+        return len(self.frames) >= self.max_frames
+
+    @property
+    def has_data(self) -> bool:
+        return self._view is not None or len(self.frames) > 0
+
+    def push(self, frame: bytes, t: float, drop_oldest: bool) -> None:
+        if drop_oldest and self.is_full:
+            self.frames.popleft()
+            self.stats.dropped_frames += 1
+        self.frames.append((t, frame))
+        self.stats.queued_frames = len(self.frames)
+
+    def drop_excess(self) -> None:
+        """drops the oldest frames down to max_frames"""
+        while len(self.frames) > self.max_frames:
+            self.frames.popleft()
+            self.stats.dropped_frames += 1
+        self.stats.queued_frames = len(self.frames)
+
+    def flush(self, t: float) -> None:
+        """sends as much as possible without blocking"""
+        while True:
+            if self._view is None:
+                if len(self.frames) == 0:
+                    break
+                _, frame = self.frames.popleft()
+                self._view = memoryview(frame)
+            try:
+                n = self.socket.send(self._view)
+            except (BlockingIOError, InterruptedError):
+                break
+            self.stats.sent_bytes += n
+            if n < len(self._view):
+                self._view = self._view[n:]
+            else:
+                self._view = None
+                self.stats.sent_frames += 1
+        self.update_lag(t)
+
+    def update_lag(self, t: float) -> None:
+        self.stats.queued_frames = len(self.frames)
+        if len(self.frames) > 0:
+            lag = t - self.frames[0][0]
+        else:
+            lag = 0
+        self.stats.lag = lag
+        self.stats.max_lag = max(self.stats.max_lag, lag)
+
+    def close(self) -> None:
+        self.stats.connected = False
+        self.socket.close()
+
+
+class StreamServerProcess(Process):
+    """Local streaming server for the sample blocks of all sensors
+
+    Each sensor process puts its blocks into one of the `inputs` (see
+    DataRecorder). Lag metrics of the clients are available via
+    client_stats().
+    """
+
+    MAX_CLIENTS = 16
+
+    def __init__(self, address: str, policy: str = DROP_OLDEST,
+                 max_frames: int = 1000, drop_timeout: float = 0.5,
+                 n_inputs: int = 1):
+        """
+        Parameters
+        ----------
+        address: str
+            "unix:<path>" or "tcp:<host>:<port>"
+        policy: str
+            "drop_oldest" or "drop_after_timeout", see module documentation
+        max_frames: int
+            size of the buffer of each client in frames (sample blocks)
+        drop_timeout: float
+            drop_after_timeout policy: time in seconds, after which the
+            oldest frames of a client with full buffer are dropped
+        n_inputs: int
+            number of inputs (one per sensor process)
+        """
+
+        parse_address(address)  # raises ValueError
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown stream policy: {policy}. Use one of {POLICIES}")
+
+        super().__init__()
+        self.address = address
+        self.policy = policy
+        self.max_frames = max_frames
+        self.drop_timeout = drop_timeout
+        self.n_clients = RawValue(ct.c_int32, 0)
+        self.inputs = [StreamInput(self.n_clients) for _ in range(n_inputs)]
+        self._wakeup = socket.socketpair()
+        self._stats = Array(_ClientStats, StreamServerProcess.MAX_CLIENTS, lock=False)
+        self.event_is_ready = Event()
+        self._event_quit_request = Event()
+        # set before start to profile the process (see tools.profiling)
+        self.profiler: ProcessProfiler | None = None
+        atexit.register(self.quit)
+
+    def quit(self):
+        self._event_quit_request.set()
+        if self.is_alive():
+            self._wakeup[1].send(b"\0")
+            self.join()
+
+    def client_stats(self) -> list[dict[str, float]]:
+        """lag metrics of all connected clients"""
+        return [{"queued_frames": s.queued_frames,
+                 "lag": s.lag,
+                 "max_lag": s.max_lag,
+                 "sent_frames": s.sent_frames,
+                 "dropped_frames": s.dropped_frames,
+                 "sent_bytes": s.sent_bytes}
+                for s in self._stats if s.connected]
+
+    @property
+    def dropped_input_blocks(self) -> int:
+        """blocks dropped by the sensor processes (full socket buffer)"""
+        return sum(x.dropped_blocks.value for x in self.inputs)
+
+    def _listen(self) -> socket.socket:
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            Path(addr).unlink(missing_ok=True)  # type: ignore
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(addr)
+        sock.listen()
+        sock.setblocking(False)
+        return sock
+
+    @profiled
+    def run(self):
+        init_logging()  # not inherited with the spawn start method
+        listener = self._listen()
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(self._wakeup[0], selectors.EVENT_READ)
+        readers = {x.fileno(): _InputReader(x) for x in self.inputs}
+        for fd in readers:
+            selector.register(fd, selectors.EVENT_READ)
+        clients: dict[socket.socket, _Client] = {}
+        frame_numbers: dict[int, int] = {}
+        drop_oldest = self.policy == DROP_OLDEST
+        self.event_is_ready.set()
+        logger.info("Stream server %s, pid %s", self.address, self.pid)
+
+        def disconnect(client: _Client):
+            logger.info("Stream client disconnected (sent: %d, dropped: %d, max lag: %.3f s)",
+                         client.stats.sent_frames, client.stats.dropped_frames,
+                         client.stats.max_lag)
+            selector.unregister(client.socket)
+            del clients[client.socket]
+            client.close()
+            self.n_clients.value = len(clients)
+
+        while not self._event_quit_request.is_set():
+            for key, mask in selector.select(timeout=0.5):
+                if key.fileobj is listener:
+                    self._accept(listener, selector, clients)
+                    self.n_clients.value = len(clients)
+
+                elif key.fileobj is self._wakeup[0]:
+                    self._wakeup[0].recv(64)
+
+                elif key.fileobj in readers:
+                    t = local_clock()
+                    blocks = readers[key.fileobj].read()  # type: ignore
+                    if blocks is None:
+                        selector.unregister(key.fileobj)
+                        continue
+                    for block in blocks:
+                        if len(block) == 0:
+                            continue
+                        n = frame_numbers.get(block.sensor_id, 0)
+                        frame_numbers[block.sensor_id] = n + 1
+                        frame = pack_frame(block, n)
+                        for c in clients.values():
+                            c.push(frame, t, drop_oldest)
+
+                else:
+                    client = clients.get(key.fileobj)  # type: ignore
+                    if client is None:
+                        continue
+                    if mask & selectors.EVENT_READ:
+                        try:
+                            data = client.socket.recv(4096)
+                        except (BlockingIOError, InterruptedError):
+                            data = None
+                        except OSError:
+                            data = b""
+                        if data == b"":  # closed by client
+                            disconnect(client)
+                            continue
+                    if mask & selectors.EVENT_WRITE:
+                        try:
+                            client.flush(local_clock())
+                        except OSError:
+                            disconnect(client)
+
+            # send and update selector registrations
+            t = local_clock()
+            for client in list(clients.values()):
+                try:
+                    client.flush(t)
+                except OSError:
+                    disconnect(client)
+                    continue
+                if client.has_data:
+                    events = selectors.EVENT_READ | selectors.EVENT_WRITE
+                else:
+                    events = selectors.EVENT_READ
+                selector.modify(client.socket, events)
+
+                if not drop_oldest and client.is_full:
+                    if client.full_since is None:
+                        client.full_since = t
+                    elif t - client.full_since > self.drop_timeout:
+                        if not client.dropping:
+                            logger.warning("Stream client buffer full for more than %s s, "
+                                           "dropping frames", self.drop_timeout)
+                            client.dropping = True
+                        client.drop_excess()
+                        client.update_lag(t)
+                else:
+                    client.full_since = None
+                    client.dropping = False
+
+        for client in list(clients.values()):
+            disconnect(client)
+        listener.close()
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            Path(addr).unlink(missing_ok=True)  # type: ignore
+        logger.info("Stream server quit")
+
+    def _accept(self, listener: socket.socket, selector: selectors.BaseSelector,
+                clients: dict[socket.socket, "_Client"]) -> None:
+        try:
+            sock, _ = listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        free = [s for s in self._stats if not s.connected]
+        if len(free) == 0:
+            logger.warning("Stream server: too many clients")
+            sock.close()
+            return
+        sock.setblocking(False)
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        clients[sock] = _Client(sock, free[0], self.max_frames)
+        selector.register(sock, selectors.EVENT_READ)
+        logger.info("Stream client connected")
+
+
+class StreamClient:
+    """Client of the local streaming server
+
+    Example::
+
+        client = StreamClient("tcp:127.0.0.1:5006")
+        while True:
+            block = client.receive()
+            print(block.sensor_id, block.times, block.forces)
+    """
+
+    def __init__(self, address: str, timeout: float | None = None):
+        family, addr = parse_address(address)
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(addr)
+        self._next_frame: dict[int, int] = {}
+        self.lost_frames: dict[int, int] = {}  # sensor_id -> n frames
+
+    def close(self) -> None:
+        self._socket.close()
+
+    def _recv_exactly(self, n: int) -> bytearray:
+        buffer = bytearray(n)
+        view = memoryview(buffer)
+        while len(view) > 0:
+            n_read = self._socket.recv_into(view)
+            if n_read == 0:
+                raise ConnectionError("Stream server closed the connection")
+            view = view[n_read:]
+        return buffer
+
+    def receive_samples(self) -> tuple[int, NDArray]:
+        """returns sensor_id and samples (structured array with the fields
+        "time", "forces" and "trigger") of the next frame"""
+        magic, version, sensor_id, n, frame_number = FRAME_HEADER.unpack(
+            self._recv_exactly(FRAME_HEADER.size))
+        if magic != MAGIC or version != PROTOCOL_VERSION:
+            raise ConnectionError("Invalid stream frame")
+        samples = np.frombuffer(self._recv_exactly(n * SAMPLE_DTYPE.itemsize),
+                                dtype=SAMPLE_DTYPE)
+        expected = self._next_frame.get(sensor_id, frame_number)
+        if frame_number != expected:
+            self.lost_frames[sensor_id] = self.lost_frames.get(sensor_id, 0) + \
+                frame_number - expected
+        self._next_frame[sensor_id] = frame_number + 1
+        return sensor_id, samples
+
+    def receive(self) -> ForceSensorBlock:
+        """returns the next sample block"""
+        sensor_id, samples = self.receive_samples()
+        return ForceSensorBlock(times=samples["time"], forces=samples["forces"],
+                                trigger=samples["trigger"], sensor_id=sensor_id)
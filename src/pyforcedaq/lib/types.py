@@ -1,12 +1,14 @@
 __author__ = "Oliver Lindemann"
 
 import ctypes as ct
+from dataclasses import dataclass
 
 import numpy as np
 from numpy.typing import NDArray
 
 from ..tools.clock import local_clock
 from ..tools.file_writer import AbstractCSVDataStruct
+from .settings import RecordingSettings
 
 # tag in data output
 TAG_COMMENTS = "#"
@@ -47,7 +49,8 @@ class ForceSensorData(TimedData, AbstractCSVDataStruct):
     """
     n_forces = 6
     n_triggers = 2
-    forces_names = ["Fx", "Fy", "Fz", "Tx", "Ty", "Tz"]
+    forces_names = ("Fx", "Fy", "Fz", "Tx", "Ty", "Tz")
+    trigger_names = ("trigger1", "trigger2")
 
     def __init__(
         self,
@@ -144,3 +147,72 @@ class ForceSensorData(TimedData, AbstractCSVDataStruct):
             return cls.forces_names.index(force_label)
         except ValueError:
             return None
+
+
+class ForceSensorBlock(TimedData, AbstractCSVDataStruct):
+    """A block of consecutive samples of one force sensor with the following properties
+    * sensor_id (int)
+    * times (array of n time stamps)
+    * forces (n x 6 array): Fx,  Fy, Fz, Tx, Ty, Tz
+    * trigger (n x 2 array): trigger1 & trigger2
+
+    The time of the block is the time stamp of the first sample.
+    """
+
+    def __init__(
+        self,
+        times: NDArray[np.float64],
+        forces: NDArray[np.float64],
+        trigger: NDArray[np.float64],
+        sensor_id: int = 0,
+    ):
+        if len(times) > 0:
+            super().__init__(float(times[0]))
+        else:
+            super().__init__(None)
+        self.sensor_id = sensor_id
+        self.times = times
+        self.forces = forces
+        self.trigger = trigger
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def samples(self) -> list[ForceSensorData]:
+        """the block as list of ForceSensorData objects"""
+        return [ForceSensorData(forces=f, trigger=tr, time=float(t), sensor_id=self.sensor_id)
+                for t, f, tr in zip(self.times, self.forces, self.trigger)]
+
+
+@dataclass(frozen=True)
+class ChannelMask:
+    """indices of the selected force and trigger channels"""
+
+    forces: NDArray[np.intp]
+    trigger: NDArray[np.intp]
+
+    @staticmethod
+    def from_settings(recording_settings: RecordingSettings) -> "ChannelMask":
+        """channels of the settings write_Fx, ..., write_trigger2"""
+        return ChannelMask(
+            forces=np.flatnonzero(recording_settings.array_write_forces()),
+            trigger=np.flatnonzero(recording_settings.array_write_trigger()))
+
+    @staticmethod
+    def all() -> "ChannelMask":
+        return ChannelMask(forces=np.arange(ForceSensorData.n_forces),
+                           trigger=np.arange(ForceSensorData.n_triggers))
+
+    def apply(self, block: ForceSensorBlock) -> ForceSensorBlock:
+        """block with the selected channels"""
+        return ForceSensorBlock(times=block.times, forces=block.forces[:, self.forces],
+                                trigger=block.trigger[:, self.trigger],
+                                sensor_id=block.sensor_id)
+
+    @property
+    def force_names(self) -> list[str]:
+        return [ForceSensorData.forces_names[i] for i in self.forces]
+
+    @property
+    def trigger_names(self) -> list[str]:
+        return [ForceSensorData.trigger_names[i] for i in self.trigger]
@@ -1,20 +1,41 @@
 """A lan connect class using udp
 
-currently not used in pyForceDAQ but might be useful for future extensions.
+UDPConnection is the client side; UDPConnectionProcess runs an event-driven
+UDP server for several connected peers (used for remote control and software
+triggers, see headless recording).
 """
 
 __author__ = "Oliver Lindemann <oliver@expyriment.org>"
-__version__ = "0.5"
+__version__ = "0.6"
 
 import atexit
+import ctypes as ct
 import logging
+import selectors
 import socket
-from multiprocessing import Event, Process, Queue
-
-from ..tools.clock import local_clock, wait_ms
+import struct
+import sys
+import time
+from multiprocessing import Event, Process, Queue, RawValue
+
+from .. import init_logging
+from ..tools.clock import local_clock
+from ..tools.event_ring import EventRing
 from ..tools.lan import get_lan_ip
+from ..tools.pipe_queue import PipeQueue
+from ..tools.profiling import ProcessProfiler, profiled
+from ..tools.stats import LatencyHistogram, StageStats
+from .force_stream import UNSUBSCRIBE, ForceStreamSubscribers, parse_subscribe_command
 from .types import TimedData
 
+logger = logging.getLogger()
+
+# kernel receive timestamps (Linux only, not defined in the socket module)
+if sys.platform.startswith("linux"):
+    SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+else:
+    SO_TIMESTAMPNS = None
+
 
 class UDPData(TimedData):
     """The UDP data class, used to store UDP DATA with timestamps"""
@@ -51,8 +72,6 @@ class UDPConnection(object):
     COMMAND_REPLY = COMMAND_CHAR + b"ok"
     PING = COMMAND_CHAR + b"ping"
 
-    MY_IP = get_lan_ip()
-
     def __init__(self, udp_port=5005):
         self.udp_port = udp_port
 
@@ -60,17 +79,17 @@ class UDPConnection(object):
             socket.AF_INET,  # Internet
             socket.SOCK_DGRAM,
         )  # UDP
-        self._socket.bind((UDPConnection.MY_IP, self.udp_port))
+        self._socket.bind((get_lan_ip(), self.udp_port))
         self._socket.setblocking(False)
         self.peer_ip = None
 
     @property
     def my_ip(self):
-        return UDPConnection.MY_IP
+        return get_lan_ip()
 
     def __str__(self):
         return "ip: {0} (port: {1}); peer: {2}".format(
-            UDPConnection.MY_IP, self.udp_port, self.peer_ip
+            get_lan_ip(), self.udp_port, self.peer_ip
         )
 
     def receive(self, timeout):
@@ -196,92 +215,278 @@ class UDPConnection(object):
         return rtn
 
 
+class UDPServer:
+    """Non-blocking UDP server socket that serves several connected peers
+
+    Peers connect and unconnect with UDPConnection.CONNECT and
+    UDPConnection.UNCONNECT and are identified by their address (ip, port).
+
+    On Linux, the kernel receive time of each datagram (SO_TIMESTAMPNS) is
+    used as timestamp, so that scheduler latencies of the receiving process
+    do not affect the timing. The delay between kernel and user-space
+    receive is counted in the histogram receive_latency.
+
+    If a ForceStreamSubscribers table is given, the server handles also the
+    subscribe and unsubscribe commands of the binary force stream (see
+    force_stream). Subscribers do not need to be connected.
+    """
+
+    MAX_DATAGRAM_SIZE = 65535
+    RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024  # bytes, buffers bursts of datagrams
+    KERNEL_TIMESTAMPS = SO_TIMESTAMPNS is not None
+    _TIMESPEC = struct.Struct("@qq")
+
+    def __init__(self, ip: str | None = None, udp_port: int = 5005,
+                 receive_latency: LatencyHistogram | None = None,
+                 force_stream: ForceStreamSubscribers | None = None):
+        if ip is None:
+            ip = get_lan_ip()
+        self.udp_port = udp_port
+        self.receive_latency = receive_latency
+        self.force_stream = force_stream
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                UDPServer.RECEIVE_BUFFER_SIZE)
+        if UDPServer.KERNEL_TIMESTAMPS:
+            self._socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            self._anc_buffer_size = socket.CMSG_SPACE(UDPServer._TIMESPEC.size)
+        self._socket.bind((ip, udp_port))
+        self._socket.setblocking(False)
+        self.peers: set[tuple[str, int]] = set()
+
+    def fileno(self) -> int:
+        return self._socket.fileno()
+
+    def close(self):
+        self._socket.close()
+
+    @property
+    def is_connected(self) -> bool:
+        return len(self.peers) > 0
+
+    def receive_all(self) -> list[tuple[bytes, tuple[str, int], float]]:
+        """receives all pending datagrams and returns a list of
+        (data, sender, receive time)"""
+
+        if UDPServer.KERNEL_TIMESTAMPS:
+            return self._receive_all_timestamped()
+
+        rtn = []
+        while True:
+            try:
+                data, sender = self._socket.recvfrom(UDPServer.MAX_DATAGRAM_SIZE)
+            except (BlockingIOError, InterruptedError):
+                return rtn
+            rtn.append((data, sender, local_clock()))
+
+    def _receive_all_timestamped(self) -> list[tuple[bytes, tuple[str, int], float]]:
+        rtn = []
+        clock_offset = None
+        while True:
+            try:
+                data, ancdata, _, sender = self._socket.recvmsg(
+                    UDPServer.MAX_DATAGRAM_SIZE, self._anc_buffer_size)
+            except (BlockingIOError, InterruptedError):
+                return rtn
+            t_user = local_clock()
+
+            t = t_user
+            for level, msg_type, msg_data in ancdata:
+                if level == socket.SOL_SOCKET and msg_type == SO_TIMESTAMPNS:
+                    if clock_offset is None:
+                        clock_offset = _realtime_offset()
+                    sec, nsec = UDPServer._TIMESPEC.unpack(msg_data[:UDPServer._TIMESPEC.size])
+                    t = sec + nsec * 1e-9 - clock_offset  # kernel time in local_clock domain
+                    if self.receive_latency is not None:
+                        self.receive_latency.add(t_user - t)
+            rtn.append((data, sender, t))
+
+    def process(self, data: bytes, sender: tuple[str, int]) -> bool:
+        """processes connection commands and returns True if the data are
+        from a connected peer and should be handled, otherwise False"""
+
+        if data == UDPConnection.CONNECT:
+            self.peers.add(sender)
+            self.send_to(UDPConnection.COMMAND_REPLY, sender)
+        elif self.force_stream is not None and self._process_subscription(data, sender):
+            return False
+        elif sender not in self.peers:
+            return False  # ignore data
+        elif data == UDPConnection.PING:
+            self.send_to(UDPConnection.COMMAND_REPLY, sender)
+        elif data == UDPConnection.UNCONNECT:
+            self.peers.discard(sender)
+        return True
+
+    def _process_subscription(self, data: bytes, sender: tuple[str, int]) -> bool:
+        """returns True if data was a subscription command"""
+        if data == UNSUBSCRIBE:
+            self.force_stream.remove(sender)  # type: ignore
+            self.send_to(UDPConnection.COMMAND_REPLY, sender)
+            return True
+        decimation = parse_subscribe_command(data)
+        if decimation is None:
+            return False
+        if self.force_stream.add(sender, decimation):  # type: ignore
+            self.send_to(UDPConnection.COMMAND_REPLY, sender)
+        else:
+            logger.warning("Force stream: too many subscribers, %s rejected", sender)
+        return True
+
+    def send_to(self, data: bytes | str, address: tuple[str, int]) -> bool:
+        if isinstance(data, str):
+            data = data.encode()  # force to byte
+        try:
+            self._socket.sendto(data, address)
+            return True
+        except OSError:
+            return False
+
+    def send(self, data: bytes | str) -> None:
+        """send data to all connected peers"""
+        for peer in tuple(self.peers):
+            self.send_to(data, peer)
+
+    def unconnect_peers(self):
+        self.send(UDPConnection.UNCONNECT)
+        self.peers.clear()
+
+
 class UDPConnectionProcess(Process):
-    """UDPConnectionProcess polls and writes to a data queue.
+    """UDPConnectionProcess receives UDP data from several peers and writes them
+    to a data queue.
+
+    The process sleeps in the kernel until datagrams or data to send arrive,
+    handles all pending datagrams at each wakeup and sends the data of the
+    send queue to all connected peers.
 
     Example::
 
-        # Server that prints each input and echos it to the client
-        # that is currently connected
+        # Server that prints each input and echos it to all connected clients
 
-        from pyforcedaq.lib.udp_connection import UDPConnectionProcess, Queue
+        from pyforcedaq.lib.udp_connection import UDPConnectionProcess
 
-        receive_queue = Queue()
-        udp_p = UDPConnectionProcess(receive_queue=receive_queue)
+        udp_p = UDPConnectionProcess()
         udp_p.start()
-        udp_p.event_polling.set() # start polling
 
         while True:
-            data = receive_queue.get()
-            print(data)
-            if data is not None:
-                udp_p.send_queue.put(data.string)
+            data = udp_p.receive_queue.get()
+            print(data.unicode)
+            udp_p.send_queue.put(data.byte_string)
 
     Example::
 
         # connecting to a server
-    """  # DOC
+        udp_connection = UDPConnection()
+        udp_connection.connect_peer(server_ip)
+    """
+
+    SOFTWARE_TRIGGER_CODE = 1
 
-    def __init__(self, event_trigger=(), event_ignore_tag=None):
+    def __init__(self, event_ring: EventRing | None = None, event_ignore_tag=None,
+                 ip: str | None = None, udp_port: int = 5005,
+                 force_stream: ForceStreamSubscribers | None = None):
         """Initialize UDPConnectionProcess
 
         Parameters
         ----------
-        receive_queue: multiprocessing.Queue
-            the queue to which the received data should be put
+        event_ring: EventRing, optional
+            if UDP data are received that are not a command, a software
+            trigger is pushed to the event ring (typically
+            DataRecorder.event_ring). The event time is the receive time and
+            the code is the received integer or SOFTWARE_TRIGGER_CODE, if the
+            data are not an integer. Code 0 means "no event" in the trigger
+            column: data with code 0 are not pushed, but logged and counted
+            (n_rejected_events).
 
-        peer_ip : string
-            the IP of the peer to which the connection should be established
+        event_ignore_tag:
+            udp data that start with this tag will be ignored for event triggering
 
-        sync_clock : Timer
-            the internal clock for timestamps will synchronized with this clock
+        ip: str, optional
+            the IP to bind the server to (default: LAN IP)
 
-        event_trigger: multiprocessing.Event() (or list of..)
-            event trigger(s) to be set. If Udp event is received and it is not a
-            command to set this event (typical of sensor recording processes).
+        udp_port: int, optional
+            the UDP port (default: 5005)
 
-        event_ignore_tag:
-            udp data that start with this tag will be ignored for event triggering
+        force_stream: ForceStreamSubscribers, optional
+            subscriber table of the binary force stream of the sensor
+            processes (see DataRecorder.force_stream). If defined, remote
+            PCs can subscribe to the forces.
 
-        """  # DOC
+        """
 
         super(UDPConnectionProcess, self).__init__()
 
         self.receive_queue = Queue()
-        self.send_queue = Queue()
+        self.send_queue = PipeQueue()
         self.event_is_connected = Event()
         self._event_quit_request = Event()
         self._event_is_polling = Event()
         self._event_ignore_tag = event_ignore_tag
-
-        if isinstance(event_trigger, type(Event)):
-            event_trigger = event_trigger
-        try:
-            self._event_trigger = tuple(event_trigger)
-        except:
-            self._event_trigger = ()
+        self._ip = ip
+        self.udp_port = udp_port
+        self._force_stream = force_stream
+        # delay between kernel and user-space receive (only Linux)
+        self.receive_latency = LatencyHistogram("UDP receive latency")
+        # latency histograms: receive latency, handling of the received
+        # datagrams and sending per wakeup
+        self.stats = StageStats("UDP connection", ["handle", "send"])
+        self.stats.add_stage("receive_latency", self.receive_latency)
+
+        self._event_ring = event_ring
+        self.n_rejected_events = RawValue(ct.c_int64, 0)  # code 0
+        # set before start to profile the process (see tools.profiling)
+        self.profiler: ProcessProfiler | None = None
 
         atexit.register(self.quit)
 
     @property
     def my_ip(self):
-        return UDPConnection.MY_IP
+        if self._ip is None:
+            return get_lan_ip()
+        return self._ip
 
     def quit(self):
         self._event_quit_request.set()
         if self.is_alive():
+            self.send_queue.put(None)  # wake up process
             self.join()
 
     def pause(self):
         self._event_is_polling.clear()
+        self.send_queue.put(None)  # wake up process
 
     def start_polling(self):
         self._event_is_polling.set()
+        self.send_queue.put(None)  # wake up process
+
+    def _handle_datagrams(self, server: UDPServer) -> None:
+        for data, sender, t in server.receive_all():
+            if not server.process(data, sender):
+                continue
+            d = UDPData(string=data, time=t)
+            if self._event_ring is not None and self._event_ignore_tag is not None \
+                    and not d.startswith(self._event_ignore_tag):
+                code = _trigger_code(data)
+                if code is None:
+                    self.n_rejected_events.value += 1
+                    logger.warning("UDP trigger code 0 (no event) ignored: %r", data[:32])
+                else:
+                    self._event_ring.push(code=code, time=t)
+            self.receive_queue.put(d)
 
+    @profiled
     def run(self):
-        udp_connection = UDPConnection(udp_port=5005)
+        init_logging()  # not inherited with the spawn start method
+        server = UDPServer(ip=self._ip, udp_port=self.udp_port,
+                           receive_latency=self.receive_latency,
+                           force_stream=self._force_stream)
         self.start_polling()
 
+        selector = selectors.DefaultSelector()
+        selector.register(self.send_queue, selectors.EVENT_READ)
+        handle_stats = self.stats["handle"]
+        send_stats = self.stats["send"]
         prev_event_polling = None
 
         while not self._event_quit_request.is_set():
@@ -289,39 +494,53 @@ class UDPConnectionProcess(Process):
                 # event pooling changed
                 prev_event_polling = self._event_is_polling.is_set()
                 if prev_event_polling:
-                    logging.warning(f"UDP start, pid {self.pid}")
+                    selector.register(server, selectors.EVENT_READ)
+                    logger.warning(f"UDP start, pid {self.pid}")
+                else:
+                    selector.unregister(server)
+                    logger.warning("UDP stop")
+
+            for key, _ in selector.select():
+                t = time.perf_counter()
+                if key.fileobj is server:
+                    self._handle_datagrams(server)
+                    handle_stats.add(time.perf_counter() - t)
+                else:
+                    for data in self.send_queue.get_all():
+                        if data is not None:
+                            server.send(data)
+                    send_stats.add(time.perf_counter() - t)
+
+            # has connection changed?
+            if self.event_is_connected.is_set() != server.is_connected:
+                if server.is_connected:
+                    self.event_is_connected.set()
                 else:
-                    logging.warning("UDP stop")
-
-            if not self._event_is_polling.is_set():
-                self._event_is_polling.wait(timeout=0.1)
-            else:
-                data = udp_connection.poll()
-                t = local_clock()
-                if data is not None:
-                    d = UDPData(string=data, time=t)
-                    self.receive_queue.put(d)
-                    if self._event_ignore_tag is not None and not d.startswith(
-                        self._event_ignore_tag
-                    ):
-                        for ev in self._event_trigger:
-                            # set all connected software trigger
-                            ev.set()  ## FIXME LSL trigger
-                try:
-                    udp_connection.send(self.send_queue.get_nowait())
-                except:
-                    pass
-
-                # has connection changed?
-                if self.event_is_connected.is_set() != udp_connection.is_connected:
-                    if udp_connection.is_connected:
-                        self.event_is_connected.set()
-                    else:
-                        self.event_is_connected.clear()
-
-                if not udp_connection.is_connected:
-                    wait_ms(200)
-
-        udp_connection.unconnect_peer()
-
-        logging.warning("UDP quit")
+                    self.event_is_connected.clear()
+
+        server.unconnect_peers()
+        if self._force_stream is not None:
+            self._force_stream.clear()
+        server.close()
+
+        if self.receive_latency.n > 0:
+            logger.info("%s", self.receive_latency)
+        logger.warning("UDP quit")
+
+
+def _trigger_code(data: bytes) -> int | None:
+    """trigger code of UDP data, None for code 0 (no event)"""
+    try:
+        code = int(data)
+    except ValueError:
+        return UDPConnectionProcess.SOFTWARE_TRIGGER_CODE
+    return code if code != 0 else None
+
+
+def _realtime_offset() -> float:
+    """offset between the system real time (used for kernel timestamps) and
+    local_clock"""
+    t1 = local_clock()
+    realtime = time.time()
+    t2 = local_clock()
+    return realtime - (t1 + t2) / 2
@@ -2,10 +2,10 @@
 import logging
 from pathlib import Path
 
-import appdirs
-
 
 def set_logging(log_file):
+    import appdirs
+
     log_dir = Path(appdirs.AppDirs("").user_log_dir)
     log_dir.mkdir(parents=True, exist_ok=True)
     log_file = log_dir / log_file
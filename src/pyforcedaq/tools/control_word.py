@@ -0,0 +1,33 @@
+"""Control flags of a process in a single shared-memory word"""
+
+import ctypes as ct
+from multiprocessing import Lock, RawValue
+
+
+class ControlWord:
+    """Bit flags in a single shared-memory word
+
+    Reading the word is a plain memory access without lock or system call,
+    so that a polling loop can check all flags at once. Setting and clearing
+    bits is synchronized between processes.
+    """
+
+    def __init__(self, value: int = 0):
+        self._word = RawValue(ct.c_uint32, value)
+        self._lock = Lock()
+
+    @property
+    def value(self) -> int:
+        return self._word.value
+
+    def set(self, bits: int) -> None:
+        with self._lock:
+            self._word.value |= bits
+
+    def clear(self, bits: int) -> None:
+        with self._lock:
+            self._word.value &= ~bits
+
+    def is_set(self, bits: int) -> bool:
+        """True, if all bits are set"""
+        return self._word.value & bits == bits
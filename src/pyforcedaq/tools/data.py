@@ -43,6 +43,20 @@ class DataBuffer:
 
         self.buffer.append(values)
 
+    def extend(self, values: NDArray):
+        """Append multiple samples (2D array, samples x parameters) to the buffer."""
+        values = np.atleast_2d(values)
+        if len(values) == 0:
+            return
+        if self._n_para != values.shape[1]:
+            if self._n_para == -1:
+                self._n_para = values.shape[1]
+            else:
+                raise ValueError(f"DataBuffer: Number of parameters ({values.shape[1]}) does not match buffer size ({self._n_para})")
+        if self.buffer.maxlen is not None:
+            values = values[-self.buffer.maxlen:]
+        self.buffer.extend(values.copy())
+
     def get_last(self, n: int) -> NDArray[np.floating]:
         """Returns the last n data points in the buffer as a numpy array."""
         if n > len(self.buffer):
@@ -0,0 +1,122 @@
+"""Timestamped events in shared memory
+
+EventRing is a ring buffer of (time, code) records. Several processes push
+events and each consumer reads all events with its own EventRingReader, so
+that no event is coalesced with another one or consumed by another reader.
+"""
+
+import ctypes as ct
+from multiprocessing import Array, Lock, RawValue
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .clock import local_clock
+
+_EMPTY_TIMES = np.empty(0, dtype=np.float64)
+_EMPTY_INDICES = np.empty(0, dtype=np.intp)
+
+
+class EventRing:
+    """Ring buffer of timestamped events (time, code) in shared memory
+
+    Pushing is synchronized between the producers. Readers do not lock; they
+    only lose events if they fall behind by more than capacity events.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._times = Array(ct.c_double, capacity, lock=False)
+        self._codes = Array(ct.c_double, capacity, lock=False)
+        self._n_pushed = RawValue(ct.c_int64, 0)
+        self._lock = Lock()
+
+    @property
+    def n_pushed(self) -> int:
+        """total number of pushed events"""
+        return self._n_pushed.value
+
+    def push(self, code: float = 1, time: float | None = None) -> None:
+        """push an event, time is the local_clock time of the event (default: now)"""
+        if time is None:
+            time = local_clock()
+        with self._lock:
+            i = self._n_pushed.value % self.capacity
+            self._times[i] = time
+            self._codes[i] = code
+            self._n_pushed.value += 1  # publish record
+
+    def reader(self) -> "EventRingReader":
+        """returns a reader for all events pushed from now on"""
+        return EventRingReader(self)
+
+
+class EventRingReader:
+    """Reads the events of an EventRing with an own read cursor
+
+    Create the reader in the consuming process.
+    """
+
+    def __init__(self, ring: EventRing):
+        self._ring = ring
+        self._times = np.frombuffer(ring._times, dtype=np.float64)  # type: ignore
+        self._codes = np.frombuffer(ring._codes, dtype=np.float64)  # type: ignore
+        self._cursor = ring.n_pushed
+        self.n_lost = 0
+        # events that could not be assigned to a sample yet
+        self._pending_times = _EMPTY_TIMES
+        self._pending_codes = _EMPTY_TIMES
+
+    def read(self) -> tuple[NDArray[np.float64], NDArray[np.float64]]:
+        """returns times and codes of all new events (in push order)"""
+        n_pushed = self._ring.n_pushed
+        if n_pushed == self._cursor:
+            return _EMPTY_TIMES, _EMPTY_TIMES
+        if n_pushed - self._cursor > self._ring.capacity:
+            self.n_lost += n_pushed - self._cursor - self._ring.capacity
+            self._cursor = n_pushed - self._ring.capacity
+        idx = np.arange(self._cursor, n_pushed) % self._ring.capacity
+        self._cursor = n_pushed
+        return self._times[idx], self._codes[idx]
+
+    @property
+    def n_pending(self) -> int:
+        return len(self._pending_times)
+
+    def assign(self, sample_times: NDArray[np.float64]
+               ) -> tuple[NDArray[np.intp], NDArray[np.float64]]:
+        """assigns the new events to a block of samples and returns the
+        sample indices and the codes of the events
+
+        Each event is assigned to the first sample at or after the event
+        time. If several events fall on the same sample, the later events
+        are moved to the next samples, so that each event gets its own
+        sample. Events that are later than the last sample (or do not fit
+        into the block) remain pending for the next block. Events that are
+        earlier than the first sample are assigned to the first sample.
+
+        sample_times: ascending times of the samples of the block
+        """
+
+        times, codes = self.read()
+        if len(times) > 0:
+            times = np.concatenate((self._pending_times, times))
+            codes = np.concatenate((self._pending_codes, codes))
+            order = np.argsort(times, kind="stable")
+            self._pending_times = times[order]
+            self._pending_codes = codes[order]
+
+        n_events = len(self._pending_times)
+        if n_events == 0 or len(sample_times) == 0:
+            return _EMPTY_INDICES, _EMPTY_TIMES
+
+        idx = np.searchsorted(sample_times, self._pending_times, side="left")
+        # strictly increasing indices: move colliding events to the next samples
+        k = np.arange(n_events)
+        idx = np.maximum.accumulate(idx - k) + k
+
+        n_assigned = int(np.searchsorted(idx, len(sample_times)))
+        rtn_codes = self._pending_codes[:n_assigned]
+        self._pending_times = self._pending_times[n_assigned:]
+        self._pending_codes = self._pending_codes[n_assigned:]
+        return idx[:n_assigned], rtn_codes
@@ -1,15 +1,170 @@
 import bz2
+import ctypes as ct
+import logging
+import os
 from abc import ABC, abstractmethod
-from multiprocessing import Event, Process, Queue
+from collections.abc import Sequence
+from multiprocessing import Array, Event, Process
 from pathlib import Path
 from queue import Empty
+from time import perf_counter
+
+import numpy as np
+from numpy.typing import NDArray
+
+from .. import init_logging
+from .clock import local_clock
+from .profiling import ProcessProfiler, profiled
+from .pyramid import PyramidWriter
+from .segments import SegmentManifest
+from .stats import StageStats
+from .time_index import TimeIndexWriter
+from .writer_queue import WriterQueue
 
 NEWLINE = "\n"
 ENCODING = "utf-8"
 
+# indices of the shared write stats
+_N_WRITES, _N_BYTES, _WRITE_TIME, _N_FSYNC, _T_START = range(5)
+
+logger = logging.getLogger()
+
+
 class AbstractCSVDataStruct(ABC):
     ...
 
+
+class FlushRequest:
+    """Queue item that requests the file writer to flush its buffer"""
+
+    def __init__(self, fsync: bool = False):
+        self.fsync = fsync
+
+
+class OpenFile:
+    """Queue item that requests the file writer to close the current file
+    and to open path, starting with the header lines"""
+
+    def __init__(self, path: Path, append_mode: bool = False, header: Sequence[str] = ()):
+        self.path = path
+        self.append_mode = append_mode
+        self.header = list(header)
+
+
+class CloseFile:
+    """Queue item that requests the file writer to close the current file,
+    after the SourcePaused items of the sources with at least the given
+    request numbers (source -> request) have been received"""
+
+    def __init__(self, paused: dict[int, int] | None = None):
+        self.paused = {} if paused is None else paused
+
+
+class SourcePaused:
+    """Queue item of a data source (e.g. a sensor process): all data of the
+    source until pause request number request have been put before
+
+    Items of different processes can overtake each other in the queue,
+    thus the file writer waits for these items before closing a file.
+    """
+
+    def __init__(self, source: int, request: int):
+        self.source = source
+        self.request = request
+
+
+class QuitRequest:
+    """Queue item that requests the file writer process to quit"""
+
+
+class BufferedOutput:
+    """Output file with a large reusable write buffer
+
+    Data are collected in the buffer and written with a single os.write, if
+    the buffer is full or flush is called. bz2 files (suffix .bz2) are
+    compressed while flushing.
+    """
+
+    def __init__(self, path: Path, append_mode: bool = False,
+                 buffer_size: int = 1 << 20, stats=None):
+        """stats: shared array for the write stats (see AbstractFileWriter.write_stats)"""
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append_mode else os.O_TRUNC)
+        self.fd = os.open(path, flags, 0o666)
+        self.raw_position = os.lseek(self.fd, 0, os.SEEK_END)  # bytes in the file
+        if path.suffix.endswith(".bz2"):
+            self._compressor = bz2.BZ2Compressor()
+        else:
+            self._compressor = None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._pos = 0
+        self._stats = stats
+        self.last_flush = local_clock()
+
+    @property
+    def pending(self) -> int:
+        """number of bytes in the buffer"""
+        return self._pos
+
+    def sync_point(self) -> int:
+        """returns the file offset, from which the next written data can be
+        read (bz2: starts a new stream)"""
+        if self._compressor is None:
+            return self.raw_position + self._pos
+        self.flush()
+        self._write_raw(self._compressor.flush(), compress=False)
+        self._compressor = bz2.BZ2Compressor()
+        return self.raw_position
+
+    def write(self, data: bytes) -> int:
+        n = len(data)
+        if self._pos + n > len(self._buffer):
+            self.flush()
+            if n > len(self._buffer):
+                self._write_raw(data)
+                return n
+        self._buffer[self._pos:self._pos + n] = data
+        self._pos += n
+        return n
+
+    def flush(self, fsync: bool = False) -> None:
+        if self._pos > 0:
+            data = self._view[:self._pos]
+            self._write_raw(data)
+            self._pos = 0
+        if fsync:
+            os.fsync(self.fd)
+            if self._stats is not None:
+                self._stats[_N_FSYNC] += 1
+        self.last_flush = local_clock()
+
+    def close(self, fsync: bool = False) -> None:
+        self.flush()
+        if self._compressor is not None:
+            self._write_raw(self._compressor.flush(), compress=False)
+            self._compressor = None
+        self.flush(fsync=fsync)
+        self._view.release()
+        os.close(self.fd)
+
+    def _write_raw(self, data, compress: bool = True) -> None:
+        if compress and self._compressor is not None:
+            data = self._compressor.compress(data)
+        if len(data) == 0:
+            return
+        t = local_clock()
+        view = memoryview(data)
+        n_writes = 0
+        while len(view) > 0:
+            n = os.write(self.fd, view)
+            view = view[n:]
+            n_writes += 1
+        self.raw_position += len(data)
+        if self._stats is not None:
+            self._stats[_N_WRITES] += n_writes
+            self._stats[_N_BYTES] += len(data)
+            self._stats[_WRITE_TIME] += local_clock() - t
+
 class AbstractFileWriter(ABC, Process):
     """FileWriter is a process that runs in the background and writes data to a file.
     You can send data to be written by putting it into the queue attribute of the FileWriter instance.
@@ -22,95 +177,337 @@ class AbstractFileWriter(ABC, Process):
     2. Create a subclass of AbstractFileWriter and implement the to_csv method to convert your
         data structure to a CSV string.
 
+    The process can write several files in sequence: open_file and
+    close_file put requests into the queue, thus all data put before by the
+    same process are written to the previous file. Data of other processes
+    are included by waiting for their SourcePaused items (see close_file).
+    Data received while no file is open are discarded. A file path set
+    before the start is opened at the start.
+
+    The queue is bounded (see WriterQueue): if more than queue_size items are
+    waiting, further items are spilled to disk.
+
+    Output is collected in a buffer of buffer_size bytes, which is written
+    to disk if it is full, if flush_interval seconds have passed since the
+    last write (0: never) or if a FlushRequest is received (see flush). With
+    fsync, the data are synchronized to disk at each FlushRequest, at the
+    end of each segment and when closing the file.
+
+    If index_interval > 0, a time index (see tools.time_index) with an entry
+    every index_interval samples is written next to each data file.
+
+    If pyramid_bins are defined, a min/mean/max pyramid (see tools.pyramid)
+    of the values (see data_values) is written next to each data file.
+
+    If segment_size (bytes) or segment_duration (seconds, see data_times) is
+    set, the data are written into numbered segment files with a manifest
+    (see tools.segments). All strings received before the first data
+    structure are the header, which is repeated in each segment.
     """
+
+    CLOSE_TIMEOUT = 2.0  # seconds without data, see close_file
+
     def __init__(
         self,
-        filepath: Path|str,
+        filepath: Path|str = "",
         append_mode: bool = False,
+        queue_size: int = 10000,
+        lag_warning: float = 5.0,
+        segment_size: int = 0,
+        segment_duration: float = 0,
+        buffer_size: int = 1 << 20,
+        flush_interval: float = 1.0,
+        fsync: bool = False,
+        index_interval: int = 0,
+        pyramid_bins: Sequence[float] = (),
+        name: str = "File writer",
     ):
-        """To write to a file from multiple processes. Use FileWriter.queue.put(str) to write file"""
+        """To write to a file from multiple processes. Use FileWriter.queue.put(str) to write file
+
+        name: name of the writer in the latency stats
+        """
 
         super().__init__()
-        self._filepath: Path  = Path(filepath)
+        self._filepath: Path | None = Path(filepath) if filepath else None
         self._append_mode = append_mode
-        self.queue = Queue()
+        self.segment_size = segment_size
+        self.segment_duration = segment_duration
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.index_interval = index_interval
+        self.pyramid_bins = list(pyramid_bins)
+        self._write_stats = Array(ct.c_double, 5, lock=False)
+        self.queue = WriterQueue(high_water=queue_size, lag_warning=lag_warning)
+        # latency histograms: time in the queue, formatting, writing (incl.
+        # index and pyramid) and flushing
+        self.stats = StageStats(name, ["queue_wait", "format", "write", "flush"])
+        self.queue.wait_stats = self.stats["queue_wait"]
         self._enforce_quit = Event()
-        self._close_file = Event()
+        self._request_done = Event()  # OpenFile or CloseFile done
+        self._is_open = self._filepath is not None  # state in the parent process
+        # set before start to profile the process (see tools.profiling)
+        self.profiler: ProcessProfiler | None = None
 
     @property
-    def filepath(self) -> Path:
+    def filepath(self) -> Path | None:
         return self._filepath
 
+    @property
+    def is_open(self) -> bool:
+        """a file is open (or has been requested to be opened)"""
+        return self._is_open
+
+    @property
+    def is_segmented(self) -> bool:
+        return self.segment_size > 0 or self.segment_duration > 0
+
     def set_file(self, file_path: Path|str, append_mode: bool = False):
-        """Set file path and append mode for the file writer."""
+        """Set file path and append mode of the file that is opened at the start
+        of the process (use open_file, if the process is running)."""
         self._filepath = Path(file_path)
         self._append_mode = append_mode
+        self._is_open = True
+
+    def open_file(self, file_path: Path|str, append_mode: bool = False,
+                  header: Sequence[str] = (), wait: bool = True):
+        """closes the current file, after all pending writes are done, and
+        opens file_path, starting with the header lines
 
-    def close_file(self):
-        """closes file after all pending writes are done and no further write occurred
-        for close_timeout seconds
+        wait: blocks until the file is open (or the process has ended), thus
+            data put afterwards by any process are written to the file
         """
-        self._close_file.set()
+        self._filepath = Path(file_path)
+        self._append_mode = append_mode
+        self._is_open = True
+        self._request_done.clear()
+        self.queue.put(OpenFile(self._filepath, append_mode, header))
+        if wait:
+            self.wait_done()
+
+    def close_file(self, paused: dict[int, int] | None = None, wait: bool = True):
+        """closes the file after all pending writes are done
+
+        paused: the file is closed after the SourcePaused items of these
+            sources (source -> request number) have been received or no
+            data have been received for CLOSE_TIMEOUT seconds
+        wait: blocks until the file is closed (or the process has ended)
+        """
+        self._is_open = False
+        self._request_done.clear()
+        self.queue.put(CloseFile(paused))
+        if wait:
+            self.wait_done()
+
+    def wait_done(self):
+        """blocks until the last open_file or close_file request is done or
+        the process has ended"""
+        while not self._request_done.wait(0.1):
+            if not self.is_alive():
+                break
+
+    def flush(self, fsync: bool | None = None):
+        """requests to write the buffered data to disk, after all pending
+        writes are done (fsync: synchronize to disk, default: setting of the
+        writer)"""
+        self.queue.put(FlushRequest(self.fsync if fsync is None else fsync))
+
+    def write_stats(self) -> dict[str, float]:
+        """number of write calls, written bytes (on disk), time spent in
+        write calls, number of fsyncs and the average write rate (bytes/s)"""
+        st = self._write_stats
+        duration = local_clock() - st[_T_START] if st[_T_START] > 0 else 0
+        return {"writes": int(st[_N_WRITES]),
+                "bytes": int(st[_N_BYTES]),
+                "write_time": st[_WRITE_TIME],
+                "fsyncs": int(st[_N_FSYNC]),
+                "bytes_per_second": st[_N_BYTES] / duration if duration > 0 else 0.0}
 
     def enforce_quit(self):
         """forces the process to quit immediately, even if there are pending writes in the queue"""
         self._enforce_quit.set()
+        self.queue.put(QuitRequest())  # wakes up the process
 
     def join(self, timeout=None):
-        self._close_file.set()
+        """quits the process after all pending writes are done and closes
+        the file"""
+        if self.is_alive():
+            self.queue.put(QuitRequest())
         super().join(timeout)
 
     @abstractmethod
     def to_csv(self, data: AbstractCSVDataStruct) -> str:
         ...
 
-    def run(self):
+    def data_times(self, data: AbstractCSVDataStruct) -> Sequence[float]:
+        """times of the samples in data (used for the time ranges of segments)"""
+        return ()
 
-        if self._filepath is None:
-            raise ValueError("File path is not set. Call set_file() with a valid file path before running the process.")
-        self._filepath.parent.mkdir(parents=True, exist_ok=True)
+    def data_values(self, data: AbstractCSVDataStruct) -> tuple[int, NDArray] | None:
+        """source id (e.g. sensor) and values (samples x channels) of the data
+        for the pyramid, None if data have no values"""
+        return None
+
+    @property
+    def value_names(self) -> list[str]:
+        """names of the channels returned by data_values"""
+        return []
 
-        print(f"FileWriter: writing to {self._filepath} (append_mode={self._append_mode})")
-        if self._append_mode:
-            mode = "a"
+    def _open(self, path: Path, append_mode: bool = False
+              ) -> tuple[BufferedOutput, TimeIndexWriter | None, PyramidWriter | None]:
+        fl = BufferedOutput(path, append_mode=append_mode,
+                            buffer_size=self.buffer_size, stats=self._write_stats)
+        if self.index_interval > 0:
+            index = TimeIndexWriter(path, self.index_interval, append_mode=append_mode)
         else:
-            mode = "w"
-        if self._filepath.suffix.endswith(".bz2"):
-            fl = bz2.open(self._filepath, mode)
+            index = None
+        if len(self.pyramid_bins) > 0 and len(self.value_names) > 0:
+            pyramid = PyramidWriter(path, self.pyramid_bins, self.value_names,
+                                    append_mode=append_mode)
         else:
-            fl = open(self._filepath, mode, encoding=ENCODING)
+            pyramid = None
+        return fl, index, pyramid
 
-        self._close_file.clear()
-        self._enforce_quit.clear()
+    def _close(self, fl: BufferedOutput, index: TimeIndexWriter | None,
+               pyramid: PyramidWriter | None) -> None:
+        fl.close(fsync=self.fsync)
+        if index is not None:
+            index.close()
+        if pyramid is not None:
+            pyramid.close()
+
+    @profiled
+    def run(self):
+        init_logging()  # not inherited with the spawn start method
+        out = None
+        if self._filepath is not None:
+            out = _OutputFile(self, self._filepath, self._append_mode)
+        self._write_stats[_T_START] = local_clock()
+        flush_stats = self.stats["flush"]
+        paused: dict[int, int] = {}  # last pause request of each source
+        closing = None  # CloseFile waiting for SourcePaused items
+        last_item = local_clock()
 
         while not self._enforce_quit.is_set():
+            if closing is not None:
+                missing = [src for src, r in closing.paused.items() if paused.get(src, 0) < r]
+                if len(missing) == 0 or local_clock() - last_item >= self.CLOSE_TIMEOUT:
+                    if len(missing) > 0:
+                        logger.warning("FileWriter: closing file, sources %s did not pause",
+                                       missing)
+                    if out is not None:
+                        out.close()
+                        out = None
+                    closing = None
+                    self._request_done.set()
+
+            timeout = None  # no pending data: wait for the next queue item
+            if out is not None and self.flush_interval > 0 and out.fl.pending > 0:
+                timeout = out.fl.last_flush + self.flush_interval - local_clock()
+                if timeout <= 0:
+                    t = perf_counter()
+                    out.fl.flush()
+                    flush_stats.add(perf_counter() - t)
+                    timeout = None
+            if closing is not None:
+                timeout = last_item + self.CLOSE_TIMEOUT - local_clock()
+            try:
+                d = self.queue.get(timeout=None if timeout is None else max(timeout, 0))
+            except Empty:
+                continue  # flush interval or close timeout
+            last_item = local_clock()
+
+            if isinstance(d, AbstractCSVDataStruct | str):
+                if out is not None:
+                    out.write(d)
+            elif isinstance(d, SourcePaused):
+                paused[d.source] = max(paused.get(d.source, 0), d.request)
+            elif isinstance(d, FlushRequest):
+                if out is not None:
+                    t = perf_counter()
+                    out.fl.flush(fsync=d.fsync)
+                    flush_stats.add(perf_counter() - t)
+            elif isinstance(d, OpenFile):
+                if out is not None:
+                    out.close()
+                closing = None
+                out = _OutputFile(self, d.path, d.append_mode)
+                for txt in d.header:
+                    out.write(txt)
+                self._request_done.set()
+            elif isinstance(d, CloseFile):
+                closing = d
+            elif isinstance(d, QuitRequest):
+                break
+
+        if out is not None:
+            out.close()
+        self._request_done.set()
+        self.queue.remove_spill_files()
+
+
+class _OutputFile:
+    """the open file of the writer process with its segments, index and
+    pyramid"""
+
+    def __init__(self, writer: AbstractFileWriter, path: Path, append_mode: bool):
+        self.writer = writer
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if writer.is_segmented:
+            self.manifest = SegmentManifest(path, segment_size=writer.segment_size,
+                                            segment_duration=writer.segment_duration)
+            print(f"FileWriter: writing segments of {path} ({self.manifest.path.name})")
+            self.fl, self.index, self.pyramid = writer._open(self.manifest.new_segment())
+        else:
+            self.manifest = None
+            print(f"FileWriter: writing to {path} (append_mode={append_mode})")
+            self.fl, self.index, self.pyramid = writer._open(path, append_mode=append_mode)
+        self.header: list[bytes] = []
+        self.in_header = True
+        self._format_stats = writer.stats["format"]
+        self._write_stats = writer.stats["write"]
+
+    def write(self, d: AbstractCSVDataStruct | str) -> None:
+        writer = self.writer
+        manifest = self.manifest
+        times = ()
+        t = perf_counter()
+        if isinstance(d, AbstractCSVDataStruct):
+            txt = writer.to_csv(d) + NEWLINE
+            t_format = perf_counter()
+            self._format_stats.add(t_format - t)
+            t = t_format
+            self.in_header = False
+            if manifest is not None or self.index is not None or self.pyramid is not None:
+                times = writer.data_times(d)
+            if manifest is not None and manifest.segment_is_full():
+                # next segment (starts with the header)
+                writer._close(self.fl, self.index, self.pyramid)
+                manifest.close_segment()
+                self.fl, self.index, self.pyramid = writer._open(manifest.new_segment())
+                for h in self.header:
+                    manifest.add(self.fl.write(h))
+            if self.index is not None and len(times) > 0:
+                offset = self.fl.sync_point() if self.index.entry_required() else 0
+                self.index.add(times[0], offset, len(times))
+            if self.pyramid is not None:
+                values = writer.data_values(d)
+                if values is not None:
+                    self.pyramid.add(values[0], np.asarray(times), values[1])
+        else:
+            txt = d
+            if self.in_header:
+                self.header.append(txt.encode(ENCODING))
+
+        n_bytes = self.fl.write(txt.encode(ENCODING))
+        if manifest is not None:
+            manifest.add(n_bytes, times)
+        self._write_stats.add(perf_counter() - t)
 
-            if self._close_file.is_set():
-                try:
-                    d = self.queue.get_nowait()
-                except Empty:
-                    break  # quit process
-            else:
-                try:
-                    d = self.queue.get(timeout=0.5)
-                except Empty:
-                    continue  # wait again for events
-
-            if isinstance(d, AbstractCSVDataStruct):
-                txt = self.to_csv(d) + NEWLINE
-
-            elif isinstance(d, str):
-                txt = f"{d}"
-            else:
-                continue  # ignore unknown
-
-            if isinstance(fl, bz2.BZ2File):
-                fl.write(txt.encode(ENCODING))
-            else:
-                fl.write(txt)
-
-        fl.flush()
-        fl.close()
+    def close(self) -> None:
+        self.writer._close(self.fl, self.index, self.pyramid)
+        if self.manifest is not None:
+            self.manifest.close_segment(complete=True)
 
 
 def unique_file_path(path: Path|str) -> Path:
@@ -0,0 +1,258 @@
+"""Online digital filters for blocks of samples
+
+The filters process blocks of samples (samples x channels) and keep their
+state between the blocks, thus filtering a stream block by block yields the
+same result as filtering the concatenated stream at once (starting with
+zero state).
+
+IIR filters are cascades of second-order sections (SOSFilter). The cascade
+is evaluated in sub-blocks of SOSFilter.SUB_BLOCK samples as matrix
+products, which are derived from the state-space form (direct form II
+transposed) of the sections. FIR filters (FIRFilter) use a sliding window.
+
+Filters are defined by specification strings (see make_filter), e.g.
+"notch:50,lowpass:20:4".
+
+Run `python -m pyforcedaq.tools.filters` for a benchmark.
+"""
+
+from abc import ABC, abstractmethod
+from time import perf_counter
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from numpy.typing import NDArray
+
+
+def butter_lowpass_sos(cutoff: float, rate: float, order: int = 4) -> NDArray[np.float64]:
+    """second-order sections (n x 6: b0, b1, b2, a0, a1, a2) of a Butterworth
+    low-pass filter (bilinear transform)"""
+    _check_frequency(cutoff, rate)
+    sos = []
+    w0 = 2 * np.pi * cutoff / rate
+    cos_w0 = np.cos(w0)
+    for k in range(order // 2):
+        q = 1 / (2 * np.sin(np.pi * (2 * k + 1) / (2 * order)))
+        alpha = np.sin(w0) / (2 * q)
+        b = (1 - cos_w0) / 2
+        sos.append([b, 2 * b, b, 1 + alpha, -2 * cos_w0, 1 - alpha])
+    if order % 2 == 1:
+        k = np.tan(w0 / 2)
+        sos.append([k, k, 0, 1 + k, k - 1, 0])
+    return _normalize(np.array(sos, dtype=np.float64))
+
+
+def notch_sos(freq: float, rate: float, q: float = 30) -> NDArray[np.float64]:
+    """second-order section of a notch filter (quality factor q)"""
+    _check_frequency(freq, rate)
+    w0 = 2 * np.pi * freq / rate
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    return _normalize(np.array([[1, -2 * cos_w0, 1, 1 + alpha, -2 * cos_w0, 1 - alpha]],
+                               dtype=np.float64))
+
+
+def fir_lowpass(cutoff: float, rate: float, n_taps: int = 101) -> NDArray[np.float64]:
+    """taps of a FIR low-pass filter (windowed sinc, Hamming window)"""
+    _check_frequency(cutoff, rate)
+    n = np.arange(n_taps) - (n_taps - 1) / 2
+    taps = np.sinc(2 * cutoff / rate * n) * np.hamming(n_taps)
+    return taps / taps.sum()
+
+
+def _check_frequency(freq: float, rate: float) -> None:
+    if not 0 < freq < rate / 2:
+        raise ValueError(f"Filter frequency {freq} Hz has to be between 0 and "
+                         f"the Nyquist frequency ({rate / 2} Hz)")
+
+
+def _normalize(sos: NDArray[np.float64]) -> NDArray[np.float64]:
+    return sos / sos[:, 3:4]
+
+
+class BlockFilter(ABC):
+    """Filter for blocks of samples (samples x channels) with state"""
+
+    @abstractmethod
+    def process(self, x: NDArray[np.float64]) -> NDArray[np.float64]:
+        """filters a block of samples (samples x channels)"""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """sets the state to zero"""
+
+
+class SOSFilter(BlockFilter):
+    """IIR filter as cascade of second-order sections"""
+
+    SUB_BLOCK = 64
+
+    def __init__(self, sos: NDArray[np.float64], n_channels: int):
+        """sos: n x 6 array (b0, b1, b2, a0, a1, a2)"""
+        self.sos = _normalize(np.atleast_2d(np.asarray(sos, dtype=np.float64)))
+        self.n_channels = n_channels
+        a, b, c, d = self._state_space(self.sos)
+        self._toeplitz, self._o, self._a_pow, self._g = self._block_matrices(a, b, c, d)
+        self._state = np.zeros((len(a), n_channels))
+
+    @staticmethod
+    def _state_space(sos: NDArray[np.float64]) -> tuple:
+        """state-space form (A, B, C, D) of the cascade of the sections
+        (direct form II transposed)"""
+        a = np.zeros((0, 0))
+        b = np.zeros(0)
+        c = np.zeros(0)
+        d = 1.0
+        for b0, b1, b2, _, a1, a2 in sos:
+            a2_ = np.array([[-a1, 1.0], [-a2, 0.0]])
+            b2_ = np.array([b1 - a1 * b0, b2 - a2 * b0])
+            c2_ = np.array([1.0, 0.0])
+            # series connection: section input is the output of the cascade
+            n = len(a)
+            a_new = np.zeros((n + 2, n + 2))
+            a_new[:n, :n] = a
+            a_new[n:, :n] = np.outer(b2_, c)
+            a_new[n:, n:] = a2_
+            b = np.concatenate((b, b2_ * d))
+            c = np.concatenate((b0 * c, c2_))
+            d = b0 * d
+            a = a_new
+        return a, b, c, d
+
+    @staticmethod
+    def _block_matrices(a, b, c, d) -> tuple:
+        """matrices to filter a sub-block of L samples with state s:
+            y = H x + O s  and  s' = A^L s + G x"""
+        size = SOSFilter.SUB_BLOCK
+        a_pow = np.empty((size + 1, len(a), len(a)))
+        a_pow[0] = np.eye(len(a))
+        for i in range(size):
+            a_pow[i + 1] = a @ a_pow[i]
+        o = c @ a_pow[:size]  # rows C A^i
+        h = np.empty(size)  # impulse response
+        h[0] = d
+        h[1:] = o[:-1] @ b
+        idx = np.arange(size)
+        lag = idx[:, None] - idx[None, :]
+        toeplitz = np.where(lag >= 0, h[np.clip(lag, 0, None)], 0.0)
+        g = (a_pow[size - 1 - idx] @ b).T  # columns A^(L-1-j) B
+        return toeplitz, o, a_pow, g
+
+    def reset(self) -> None:
+        self._state[:] = 0
+
+    def process(self, x: NDArray[np.float64]) -> NDArray[np.float64]:
+        x = np.asarray(x, dtype=np.float64)
+        y = np.empty_like(x)
+        size = SOSFilter.SUB_BLOCK
+        s = self._state
+        for start in range(0, len(x), size):
+            m = min(size, len(x) - start)
+            xb = x[start:start + m]
+            y[start:start + m] = self._toeplitz[:m, :m] @ xb + self._o[:m] @ s
+            s = self._a_pow[m] @ s + self._g[:, size - m:] @ xb
+        self._state = s
+        return y
+
+
+class FIRFilter(BlockFilter):
+    """FIR filter"""
+
+    def __init__(self, taps: NDArray[np.float64], n_channels: int):
+        self.taps = np.asarray(taps, dtype=np.float64)
+        self.n_channels = n_channels
+        self._history = np.zeros((len(self.taps) - 1, n_channels))
+
+    def reset(self) -> None:
+        self._history[:] = 0
+
+    def process(self, x: NDArray[np.float64]) -> NDArray[np.float64]:
+        x = np.asarray(x, dtype=np.float64)
+        if len(x) == 0:
+            return x.copy()
+        xx = np.concatenate((self._history, x))
+        windows = sliding_window_view(xx, len(self.taps), axis=0)  # samples x channels x taps
+        y = windows @ self.taps[::-1]
+        self._history = xx[len(xx) - len(self._history):].copy()
+        return y
+
+
+class FilterChain(BlockFilter):
+    """filters that are applied one after another"""
+
+    def __init__(self, filters: list[BlockFilter]):
+        self.filters = filters
+
+    def reset(self) -> None:
+        for f in self.filters:
+            f.reset()
+
+    def process(self, x: NDArray[np.float64]) -> NDArray[np.float64]:
+        for f in self.filters:
+            x = f.process(x)
+        return x
+
+
+def make_filter(spec: str, rate: float, n_channels: int = 6) -> BlockFilter | None:
+    """creates a filter from a specification string, None for an empty
+    specification
+
+    Specification: comma separated list of filters, which are applied one
+    after another
+        lowpass:<cutoff>[:<order>]   Butterworth low-pass (default order 4)
+        notch:<freq>[:<q>]           notch filter (default q 30)
+        fir:<cutoff>[:<n_taps>]      FIR low-pass (default 101 taps)
+    e.g. "notch:50,lowpass:20:2"
+
+    Raises ValueError for invalid specifications.
+    """
+    filters: list[BlockFilter] = []
+    sections = []  # subsequent IIR filters are combined into one SOSFilter
+    for item in spec.replace(" ", "").split(","):
+        if len(item) == 0:
+            continue
+        kind, *args = item.split(":")
+        try:
+            freq = float(args[0])
+            if kind == "lowpass":
+                order = int(args[1]) if len(args) > 1 else 4
+                sections.append(butter_lowpass_sos(freq, rate, order))
+            elif kind == "notch":
+                q = float(args[1]) if len(args) > 1 else 30
+                sections.append(notch_sos(freq, rate, q))
+            elif kind == "fir":
+                n_taps = int(args[1]) if len(args) > 1 else 101
+                if len(sections) > 0:
+                    filters.append(SOSFilter(np.vstack(sections), n_channels))
+                    sections = []
+                filters.append(FIRFilter(fir_lowpass(freq, rate, n_taps), n_channels))
+            else:
+                raise ValueError(f"Unknown filter type '{kind}'")
+        except IndexError:
+            raise ValueError(f"Invalid filter specification '{item}'") from None
+    if len(sections) > 0:
+        filters.append(SOSFilter(np.vstack(sections), n_channels))
+    if len(filters) == 0:
+        return None
+    if len(filters) == 1:
+        return filters[0]
+    return FilterChain(filters)
+
+
+def benchmark(rate: float = 1000, n_channels: int = 6, n_samples: int = 200_000) -> None:
+    """prints the cost per sample of the filters for different block sizes"""
+    x = np.random.default_rng(1).normal(size=(n_samples, n_channels))
+    for spec in ("lowpass:20:2", "lowpass:20:4", "notch:50,lowpass:20:4", "fir:20:101"):
+        txt = f"{spec:>22}:"
+        for block_size in (1, 10, 100, 1000):
+            filt = make_filter(spec, rate, n_channels)
+            n = min(n_samples, block_size * 2000)
+            t = perf_counter()
+            for start in range(0, n, block_size):
+                filt.process(x[start:start + block_size])  # type: ignore
+            txt += f"  {(perf_counter() - t) / n * 1e9:7.0f} ns/sample (block {block_size})"
+        print(txt)
+
+
+if __name__ == "__main__":
+    benchmark()
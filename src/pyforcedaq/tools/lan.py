@@ -1,9 +1,12 @@
 import os
 import socket
+from functools import cache
 from subprocess import check_output
 
 
+@cache
 def get_lan_ip():
+    """returns the LAN IP of this machine (determined only once)"""
     if os.name == "nt":
         # Windows
         return socket.gethostbyname(socket.gethostname())
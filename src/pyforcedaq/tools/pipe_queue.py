@@ -0,0 +1,54 @@
+"""A multiprocessing queue that can be waited for with selectors"""
+
+import socket
+from multiprocessing import Lock
+from multiprocessing.connection import Connection
+from queue import Empty
+
+
+def _socket_pipe() -> tuple[Connection, Connection]:
+    """one-way connection (reader, writer) via a socket pair
+
+    In contrast to pipes, sockets can be registered in selectors on all
+    platforms (Windows: select supports only sockets).
+    """
+    r, w = socket.socketpair()
+    return (Connection(r.detach(), writable=False),
+            Connection(w.detach(), readable=False))
+
+
+class PipeQueue:
+    """Queue between processes based on a socket pair (multiple producers, one consumer).
+
+    In contrast to multiprocessing.Queue, the queue has a file descriptor
+    (fileno) and can be registered in a selector, so that the consumer
+    sleeps in the kernel until data arrive.
+    """
+
+    def __init__(self):
+        self._reader, self._writer = _socket_pipe()
+        self._lock = Lock()
+
+    def fileno(self) -> int:
+        return self._reader.fileno()
+
+    def put(self, obj) -> None:
+        with self._lock:
+            self._writer.send(obj)
+
+    def get(self, timeout: float | None = None):
+        """removes and returns an item from the queue. Blocks, if timeout is
+        None, and raises queue.Empty if no item arrived within timeout seconds"""
+        if not self._reader.poll(timeout):
+            raise Empty
+        return self._reader.recv()
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def get_all(self) -> list:
+        """returns all pending items"""
+        rtn = []
+        while self._reader.poll():
+            rtn.append(self._reader.recv())
+        return rtn
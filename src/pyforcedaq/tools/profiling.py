@@ -0,0 +1,185 @@
+"""Profiling of the recording processes
+
+Each process (sensor processes, file writer, UDP connection, stream
+server) can be profiled (settings profile and profile_folder, command line
+option --profile). The recorder attaches a ProcessProfiler to the processes,
+which profiles the run method of the process (decorator `profiled`) and
+writes the profile at the end of the process to the profile folder:
+
+    cprofile: deterministic profiler (cProfile), <role>_<pid>.prof (pstats)
+    sampling: the call stack of the main thread is sampled every
+        SAMPLING_INTERVAL seconds by a thread, <role>_<pid>.samples.json.
+        The overhead is low and does not depend on the number of calls,
+        but calls that release the GIL (sleep, I/O) are over-represented.
+
+`summary` lists the hot functions of each role. Run
+`python -m pyforcedaq.tools.profiling <profile folder>` for the summary of a
+recording.
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+from collections import Counter
+from functools import wraps
+from pathlib import Path
+from time import perf_counter
+
+MODES = ("cprofile", "sampling")
+SAMPLING_INTERVAL = 0.005  # seconds
+SAMPLES_SUFFIX = ".samples.json"
+PROF_SUFFIX = ".prof"
+
+
+class ProcessProfiler:
+    """Profiler of a process, created in the parent process and started in
+    the profiled process"""
+
+    def __init__(self, mode: str, role: str, folder: str | Path):
+        """mode: "cprofile" or "sampling"
+        role: name of the profiled process (e.g. "sensor_Dev1")
+
+        Raises ValueError for unknown modes.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode '{mode}', use one of {MODES}")
+        self.mode = mode
+        self.role = role
+        self.folder = Path(folder)
+        self._profile = None
+        self._sampler = None
+
+    def start(self) -> None:
+        if self.mode == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _Sampler(threading.get_ident())
+            self._sampler.start()
+
+    def stop(self) -> Path:
+        """stops profiling and writes the profile, returns the path"""
+        self.folder.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.role}_{os.getpid()}"
+        if self._profile is not None:
+            self._profile.disable()
+            path = self.folder / (stem + PROF_SUFFIX)
+            self._profile.dump_stats(path)
+        else:
+            self._sampler.stop()  # type: ignore
+            path = self.folder / (stem + SAMPLES_SUFFIX)
+            self._sampler.write(path)  # type: ignore
+        return path
+
+
+def profiled(run):
+    """decorator of Process.run: profiles the process, if the attribute
+    profiler of the process is set"""
+
+    @wraps(run)
+    def wrapper(self):
+        profiler = getattr(self, "profiler", None)
+        if profiler is None:
+            return run(self)
+        profiler.start()
+        try:
+            return run(self)
+        finally:
+            profiler.stop()
+
+    return wrapper
+
+
+def _func_name(code) -> str:
+    return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class _Sampler(threading.Thread):
+    """samples the call stack of a thread"""
+
+    def __init__(self, thread_id: int, interval: float = SAMPLING_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.n_samples = 0
+        self.duration = 0.0
+        self.self_counts: Counter[str] = Counter()  # function on top of the stack
+        self.total_counts: Counter[str] = Counter()  # function anywhere in the stack
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        names: dict = {}  # code object -> name
+        t_start = perf_counter()
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.n_samples += 1
+            stack = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _func_name(code)
+                if leaf:
+                    self.self_counts[name] += 1
+                    leaf = False
+                stack.add(name)
+                frame = frame.f_back
+            self.total_counts.update(stack)
+        self.duration = perf_counter() - t_start
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path: Path) -> None:
+        with open(path, "w", encoding="utf-8") as fl:
+            json.dump({"interval": self.interval,
+                       "n_samples": self.n_samples,
+                       "duration": self.duration,
+                       "self": dict(self.self_counts),
+                       "total": dict(self.total_counts)}, fl)
+
+
+def hot_functions(path: Path | str, top: int = 10) -> list[tuple[str, float, float]]:
+    """the functions with the highest self time of a profile file:
+    (function, self time, total time), times in seconds (sampling:
+    estimated from the number of samples and the sampling duration)"""
+    path = Path(path)
+    if path.name.endswith(SAMPLES_SUFFIX):
+        with open(path, encoding="utf-8") as fl:
+            data = json.load(fl)
+        interval = data["duration"] / max(data["n_samples"], 1)  # per sample
+        rtn = [(func, cnt * interval, data["total"].get(func, cnt) * interval)
+               for func, cnt in data["self"].items()]
+    else:
+        stats = pstats.Stats(str(path)).stats  # type: ignore
+        rtn = [(f"{file}:{line}({name})", tt, ct)
+               for (file, line, name), (_, _, tt, ct, _) in stats.items()]
+    rtn.sort(key=lambda x: x[1], reverse=True)
+    return rtn[:top]
+
+
+def summary(folder: Path | str, top: int = 10) -> str:
+    """hot functions of each profiled process in the folder"""
+    rtn = []
+    for path in sorted(Path(folder).iterdir()):
+        if path.name.endswith(SAMPLES_SUFFIX):
+            role = path.name[:-len(SAMPLES_SUFFIX)]
+        elif path.suffix == PROF_SUFFIX:
+            role = path.stem
+        else:
+            continue
+        rtn.append(f"{role}\n  {'self (s)':>10} {'total (s)':>10}  function")
+        for func, self_time, total_time in hot_functions(path, top):
+            rtn.append(f"  {self_time:10.3f} {total_time:10.3f}  {func}")
+    return "\n".join(rtn)
+
+
+if __name__ == "__main__":
+    print(summary(sys.argv[1] if len(sys.argv) > 1 else "profiles"))
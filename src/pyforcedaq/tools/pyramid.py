@@ -0,0 +1,249 @@
+"""Min/mean/max pyramid of data files
+
+The file writer computes for each sensor and channel the minimum, mean and
+maximum of time bins of different widths (levels, e.g. 10 ms, 100 ms and
+1 s) while writing the data. Each level is stored in a sidecar file next to
+the data file (e.g. rec.csv.pyr0, rec.csv.pyr1, ...), thus an overview of a
+recording needs to read only the level of the required resolution.
+
+Only the first level is computed from the samples, each further level is
+computed from the completed bins of the previous level. Therefore the bin
+width of a level has to be an integer multiple of the previous bin width.
+
+Layout of a level file: magic b"FDAQPYR1", length of the JSON header
+(uint32), JSON header (bin width, level, channel names), padded to a multiple
+of 8 bytes, followed by the bins (level_dtype).
+"""
+
+import bisect
+import json
+import struct
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+MAGIC = b"FDAQPYR1"
+PYRAMID_SUFFIX = ".pyr"
+
+
+def pyramid_path(data_path: Path | str, level: int) -> Path:
+    """path of a pyramid level of a data file"""
+    data_path = Path(data_path)
+    return data_path.with_name(f"{data_path.name}{PYRAMID_SUFFIX}{level}")
+
+
+def level_dtype(n_channels: int) -> np.dtype:
+    return np.dtype([("sensor_id", "<i4"), ("n", "<i4"), ("time", "<f8"),
+                     ("min", "<f4", (n_channels,)), ("mean", "<f4", (n_channels,)),
+                     ("max", "<f4", (n_channels,))])
+
+
+class _Bins:
+    """bins of one level: id (time / bin width), number of samples, min, sum, max"""
+    __slots__ = ("ids", "max", "min", "n", "sum")
+
+    def __init__(self, ids: NDArray, n: NDArray, mn: NDArray, sm: NDArray, mx: NDArray):
+        self.ids = ids
+        self.n = n
+        self.min = mn
+        self.sum = sm
+        self.max = mx
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, idx) -> "_Bins":
+        return _Bins(self.ids[idx], self.n[idx], self.min[idx], self.sum[idx], self.max[idx])
+
+    @staticmethod
+    def concatenate(a: "_Bins", b: "_Bins") -> "_Bins":
+        return _Bins(*(np.concatenate((getattr(a, x), getattr(b, x)))
+                       for x in ("ids", "n", "min", "sum", "max")))
+
+    def reduce(self, ids: NDArray) -> "_Bins":
+        """merges subsequent bins with the same new id"""
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        return _Bins(ids[starts],
+                     np.add.reduceat(self.n, starts),
+                     np.minimum.reduceat(self.min, starts, axis=0),
+                     np.add.reduceat(self.sum, starts, axis=0),
+                     np.maximum.reduceat(self.max, starts, axis=0))
+
+
+class _Level:
+    """accumulates the bins of one level and sensor, the last bin is open
+    until a bin with another id arrives"""
+
+    def __init__(self, ratio: int):
+        self.ratio = ratio  # bin width relative to the previous level
+        self.open: _Bins | None = None
+
+    def add(self, bins: _Bins) -> _Bins:
+        """adds bins of the previous level, returns the completed bins"""
+        new = bins.reduce(bins.ids // self.ratio)
+        if self.open is not None:
+            new = _Bins.concatenate(self.open, new)
+            new = new.reduce(new.ids)
+        self.open = new[-1:]
+        return new[:-1]
+
+    def flush(self) -> _Bins | None:
+        rtn, self.open = self.open, None
+        return rtn
+
+
+class PyramidWriter:
+    """Computes and writes the pyramid of a data file (used by the file writer)"""
+
+    def __init__(self, data_path: Path, bin_widths: Sequence[float],
+                 channels: Sequence[str], append_mode: bool = False):
+        """
+        Parameters
+        ----------
+        bin_widths: list of float
+            bin widths of the levels in seconds (ascending, each an integer
+            multiple of the previous)
+        channels: list of str
+            names of the channels
+        append_mode: bool
+            append to existing level files (same bin widths and channels)
+
+        Raises ValueError, if the bin widths are invalid.
+        """
+        self.bin_widths = list(bin_widths)
+        self.ratios = [1]
+        for a, b in zip(self.bin_widths[:-1], self.bin_widths[1:]):
+            ratio = round(b / a)
+            if ratio < 2 or abs(ratio * a - b) > 1e-9 * b:
+                raise ValueError(f"Pyramid bin width {b} is not a multiple of {a}")
+            self.ratios.append(ratio)
+        self.n_channels = len(channels)
+        self._dtype = level_dtype(self.n_channels)
+        self._levels: dict[int, list[_Level]] = {}  # sensor_id -> levels
+        self._paths = []
+        for level, width in enumerate(self.bin_widths):
+            header = json.dumps({"level": level, "bin_width": width,
+                                 "channels": list(channels)}).encode("utf-8")
+            header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+            path = pyramid_path(data_path, level)
+            if not (append_mode and path.exists()):
+                path.write_bytes(MAGIC + struct.pack("<I", len(header)) + header)
+            self._paths.append(path)
+
+    def add(self, sensor_id: int, times: NDArray, values: NDArray) -> None:
+        """adds samples (values: samples x channels)"""
+        if len(times) == 0:
+            return
+        try:
+            levels = self._levels[sensor_id]
+        except KeyError:
+            levels = [_Level(r) for r in self.ratios]
+            self._levels[sensor_id] = levels
+        values = np.asarray(values, dtype=np.float64)
+        # rounding: samples at the bin borders belong to the next bin
+        ids = np.floor(np.round(np.asarray(times) / self.bin_widths[0], 9)).astype(np.int64)
+        bins = _Bins(ids,
+                     np.ones(len(times), dtype=np.int64), values, values, values)
+        for k, level in enumerate(levels):
+            bins = level.add(bins)
+            if len(bins) == 0:
+                break
+            self._write(k, sensor_id, bins)
+
+    def close(self) -> None:
+        """writes the open bins"""
+        for sensor_id, levels in self._levels.items():
+            # cascade the open bins through the levels
+            pending = None
+            for k, level in enumerate(levels):
+                out = level.add(pending) if pending is not None else None
+                open_bin = level.flush()
+                if open_bin is not None:
+                    out = open_bin if out is None else _Bins.concatenate(out, open_bin)
+                if out is None or len(out) == 0:
+                    break
+                self._write(k, sensor_id, out)
+                pending = out
+
+    def _write(self, level: int, sensor_id: int, bins: _Bins) -> None:
+        rec = np.empty(len(bins), dtype=self._dtype)
+        rec["sensor_id"] = sensor_id
+        rec["n"] = bins.n
+        rec["time"] = bins.ids * self.bin_widths[level]
+        rec["min"] = bins.min
+        rec["mean"] = bins.sum / bins.n[:, None]
+        rec["max"] = bins.max
+        with open(self._paths[level], "ab") as fl:
+            fl.write(rec.tobytes())
+
+
+class _TimeView:
+    """lazy sequence of the times of memory mapped bins"""
+
+    def __init__(self, bins: np.ndarray):
+        self._bins = bins
+
+    def __len__(self) -> int:
+        return len(self._bins)
+
+    def __getitem__(self, idx: int) -> float:
+        return float(self._bins[idx]["time"])
+
+
+def read_header(data_path: Path | str, level: int) -> tuple[dict, int]:
+    """reads the header of a pyramid level, returns the header (level,
+    bin_width, channels) and the offset of the bins in the file
+
+    Raises FileNotFoundError, if the level does not exist.
+    """
+    path = pyramid_path(data_path, level)
+    with open(path, "rb") as fl:
+        head = fl.read(len(MAGIC) + 4)
+        if head[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a pyForceDAQ pyramid")
+        header_len = struct.unpack("<I", head[len(MAGIC):])[0]
+        header = json.loads(fl.read(header_len))
+    return header, len(MAGIC) + 4 + header_len
+
+
+def read_level(data_path: Path | str, level: int, t0: float | None = None,
+               t1: float | None = None) -> tuple[dict, np.ndarray]:
+    """reads a level of the pyramid of a data file, returns the header and the
+    bins with t0 <= time <= t1 (the file is memory mapped, only the required
+    part is read)
+
+    Raises FileNotFoundError, if the level does not exist.
+    """
+    header, offset = read_header(data_path, level)
+    path = pyramid_path(data_path, level)
+    dtype = level_dtype(len(header["channels"]))
+    n = (path.stat().st_size - offset) // dtype.itemsize
+    if n == 0:
+        return header, np.empty(0, dtype=dtype)
+    bins = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(n,))
+    # binary search touches only a few pages of the file, the bins of several
+    # sensors are approximately sorted by time
+    times = _TimeView(bins)
+    margin = 64
+    i, j = 0, n
+    if t0 is not None:
+        i = max(0, bisect.bisect_left(times, t0 - header["bin_width"]) - margin)
+    if t1 is not None:
+        j = min(n, bisect.bisect_right(times, t1) + margin)
+    rtn = np.array(bins[i:j])
+    del bins
+    if t0 is not None:
+        rtn = rtn[rtn["time"] + header["bin_width"] > t0]
+    if t1 is not None:
+        rtn = rtn[rtn["time"] <= t1]
+    return header, rtn
+
+
+def n_levels(data_path: Path | str) -> int:
+    """number of pyramid levels of a data file"""
+    n = 0
+    while pyramid_path(data_path, n).exists():
+        n += 1
+    return n
@@ -0,0 +1,166 @@
+"""Segmented data files
+
+A segmented recording is split into numbered segment files, e.g.
+
+    rec.001.csv.bz2, rec.002.csv.bz2, ...
+
+Each segment starts with the header of the recording and can be read
+independently. The manifest (rec.manifest.json) lists the segments with their
+time range, number of samples and (uncompressed) size. It is updated whenever
+a segment is opened or closed, thus after a crash, only the last segment is
+affected and the manifest lists all closed segments.
+"""
+
+import json
+import os
+from collections.abc import Sequence
+from pathlib import Path
+
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _split_suffix(path: Path) -> tuple[str, str]:
+    """splits the file name into base name and data suffix (.csv or .csv.bz2)"""
+    name = path.name
+    for suffix in (".csv.bz2", ".csv"):
+        if name.endswith(suffix):
+            return name[:-len(suffix)], suffix
+    return path.stem, path.suffix
+
+
+def segment_path(path: Path | str, index: int) -> Path:
+    """path of segment number index (starting at 1) of a recording"""
+    path = Path(path)
+    base, suffix = _split_suffix(path)
+    return path.with_name(f"{base}.{index:03d}{suffix}")
+
+
+def manifest_path(path: Path | str) -> Path:
+    """path of the manifest of a segmented recording"""
+    path = Path(path)
+    base, _ = _split_suffix(path)
+    return path.with_name(base + MANIFEST_SUFFIX)
+
+
+def unique_segmented_path(path: Path | str) -> Path:
+    """returns a data file path, for which neither a manifest nor segments exist"""
+    path = Path(path)
+    base, suffix = _split_suffix(path)
+    counter = 0
+    unique_path = path
+    while manifest_path(unique_path).exists() or segment_path(unique_path, 1).exists():
+        counter += 1
+        unique_path = path.with_name(f"{base}_{counter}{suffix}")
+    return unique_path
+
+
+class SegmentManifest:
+    """Manifest of a segmented recording, used by the file writer"""
+
+    def __init__(self, path: Path | str, segment_size: int = 0,
+                 segment_duration: float = 0):
+        """
+        Parameters
+        ----------
+        path: Path
+            path of the data file (without segment number)
+        segment_size: int
+            start a new segment after segment_size bytes (uncompressed), 0: no limit
+        segment_duration: float
+            start a new segment after segment_duration seconds of data, 0: no limit
+        """
+        self.data_path = Path(path)
+        self.path = manifest_path(path)
+        self.segment_size = segment_size
+        self.segment_duration = segment_duration
+        self.segments: list[dict] = []
+        self.complete = False
+
+    @property
+    def current(self) -> dict:
+        return self.segments[-1]
+
+    def new_segment(self) -> Path:
+        """adds a new segment and returns its path"""
+        path = segment_path(self.data_path, len(self.segments) + 1)
+        self.segments.append({"file": path.name, "first_time": None, "last_time": None,
+                              "n_samples": 0, "size": 0, "closed": False})
+        self.save()
+        return path
+
+    def add(self, size: int, times: Sequence[float] = ()) -> None:
+        """counts written data of the current segment (times in ascending order)"""
+        seg = self.current
+        seg["size"] += size
+        if len(times) > 0:
+            t_min, t_max = float(times[0]), float(times[-1])
+            if seg["first_time"] is None or t_min < seg["first_time"]:
+                seg["first_time"] = t_min
+            if seg["last_time"] is None or t_max > seg["last_time"]:
+                seg["last_time"] = t_max
+            seg["n_samples"] += len(times)
+
+    def segment_is_full(self) -> bool:
+        """True, if the current segment contains data and exceeds size or
+        duration"""
+        seg = self.current
+        if seg["n_samples"] == 0:
+            return False
+        if self.segment_size > 0 and seg["size"] >= self.segment_size:
+            return True
+        return (self.segment_duration > 0 and
+                seg["last_time"] - seg["first_time"] >= self.segment_duration)
+
+    def close_segment(self, complete: bool = False) -> None:
+        self.current["closed"] = True
+        self.complete = complete
+        self.save()
+
+    def save(self) -> None:
+        """writes the manifest (atomic replace)"""
+        content = {"version": MANIFEST_VERSION,
+                   "segment_size": self.segment_size,
+                   "segment_duration": self.segment_duration,
+                   "complete": self.complete,
+                   "segments": self.segments}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as fl:
+            json.dump(content, fl, indent=1)
+        os.replace(tmp, self.path)
+
+
+def read_manifest(path: Path | str) -> dict:
+    """reads a manifest (path of the manifest or of the data file)
+
+    The file names of the segments are replaced by their full paths.
+    """
+    path = Path(path)
+    if not path.name.endswith(MANIFEST_SUFFIX):
+        path = manifest_path(path)
+    with open(path, "r", encoding="utf-8") as fl:
+        manifest = json.load(fl)
+    for seg in manifest["segments"]:
+        seg["file"] = path.parent / seg["file"]
+    return manifest
+
+
+def select_segments(path: Path | str, t0: float | None = None,
+                    t1: float | None = None) -> list[Path]:
+    """returns the paths of all segments with data between t0 and t1
+
+    Segments with unknown time range (e.g. the last segment after a crash)
+    are always included.
+    """
+    rtn = []
+    for seg in read_manifest(path)["segments"]:
+        first, last = seg["first_time"], seg["last_time"]
+        if seg["closed"] and seg["n_samples"] > 0:
+            if t0 is not None and last < t0:
+                continue
+            if t1 is not None and first > t1:
+                continue
+        elif seg["closed"]:
+            continue  # empty
+        rtn.append(seg["file"])
+    return rtn
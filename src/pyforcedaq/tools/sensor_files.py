@@ -0,0 +1,90 @@
+"""Data files per sensor
+
+With RecordingSettings.writer_per_sensor, each sensor is written by its own
+file writer process into its own data file (or segmented recording, see
+tools.segments), e.g.
+
+    rec_Dev1.csv.bz2, rec_Dev2.csv.bz2
+
+The files have no device_tag column. The sensor manifest (rec.sensors.json)
+lists the files with sensor id and label (for segmented recordings the
+manifests of the segments). The analysis reader merges the files by time
+(see analysis.reader).
+"""
+
+import json
+import os
+from pathlib import Path
+
+from .segments import _split_suffix, manifest_path, segment_path
+
+SENSORS_SUFFIX = ".sensors.json"
+SENSORS_VERSION = 1
+
+
+def sensor_file_path(path: Path | str, device_label: str) -> Path:
+    """path of the data file of a sensor"""
+    path = Path(path)
+    base, suffix = _split_suffix(path)
+    return path.with_name(f"{base}_{device_label}{suffix}")
+
+
+def sensors_manifest_path(path: Path | str) -> Path:
+    """path of the sensor manifest of a recording"""
+    path = Path(path)
+    base, _ = _split_suffix(path)
+    return path.with_name(base + SENSORS_SUFFIX)
+
+
+def unique_sensors_path(path: Path | str, device_labels: list[str]) -> Path:
+    """returns a data file path, for which neither a sensor manifest nor
+    files of the sensors (or their segments) exist"""
+    path = Path(path)
+    base, suffix = _split_suffix(path)
+
+    def exists(p: Path) -> bool:
+        if sensors_manifest_path(p).exists():
+            return True
+        for label in device_labels:
+            fl = sensor_file_path(p, label)
+            if fl.exists() or manifest_path(fl).exists() or segment_path(fl, 1).exists():
+                return True
+        return False
+
+    counter = 0
+    unique_path = path
+    while exists(unique_path):
+        counter += 1
+        unique_path = path.with_name(f"{base}_{counter}{suffix}")
+    return unique_path
+
+
+def write_sensors_manifest(path: Path | str, sensors: list[tuple[int, str, Path]]) -> Path:
+    """writes the sensor manifest of a recording (path of the data file),
+    sensors: sensor_id, device_label and path of the data file (or segment
+    manifest) of each sensor. Returns the path of the manifest."""
+    manifest = sensors_manifest_path(path)
+    content = {"version": SENSORS_VERSION,
+               "sensors": [{"sensor_id": sensor_id, "device_label": label,
+                            "file": Path(fl).name}
+                           for sensor_id, label, fl in sensors]}
+    tmp = manifest.with_name(manifest.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fl:
+        json.dump(content, fl, indent=1)
+    os.replace(tmp, manifest)
+    return manifest
+
+
+def read_sensors_manifest(path: Path | str) -> dict:
+    """reads a sensor manifest (path of the manifest or of the data file)
+
+    The file names of the sensors are replaced by their full paths.
+    """
+    path = Path(path)
+    if not path.name.endswith(SENSORS_SUFFIX):
+        path = sensors_manifest_path(path)
+    with open(path, "r", encoding="utf-8") as fl:
+        manifest = json.load(fl)
+    for s in manifest["sensors"]:
+        s["file"] = path.parent / s["file"]
+    return manifest
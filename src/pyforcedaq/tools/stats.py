@@ -0,0 +1,205 @@
+"""Lightweight latency statistics
+
+LatencyHistogram counts durations in fixed buckets. The counts are stored in
+shared memory, so that a histogram that is filled in a child process can be
+read by the parent process. StageStats combines the histograms of the
+stages of a process (e.g. DAQ read, conversion, sinks of a sensor process)
+and counters of events (e.g. lost samples). ProcessCPU reads the CPU usage
+of a process from /proc (Linux only).
+"""
+
+import ctypes as ct
+import os
+from bisect import bisect_right
+from collections.abc import Sequence
+from multiprocessing import Array, Value
+from time import monotonic
+
+# upper bucket edges in milliseconds (last bucket: > 1000 ms)
+BUCKET_EDGES_MS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                   1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class LatencyHistogram:
+    """Histogram of durations with fixed buckets (see BUCKET_EDGES_MS)
+
+    Adding values is lock-free and intended for a single writer process.
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._edges = tuple(x / 1000 for x in BUCKET_EDGES_MS)  # seconds
+        self._counts = Array(ct.c_int64, len(self._edges) + 1, lock=False)
+        self._n_sum_max = Array(ct.c_double, 3, lock=False)
+
+    def add(self, duration: float) -> None:
+        """add a duration in seconds"""
+        self._counts[bisect_right(self._edges, duration)] += 1
+        self._n_sum_max[0] += 1
+        self._n_sum_max[1] += duration
+        self._n_sum_max[2] = max(self._n_sum_max[2], duration)
+
+    def reset(self) -> None:
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+        for i in range(3):
+            self._n_sum_max[i] = 0
+
+    @property
+    def n(self) -> int:
+        return int(self._n_sum_max[0])
+
+    @property
+    def mean(self) -> float:
+        if self._n_sum_max[0] == 0:
+            return 0.0
+        return self._n_sum_max[1] / self._n_sum_max[0]
+
+    @property
+    def max(self) -> float:
+        return self._n_sum_max[2]
+
+    def counts(self) -> list[int]:
+        return list(self._counts)
+
+    def percentile(self, p: float) -> float:
+        """upper bucket edge (in seconds) below which p percent of the values are"""
+        counts = self.counts()
+        n = sum(counts)
+        if n == 0:
+            return 0.0
+        cumulative = 0
+        for edge, cnt in zip(self._edges, counts):
+            cumulative += cnt
+            if cumulative >= n * p / 100:
+                return edge
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        """n, mean, p50, p99 and max in milliseconds"""
+        return {"n": self.n,
+                "mean_ms": self.mean * 1000,
+                "p50_ms": self.percentile(50) * 1000,
+                "p99_ms": self.percentile(99) * 1000,
+                "max_ms": self.max * 1000}
+
+    def __str__(self):
+        rtn = f"{self.name}: n={self.n}, mean={self.mean * 1000:.3f} ms, max={self.max * 1000:.3f} ms"
+        counts = self.counts()
+        lower = 0
+        for edge, cnt in zip(BUCKET_EDGES_MS + (float("inf"),), counts):
+            if cnt > 0:
+                rtn += f"\n  {lower:>7} - {edge:<7} ms: {cnt}"
+            lower = edge
+        return rtn
+
+
+class Counter:
+    """Counter in shared memory (single writer process)"""
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._value = Value(ct.c_int64, 0, lock=False)
+
+    def add(self, n: int = 1) -> None:
+        self._value.value += n
+
+    @property
+    def value(self) -> int:
+        return int(self._value.value)
+
+    def reset(self) -> None:
+        self._value.value = 0
+
+
+class StageStats:
+    """Latency histograms of the stages of a process
+
+    Stages have to be added before the process is started.
+    """
+
+    def __init__(self, name: str, stages: Sequence[str] = ()):
+        self.name = name
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.counters: dict[str, Counter] = {}
+        for stage in stages:
+            self.add_stage(stage)
+
+    def add_stage(self, stage: str, histogram: LatencyHistogram | None = None) -> LatencyHistogram:
+        """adds a stage (optionally with an existing histogram), returns the
+        histogram of the stage"""
+        if stage not in self.histograms:
+            if histogram is None:
+                histogram = LatencyHistogram(stage)
+            self.histograms[stage] = histogram
+        return self.histograms[stage]
+
+    def add_counter(self, name: str) -> Counter:
+        """adds a counter, returns the counter"""
+        if name not in self.counters:
+            self.counters[name] = Counter(name)
+        return self.counters[name]
+
+    def __getitem__(self, stage: str) -> LatencyHistogram:
+        return self.histograms[stage]
+
+    def reset(self) -> None:
+        for h in self.histograms.values():
+            h.reset()
+        for c in self.counters.values():
+            c.reset()
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """summaries of the stages (see LatencyHistogram.summary) and the
+        counters ({"count": value})"""
+        rtn: dict[str, dict[str, float]] = {stage: h.summary()
+                                            for stage, h in self.histograms.items()}
+        for name, c in self.counters.items():
+            rtn[name] = {"count": c.value}
+        return rtn
+
+    def __str__(self):
+        rtn = self.name
+        for stage, h in self.histograms.items():
+            if h.n > 0:
+                rtn += (f"\n  {stage:>20}: n={h.n}, mean={h.mean * 1000:.3f} ms, "
+                        f"p50<={h.percentile(50) * 1000:g} ms, p99<={h.percentile(99) * 1000:g} ms, "
+                        f"max={h.max * 1000:.3f} ms")
+        for name, c in self.counters.items():
+            rtn += f"\n  {name:>20}: {c.value}"
+        return rtn
+
+
+class ProcessCPU:
+    """CPU usage of a process (Linux: /proc/<pid>/stat)"""
+
+    def __init__(self, pid: int | None = None):
+        """pid: process id, default: the calling process"""
+        self.pid = os.getpid() if pid is None else pid
+        try:
+            self._ticks = os.sysconf("SC_CLK_TCK")
+        except (AttributeError, ValueError, OSError):
+            self._ticks = 100
+        self._last = (monotonic(), self._cpu_time())
+
+    def _cpu_time(self) -> float | None:
+        """user and system time of the process in seconds"""
+        try:
+            with open(f"/proc/{self.pid}/stat", "rb") as fl:
+                stat = fl.read()
+        except OSError:
+            return None
+        # fields after the command name (which might contain spaces),
+        # utime and stime are the fields 14 and 15
+        fields = stat[stat.rfind(b")") + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def usage(self) -> float | None:
+        """CPU usage since the last call in percent of one core, None if
+        not available"""
+        t, cpu = monotonic(), self._cpu_time()
+        last_t, last_cpu = self._last
+        self._last = (t, cpu)
+        if cpu is None or last_cpu is None or t <= last_t:
+            return None
+        return 100 * (cpu - last_cpu) / (t - last_t)
@@ -0,0 +1,83 @@
+"""Time index of data files
+
+The file writer writes a sparse index next to each data file (e.g.
+rec.csv.bz2.idx). Every index_interval samples, an entry maps the time of the
+next sample to the byte offset of its line in the file. In bz2 files, a new
+bz2 stream is started at each entry, thus the offset is the position of the
+stream in the compressed file and decompression can start there.
+
+Layout: magic b"FDAQIDX1", followed by the entries (ENTRY_DTYPE).
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"FDAQIDX1"
+ENTRY_DTYPE = np.dtype([("time", "<f8"), ("offset", "<i8"), ("sample", "<i8")])
+INDEX_SUFFIX = ".idx"
+
+
+def index_path(data_path: Path | str) -> Path:
+    """path of the time index of a data file"""
+    data_path = Path(data_path)
+    return data_path.with_name(data_path.name + INDEX_SUFFIX)
+
+
+class TimeIndexWriter:
+    """Writes the time index of a data file (used by the file writer)"""
+
+    def __init__(self, data_path: Path, interval: int, append_mode: bool = False):
+        """interval: number of samples between index entries"""
+        self.path = index_path(data_path)
+        if not (append_mode and self.path.exists()):
+            self.path.write_bytes(MAGIC)
+        self.interval = interval
+        self.n_samples = 0
+        self._next_entry = 0
+
+    def entry_required(self) -> bool:
+        """True, if an entry has to be written before the next samples"""
+        return self.n_samples >= self._next_entry
+
+    def add(self, time: float, offset: int, n_samples: int) -> None:
+        """adds an entry for the next samples (if required) and counts them"""
+        if self.entry_required():
+            entry = np.array([(time, offset, self.n_samples)], dtype=ENTRY_DTYPE)
+            with open(self.path, "ab") as fl:
+                fl.write(entry.tobytes())
+            self._next_entry = self.n_samples + self.interval
+        self.n_samples += n_samples
+
+    def close(self) -> None:
+        pass  # the index file is closed after each entry
+
+
+def read_index(data_path: Path | str) -> np.ndarray | None:
+    """reads the time index of a data file, None if there is no index
+
+    Entries that point behind the end of the data file (not yet written
+    data) are skipped.
+    """
+    path = index_path(data_path)
+    if not path.exists():
+        return None
+    raw = path.read_bytes()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a pyForceDAQ time index")
+    n = (len(raw) - len(MAGIC)) // ENTRY_DTYPE.itemsize
+    index = np.frombuffer(raw, dtype=ENTRY_DTYPE, count=n, offset=len(MAGIC))
+    return index[index["offset"] < Path(data_path).stat().st_size]
+
+
+def window_offsets(index: np.ndarray, t0: float, t1: float) -> tuple[int, int | None]:
+    """byte range of the data file (start, end) that contains all samples
+    between t0 and t1 (end None: end of file)
+
+    As blocks of several sensors might be written slightly out of order, the
+    range starts one entry earlier and ends one entry later than necessary.
+    """
+    i = max(0, int(np.searchsorted(index["time"], t0, side="right")) - 2)
+    j = int(np.searchsorted(index["time"], t1, side="right")) + 1
+    end = int(index["offset"][j]) if j < len(index) else None
+    return int(index["offset"][i]), end
@@ -0,0 +1,261 @@
+"""Bounded queue for file writer processes
+
+WriterQueue keeps the number of items in memory below a high-water mark.
+Items that are put while the queue is at the high-water mark are spilled to
+disk: a spill thread of the producer process appends the pickled item to a
+spill file and queues only a small reference, so that the order of the items
+is preserved. Pickling and writing do thus not delay the producer (e.g. the
+sensor loop). The consumer (the file writer) loads spilled items when it
+reaches them. If the disk is slower than the producer and more than
+max_spill_pending items wait for the spill thread, further items are dropped
+and counted (stats "dropped").
+
+Queue depth and lag (time between put and get) are shared between the
+processes, see stats(). Optionally, the waiting times of all items are
+counted in a LatencyHistogram (wait_stats).
+"""
+
+import ctypes as ct
+import itertools
+import logging
+import os
+import pickle
+import queue
+import shutil
+import tempfile
+import threading
+from multiprocessing import Array, Lock, Queue, RawValue
+from multiprocessing.util import Finalize
+from pathlib import Path
+
+from .clock import local_clock
+from .stats import LatencyHistogram
+
+# indices of the shared stats
+_MAX_DEPTH, _N_SPILLED, _LAG, _MAX_LAG, _LAST_GET, _N_DROPPED = range(6)
+_queue_ids = itertools.count()  # default spill folders of the queues of a process
+
+logger = logging.getLogger()
+
+
+class _Spilled:
+    """reference to a spilled item"""
+    __slots__ = ("offset", "path", "size")
+
+    def __init__(self, path: str, offset: int, size: int):
+        self.path = path
+        self.offset = offset
+        self.size = size
+
+
+class _SpillThread(threading.Thread):
+    """spills items in a thread of the producer process
+
+    While items are pending in the thread, all items of the process are
+    passed through the thread to preserve their order.
+    """
+
+    def __init__(self, writer_queue: "WriterQueue"):
+        super().__init__(name="WriterQueueSpill", daemon=True)
+        self._writer_queue = writer_queue
+        self._items = queue.Queue(maxsize=writer_queue.max_spill_pending)
+        self._lock = threading.Lock()
+        self.pending = 0  # items not yet in the writer queue
+        self._fd: int | None = None  # spill file
+        self._path = ""
+        self._offset = 0
+
+    def put(self, t: float, item, spill: bool) -> bool:
+        """False, if the item has been dropped, because too many items wait
+        for the thread"""
+        with self._lock:
+            self.pending += 1
+        try:
+            self._items.put_nowait((t, item, spill))
+        except queue.Full:
+            with self._lock:
+                self.pending -= 1
+            return False
+        return True
+
+    def close(self) -> None:
+        """puts the pending items into the writer queue and stops the thread"""
+        self._items.put(None)
+        self.join()
+
+    def run(self):
+        while True:
+            x = self._items.get()
+            if x is None:
+                break
+            t, item, spill = x
+            if spill:
+                item = self._spill(item)
+            self._writer_queue._queue.put((t, item))
+            with self._lock:
+                self.pending -= 1
+        if self._fd is not None:
+            os.close(self._fd)
+
+    def _spill(self, item) -> _Spilled:
+        if self._fd is None:
+            spill_dir = self._writer_queue.spill_dir
+            spill_dir.mkdir(parents=True, exist_ok=True)
+            self._path = str(spill_dir / f"{os.getpid()}.spill")
+            # unbuffered, the consumer reads the items immediately
+            self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND |
+                               getattr(os, "O_BINARY", 0))
+            self._offset = os.lseek(self._fd, 0, os.SEEK_END)
+            logger.warning("Writer queue full, spilling to %s", self._path)
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self._offset
+        view = memoryview(data)
+        while len(view) > 0:
+            view = view[os.write(self._fd, view):]
+        self._offset += len(data)
+        self._writer_queue._count_spilled()
+        return _Spilled(self._path, offset, len(data))
+
+
+class WriterQueue:
+    """Bounded multi-producer, single-consumer queue with spill-to-disk
+
+    The interface (put, get, get_nowait) is compatible with
+    multiprocessing.Queue.
+    """
+
+    LOG_INTERVAL = 10.0  # seconds between lag warnings
+
+    def __init__(self, high_water: int = 1000, lag_warning: float = 5.0,
+                 spill_dir: str | Path | None = None, max_spill_pending: int = 1000):
+        """
+        Parameters
+        ----------
+        high_water: int
+            maximum number of items in memory
+        lag_warning: float
+            the consumer logs a warning, if items are older than lag_warning
+            seconds when they are taken from the queue
+        spill_dir: Path, optional
+            folder for the spill files (default: temporary folder of the
+            queue, which is removed by remove_spill_files)
+        max_spill_pending: int
+            maximum number of items waiting for the spill thread of a
+            producer, further items are dropped
+        """
+
+        if spill_dir is None:
+            spill_dir = Path(tempfile.gettempdir()) / \
+                f"pyforcedaq_spill_{os.getpid()}_{next(_queue_ids)}"
+        self.spill_dir = Path(spill_dir)
+        self.high_water = high_water
+        self.lag_warning = lag_warning
+        self.max_spill_pending = max_spill_pending
+        self._queue = Queue()
+        self._lock = Lock()
+        self._depth = RawValue(ct.c_int64, 0)
+        self._stats = Array(ct.c_double, 6, lock=False)
+        self.wait_stats: LatencyHistogram | None = None  # set before the consumer starts
+        # process local
+        self._spill_thread: _SpillThread | None = None
+        self._spill_pid = None
+        self._last_warning = 0.0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_spill_thread"] = None
+        return state
+
+    @property
+    def depth(self) -> int:
+        """number of items in the queue (incl. spilled items)"""
+        return self._depth.value
+
+    @property
+    def lag(self) -> float:
+        """age of the last item taken from the queue in seconds (grows while
+        items are waiting and the consumer does not take them)"""
+        lag = self._stats[_LAG]
+        if self._depth.value > 0 and self._stats[_LAST_GET] > 0:
+            lag += local_clock() - self._stats[_LAST_GET]
+        return lag
+
+    def stats(self) -> dict[str, float]:
+        return {"depth": self.depth,
+                "max_depth": int(self._stats[_MAX_DEPTH]),
+                "spilled": int(self._stats[_N_SPILLED]),
+                "dropped": int(self._stats[_N_DROPPED]),
+                "lag": self.lag,
+                "max_lag": self._stats[_MAX_LAG]}
+
+    def put(self, item) -> None:
+        with self._lock:
+            depth = self._depth.value + 1
+            self._depth.value = depth
+            self._stats[_MAX_DEPTH] = max(self._stats[_MAX_DEPTH], depth)
+        t = local_clock()
+        spill = depth > self.high_water
+        if spill or self._spill_thread_pending():
+            if not self._get_spill_thread().put(t, item, spill):
+                self._drop()
+        else:
+            self._queue.put((t, item))
+
+    def _drop(self) -> None:
+        with self._lock:
+            self._depth.value -= 1
+            self._stats[_N_DROPPED] += 1
+            first = self._stats[_N_DROPPED] == 1
+        if first:
+            logger.warning("Writer queue: spilling is too slow, dropping items")
+
+    def _spill_thread_pending(self) -> bool:
+        return self._spill_thread is not None and self._spill_pid == os.getpid() \
+            and self._spill_thread.pending > 0
+
+    def _get_spill_thread(self) -> _SpillThread:
+        if self._spill_thread is None or self._spill_pid != os.getpid():
+            self._spill_pid = os.getpid()
+            self._spill_thread = _SpillThread(self)
+            self._spill_thread.start()
+            # pending items are put before the feeder thread of the queue is
+            # joined at process exit (exitpriority of the queue: -5)
+            Finalize(self._spill_thread, self._spill_thread.close, exitpriority=10)
+        return self._spill_thread
+
+    def _count_spilled(self) -> None:
+        with self._lock:
+            self._stats[_N_SPILLED] += 1
+
+    @staticmethod
+    def _load(ref: _Spilled):
+        with open(ref.path, "rb") as fl:
+            fl.seek(ref.offset)
+            return pickle.loads(fl.read(ref.size))
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        """removes and returns an item (consumer only). Raises queue.Empty"""
+        t, item = self._queue.get(block, timeout)
+        with self._lock:
+            self._depth.value -= 1
+        now = local_clock()
+        lag = now - t
+        self._stats[_LAG] = lag
+        self._stats[_LAST_GET] = now
+        self._stats[_MAX_LAG] = max(self._stats[_MAX_LAG], lag)
+        if self.wait_stats is not None:
+            self.wait_stats.add(lag)
+        if lag > self.lag_warning and now - self._last_warning > WriterQueue.LOG_INTERVAL:
+            self._last_warning = now
+            logger.warning("File writer lags %.1f s behind (queue depth %d)",
+                           lag, self._depth.value)
+        if isinstance(item, _Spilled):
+            item = self._load(item)
+        return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def remove_spill_files(self) -> None:
+        """removes all spill files (consumer only)"""
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,129 @@
+"""Reader for recorded data files"""
+
+import numpy as np
+
+from pyforcedaq import analysis
+from pyforcedaq.lib.sensor import SensorDataWriter
+from pyforcedaq.lib.settings import RecordingSettings
+from pyforcedaq.lib.types import ChannelMask, ForceSensorBlock
+from pyforcedaq.tools.sensor_files import sensor_file_path, write_sensors_manifest
+
+
+def _record(path, n_blocks=20, block_size=50, **settings):
+    rs = RecordingSettings(sensors=[{"device_label": "Dev1", "channels": "ai0:7",
+                                     "calibration_file_name": "a.cal"},
+                                    {"device_label": "Dev2", "channels": "ai0:7",
+                                     "calibration_file_name": "b.cal"}],
+                           **settings)
+    writer = SensorDataWriter(rs, filepath=path)
+    mask = ChannelMask.from_settings(rs)
+    writer.start()
+    writer.queue.put("Recorded at ...\n")
+    writer.queue.put("time,device_tag,Fx,Fy,Fz\n")
+    for i in range(n_blocks):
+        for sensor_id in (1, 2):
+            t = (i * block_size + np.arange(block_size)) / 1000
+            forces = np.repeat(t[:, None] * sensor_id, 6, axis=1)
+            writer.queue.put(mask.apply(ForceSensorBlock(
+                times=t, forces=forces, trigger=np.zeros((block_size, 2)),
+                sensor_id=sensor_id)))
+    writer.join()
+
+
+def test_load_sensors(tmp_path):
+    path = tmp_path / "rec.csv.bz2"
+    _record(path)
+    info = analysis.read_info(path)
+    assert info.columns == ["time", "device_tag", "Fx", "Fy", "Fz"]
+    assert info.comments == ["Recorded at ..."]
+
+    chunks = list(analysis.iter_chunks(path, chunk_size=1000))
+    assert len(chunks) > 1
+    assert sum(len(c) for c in chunks) == 2000
+
+    sensors = analysis.load_sensors(path)
+    assert sorted(sensors) == [1, 2]
+    for sensor_id, data in sensors.items():
+        np.testing.assert_allclose(data["time"], np.arange(1000) / 1000)
+        np.testing.assert_allclose(data["Fz"], data["time"] * sensor_id, atol=1e-6)
+
+
+def test_load_segments(tmp_path):
+    path = tmp_path / "rec.csv"
+    _record(path, segment_duration=0.2)
+    data = analysis.load(tmp_path / "rec.manifest.json", t0=0.25, t1=0.5)
+    assert data["time"].min() == 0.25
+    assert data["time"].max() == 0.5
+    assert len(data) == 2 * 251
+
+
+def test_read_window(tmp_path):
+    for suffix in (".csv", ".csv.bz2"):
+        path = tmp_path / f"rec{suffix}"
+        _record(path, n_blocks=100, index_interval=500)  # 10000 samples
+        data = analysis.read_window(path, 2.0, 2.25)
+        expected = analysis.load(path, t0=2.0, t1=2.25)
+        assert len(data) == 2 * 251
+        np.testing.assert_array_equal(np.sort(data, order=["time", "device_tag"]),
+                                      np.sort(expected, order=["time", "device_tag"]))
+        assert analysis.read_window(path, 10, 11).size == 0
+
+
+def test_overview(tmp_path):
+    path = tmp_path / "rec.csv"
+    _record(path, n_blocks=100, pyramid_bins=[0.01, 0.1, 1.0])  # 5 s
+    data = analysis.load_sensors(path)[2]
+    width, bins = analysis.overview(path, max_bins=100)
+    assert width == 0.1
+    bins = bins[bins["sensor_id"] == 2]
+    assert len(bins) == 50
+    assert bins["n"].sum() == len(data)
+    fz = data["Fz"].reshape(50, 100)
+    np.testing.assert_allclose(bins["min"][:, 2], fz.min(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(bins["mean"][:, 2], fz.mean(axis=1), rtol=1e-6)
+    np.testing.assert_allclose(bins["max"][:, 2], fz.max(axis=1), rtol=1e-6)
+
+    width, bins = analysis.overview(path, t0=1.0, t1=1.5, max_bins=100)  # zoom
+    assert width == 0.01
+    assert bins["time"].min() == 1.0
+
+
+def test_load_sensor_files(tmp_path):
+    rs = RecordingSettings(sensors=[{"device_label": "Dev1", "channels": "ai0:7",
+                                     "calibration_file_name": "a.cal"},
+                                    {"device_label": "Dev2", "channels": "ai0:7",
+                                     "calibration_file_name": "b.cal"}],
+                           writer_per_sensor=True, index_interval=200)
+    path = tmp_path / "rec.csv.bz2"
+    files = []
+    for sensor in rs.get_sensor_settings(tmp_path):
+        files.append((sensor.sensor_id, sensor.device_label,
+                      sensor_file_path(path, sensor.device_label)))
+        writer = SensorDataWriter(rs, filepath=files[-1][2], sensor=sensor)
+        writer.start()
+        writer.queue.put("time,Fx,Fy,Fz\n")
+        for i in range(20):
+            # different block sizes and a time offset of the second sensor
+            n = 50 * sensor.sensor_id
+            t = (i * n + np.arange(n) + sensor.sensor_id - 1) / 1000
+            forces = np.repeat(t[:, None] * sensor.sensor_id, 6, axis=1)
+            writer.queue.put(ChannelMask.from_settings(rs).apply(ForceSensorBlock(
+                times=t, forces=forces, trigger=np.zeros((n, 2)),
+                sensor_id=sensor.sensor_id)))
+        writer.join()
+    manifest = write_sensors_manifest(path, files)
+    assert manifest.name == "rec.sensors.json"
+    assert analysis.read_info(files[0][2]).columns == ["time", "Fx", "Fy", "Fz"]
+    assert analysis.read_info(manifest).columns == ["time", "device_tag", "Fx", "Fy", "Fz"]
+
+    chunks = list(analysis.iter_chunks(manifest, chunk_size=1000))
+    assert len(chunks) > 1
+    data = np.concatenate(chunks)
+    assert len(data) == 1000 + 2000
+    assert np.all(np.diff(data["time"]) >= 0)
+    sensors = analysis.load_sensors(manifest)
+    np.testing.assert_allclose(sensors[1]["time"], np.arange(1000) / 1000)
+    np.testing.assert_allclose(sensors[2]["Fz"], (np.arange(2000) + 1) / 1000 * 2, atol=1e-6)
+
+    window = analysis.read_window(manifest, 0.5, 0.6)
+    np.testing.assert_array_equal(window, analysis.load(manifest, t0=0.5, t1=0.6))
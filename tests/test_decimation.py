@@ -0,0 +1,78 @@
+"""Anti-aliased decimation of sensor blocks"""
+
+import numpy as np
+import pytest
+
+from pyforcedaq.lib.decimation import Decimator
+from pyforcedaq.lib.types import ForceSensorBlock
+from pyforcedaq.tools.filters import SOSFilter
+
+
+def _blocks(n, block_sizes, rng):
+    times = np.arange(n) / 5000
+    forces = rng.normal(size=(n, 6))
+    trigger = np.zeros((n, 2))
+    trigger[[3, 17, 18, 999], 0] = [1, 2, 3, 4]
+    start = 0
+    for size in block_sizes:
+        yield ForceSensorBlock(times=times[start:start + size], forces=forces[start:start + size],
+                               trigger=trigger[start:start + size], sensor_id=1)
+        start += size
+
+
+def test_decimation_equals_offline():
+    rng = np.random.default_rng(2)
+    block_sizes = rng.integers(0, 40, 200)
+    n = int(block_sizes.sum())
+    dec = Decimator(5000, 500)
+    out = [dec.process(b) for b in _blocks(n, block_sizes, np.random.default_rng(3))]
+    ref = next(_blocks(n, [n], np.random.default_rng(3)))
+    offline = SOSFilter(dec._filter.sos, 6).process(ref.forces)[::10]  # type: ignore
+
+    assert np.allclose(np.concatenate([b.times for b in out]), ref.times[::10])
+    assert np.allclose(np.concatenate([b.forces for b in out]), offline)
+    # trigger are moved to the next kept sample, the largest value per
+    # kept sample
+    trigger = np.concatenate([b.trigger for b in out])[:, 0]
+    assert list(trigger[trigger != 0]) == [1, 3, 4]
+    assert list(np.flatnonzero(trigger)) == [1, 2, 100]
+
+
+def test_trigger_after_last_kept_sample():
+    trigger = np.zeros((50, 2))
+    trigger[22, 0] = 5
+    trigger[[21, 23], 1] = [6, 7]
+    blocks = [ForceSensorBlock(times=np.arange(k, k + 25) / 5000, forces=np.zeros((25, 6)),
+                               trigger=trigger[k:k + 25], sensor_id=1) for k in (0, 25)]
+    dec = Decimator(5000, 500)
+    out = np.concatenate([dec.process(b).trigger for b in blocks])  # samples 0, 10, ..., 40
+    assert list(out[:, 0]) == [0, 0, 0, 5, 0]
+    assert list(out[:, 1]) == [0, 0, 0, 7, 0]
+
+
+def test_constant_trigger():
+    # analog trigger inputs are nonzero on every sample
+    dec = Decimator(5000, 500)
+    for k in range(100):
+        block = ForceSensorBlock(times=np.arange(k * 50, (k + 1) * 50) / 5000,
+                                 forces=np.zeros((50, 6)), trigger=np.full((50, 2), 0.3),
+                                 sensor_id=1)
+        out = dec.process(block)
+        assert len(out.trigger) == 5
+        assert np.all(out.trigger == 0.3)
+    assert dec._carry is None or dec._carry.shape == (2,)
+
+
+def test_anti_aliasing():
+    t = np.arange(5000) / 5000
+    forces = np.repeat(np.sin(2 * np.pi * 490 * t)[:, None], 6, axis=1)  # aliases to 10 Hz
+    block = ForceSensorBlock(times=t, forces=forces, trigger=np.zeros((5000, 2)))
+    out = Decimator(5000, 500).process(block)
+    assert np.abs(out.forces[100:]).max() < 0.05
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        Decimator(1000, 300)
+    assert Decimator(1000, 1000).factor == 1
+    assert type(Decimator(1000.0, 100.0).factor) is int
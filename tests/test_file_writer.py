@@ -0,0 +1,80 @@
+"""Buffered output of the file writer"""
+
+import bz2
+import ctypes as ct
+from multiprocessing import Array
+
+import numpy as np
+import pytest
+
+from pyforcedaq.lib.sensor import SensorDataWriter
+from pyforcedaq.lib.settings import RecordingSettings
+from pyforcedaq.lib.types import ChannelMask, ForceSensorBlock
+from pyforcedaq.tools.file_writer import BufferedOutput, SourcePaused
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.bz2"])
+def test_buffered_output(tmp_path, suffix):
+    path = tmp_path / f"data{suffix}"
+    stats = Array(ct.c_double, 5, lock=False)
+    out = BufferedOutput(path, buffer_size=1 << 16, stats=stats)
+    lines = [f"{i},{i * 0.5:.6f},{-i:.6f}\n".encode() for i in range(100_000)]
+    for line in lines:
+        out.write(line)
+    out.write(b"x" * (1 << 17))  # larger than the buffer
+    out.flush()
+    n_writes = stats[0]
+    out.close()
+
+    expected = b"".join(lines) + b"x" * (1 << 17)
+    if suffix == ".csv":
+        assert path.read_bytes() == expected
+        assert n_writes <= len(expected) / (1 << 16) + 2
+    else:
+        assert bz2.decompress(path.read_bytes()) == expected
+    assert stats[1] == path.stat().st_size
+
+
+def _block(t: np.ndarray, rs: RecordingSettings) -> ForceSensorBlock:
+    """block with the written channels (as from the sensor process)"""
+    n = len(t)
+    return ChannelMask.from_settings(rs).apply(
+        ForceSensorBlock(times=t, forces=np.zeros((n, 6)), trigger=np.zeros((n, 2)),
+                         sensor_id=1))
+
+
+def test_sequential_files(tmp_path):
+    writer = SensorDataWriter(RecordingSettings())
+    writer.start()
+    paths = [tmp_path / "a.csv", tmp_path / "b.csv"]
+    for k, path in enumerate(paths):
+        writer.open_file(path)
+        writer.queue.put("time,Fx,Fy,Fz\n")
+        t = k + np.arange(10) / 1000
+        writer.queue.put(_block(t, RecordingSettings()))
+    writer.close_file(wait=True)
+    assert not writer.is_open
+    assert writer.is_alive()  # same process for both files
+    writer.queue.put("discarded, no open file\n")
+    writer.join()
+
+    for k, path in enumerate(paths):
+        lines = path.read_text().splitlines()
+        assert lines[0] == "time,Fx,Fy,Fz"
+        assert len(lines) == 11
+        assert float(lines[1].split(",")[0]) == k
+
+
+def test_close_waits_for_sources(tmp_path):
+    writer = SensorDataWriter(RecordingSettings())
+    writer.start()
+    path = tmp_path / "a.csv"
+    writer.open_file(path, header=["time,Fx,Fy,Fz\n"])
+    writer.close_file(paused={1: 1}, wait=False)
+    # data of source 1 arrive after the close request
+    t = np.arange(10) / 1000
+    writer.queue.put(_block(t, RecordingSettings()))
+    writer.queue.put(SourcePaused(source=1, request=1))
+    writer.wait_done()
+    writer.join()
+    assert len(path.read_text().splitlines()) == 11
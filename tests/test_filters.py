@@ -0,0 +1,68 @@
+"""Block-wise online filters"""
+
+import numpy as np
+import pytest
+
+from pyforcedaq.tools.filters import (
+    SOSFilter,
+    butter_lowpass_sos,
+    make_filter,
+    notch_sos,
+)
+
+
+def _sosfilt(sos, x):
+    """offline reference: direct form II transposed, sample by sample"""
+    y = np.array(x, dtype=float)
+    for b0, b1, b2, a0, a1, a2 in sos / sos[:, 3:4]:
+        s1 = s2 = np.zeros(x.shape[1])
+        for i, xi in enumerate(y):
+            yi = b0 * xi + s1
+            s1 = b1 * xi - a1 * yi + s2
+            s2 = b2 * xi - a2 * yi
+            y[i] = yi
+        y = y.copy()
+    return y
+
+
+def _gain(sos, freq, rate):
+    z = np.exp(-2j * np.pi * freq / rate)
+    h = [(b0 + b1 * z + b2 * z ** 2) / (a0 + a1 * z + a2 * z ** 2)
+         for b0, b1, b2, a0, a1, a2 in sos]
+    return abs(np.prod(h))
+
+
+@pytest.mark.parametrize("order", [1, 2, 3, 4])
+def test_butterworth(order):
+    sos = butter_lowpass_sos(20, 1000, order)
+    assert _gain(sos, 0, 1000) == pytest.approx(1)
+    assert _gain(sos, 20, 1000) == pytest.approx(1 / np.sqrt(2))
+    assert _gain(notch_sos(50, 1000), 50, 1000) < 1e-10
+
+
+@pytest.mark.parametrize("spec", ["lowpass:20:3", "notch:50,lowpass:20:4", "fir:30:51"])
+def test_block_filter_equals_offline(spec):
+    rate = 1000
+    x = np.random.default_rng(0).normal(size=(3000, 3))
+    offline = make_filter(spec, rate, 3).process(x)
+    online = make_filter(spec, rate, 3)
+    blocks = np.split(x, [1, 7, 100, 101, 1500, 1563, 2999])
+    y = np.concatenate([online.process(b) for b in blocks])
+    np.testing.assert_allclose(y, offline, atol=1e-10)
+    if spec.startswith("lowpass"):
+        sos = butter_lowpass_sos(20, rate, 3)
+        np.testing.assert_allclose(y, _sosfilt(sos, x), atol=1e-10)
+    if spec.startswith("fir"):
+        taps = online.taps
+        ref = np.column_stack([np.convolve(x[:, c], taps)[:len(x)] for c in range(3)])
+        np.testing.assert_allclose(y, ref, atol=1e-10)
+
+
+def test_invalid_spec():
+    assert make_filter("", 1000) is None
+    with pytest.raises(ValueError):
+        make_filter("lowpass", 1000)
+    with pytest.raises(ValueError):
+        make_filter("lowpass:600", 1000)
+    with pytest.raises(ValueError):
+        make_filter("bandpass:10", 1000)
@@ -0,0 +1,88 @@
+"""Loopback test of the binary force stream
+
+A ForceStreamClient subscribes at the UDP server with a decimation and
+receives the force blocks sent by a ForceStreamSender (as in a sensor
+process). Run `pytest -s tests/test_force_stream.py` to see the results.
+"""
+
+import numpy as np
+
+from pyforcedaq.lib.force_stream import (
+    MAX_SAMPLES_PER_PACKET,
+    ForceStreamClient,
+    ForceStreamSender,
+    ForceStreamSubscribers,
+    pack_force_packets,
+    unpack_force_packet,
+)
+from pyforcedaq.lib.types import ForceSensorBlock
+from pyforcedaq.lib.udp_connection import UDPConnectionProcess
+from pyforcedaq.tools.clock import local_clock
+
+IP = "127.0.0.1"
+PORT = 5106
+RATE = 1000
+
+
+def _block(start: int, n: int, sensor_id: int = 0) -> ForceSensorBlock:
+    k = np.arange(start, start + n)
+    forces = np.repeat(k[:, None], 6, axis=1).astype(np.float64)
+    return ForceSensorBlock(times=k / RATE, forces=forces,
+                            trigger=np.zeros((n, 2)), sensor_id=sensor_id)
+
+
+def test_packet_layout():
+    block = _block(0, 100)
+    packets = pack_force_packets(3, 7, block.times, block.forces)
+    assert len(packets) == 3  # 40 + 40 + 20 samples
+    sensor_id, seq, samples = unpack_force_packet(packets[2])
+    assert (sensor_id, seq, len(samples)) == (3, 9, 100 - 2 * MAX_SAMPLES_PER_PACKET)
+    np.testing.assert_array_equal(samples["time"], block.times[80:])
+    np.testing.assert_array_equal(samples["forces"], block.forces[80:])
+
+
+def test_force_stream_loopback():
+    subscribers = ForceStreamSubscribers()
+    udp_p = UDPConnectionProcess(ip=IP, udp_port=PORT, force_stream=subscribers)
+    udp_p.start()
+
+    decimation = 10
+    client = ForceStreamClient(IP, udp_port=PORT, decimation=decimation, ip=IP)
+    for _ in range(20):  # server process might not be ready yet
+        if client.subscribe(timeout=0.2):
+            break
+    else:
+        raise TimeoutError("Can't subscribe to force stream")
+    assert len(subscribers) == 1
+
+    # sensor side: blocks of varying size
+    sender = ForceStreamSender(subscribers, sensor_id=1)
+    n_samples = 0
+    t0 = local_clock()
+    for n in [1, 7, 13, 50, 99, 3] * 50:
+        sender.send(_block(n_samples, n, sensor_id=1))
+        n_samples += n
+    duration = local_clock() - t0
+
+    received = []
+    while sum(len(x) for x in received) < n_samples // decimation:
+        packet = client.receive(timeout=2)
+        assert packet is not None
+        sensor_id, samples = packet
+        assert sensor_id == 1
+        received.append(samples)
+    received = np.concatenate(received)
+    print(f"\n{n_samples} samples sent in {duration * 1000:.1f} ms, "
+          f"{client.received_packets} packets received")
+
+    # every n-th sample, across block borders
+    expected = np.arange(0, n_samples, decimation)
+    np.testing.assert_array_equal(received["forces"][:, 0], expected)
+    np.testing.assert_allclose(received["time"], expected / RATE)
+    assert client.lost_packets == {}
+
+    assert client.unsubscribe()
+    assert len(subscribers) == 0
+    udp_p.quit()
+    sender.close()
+    client.close()
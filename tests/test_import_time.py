@@ -0,0 +1,56 @@
+"""Import time benchmark based on `python -X importtime`
+
+Hardware, GUI and network dependencies have to be loaded lazily on first use.
+Run `pytest -s tests/test_import_time.py` to see the import times.
+"""
+
+import subprocess
+import sys
+
+LAZY_DEPENDENCIES = ("nidaqmx", "atiiaftt", "expyriment", "pygame", "PySimpleGUI")
+
+
+def import_times(module: str) -> dict[str, int]:
+    """returns the cumulative import time (in microseconds) of all modules
+    that are imported by `import module` in a fresh interpreter"""
+
+    rtn = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in rtn.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        try:
+            times[name.strip()] = int(cumulative)
+        except ValueError:
+            pass  # header line
+    return times
+
+
+def test_lazy_dependencies():
+    for module in (
+        "pyforcedaq.lib",
+        "pyforcedaq.lib.data_recorder",
+        "pyforcedaq.__main__",
+        "pyforcedaq.headless",
+    ):
+        times = import_times(module)
+        print(f"\n{module}: {times[module] / 1000:.1f} ms")
+        for dependency in LAZY_DEPENDENCIES:
+            assert dependency not in times, f"{module} imports {dependency}"
+
+
+def test_no_logging_on_import():
+    rtn = subprocess.run(
+        [sys.executable, "-c",
+         "import logging, pyforcedaq.lib; print(len(logging.getLogger().handlers))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert rtn.stdout.strip() == "0"
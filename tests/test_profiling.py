@@ -0,0 +1,46 @@
+"""Profiling of the recording processes"""
+
+from multiprocessing import Process
+
+import pytest
+
+from pyforcedaq.tools import profiling
+
+
+def busy_loop(n):
+    # pure Python work: no calls that would get the self time
+    x = 0
+    for i in range(n):
+        x += i * i
+    return x
+
+
+class BusyProcess(Process):
+
+    def __init__(self):
+        super().__init__()
+        self.profiler = None
+
+    @profiling.profiled
+    def run(self):
+        busy_loop(2_000_000)
+
+
+@pytest.mark.parametrize("mode", profiling.MODES)
+def test_profiled_process(tmp_path, mode):
+    p = BusyProcess()
+    p.profiler = profiling.ProcessProfiler(mode, "busy", tmp_path)
+    p.start()
+    p.join()
+
+    files = list(tmp_path.iterdir())
+    assert len(files) == 1 and files[0].name.startswith(f"busy_{p.pid}")
+    func, self_time, _ = profiling.hot_functions(files[0], top=1)[0]
+    assert "busy_loop" in func
+    assert self_time > 0
+    assert "busy_loop" in profiling.summary(tmp_path)
+
+
+def test_invalid_mode(tmp_path):
+    with pytest.raises(ValueError):
+        profiling.ProcessProfiler("gprof", "busy", tmp_path)
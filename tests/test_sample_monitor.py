@@ -0,0 +1,48 @@
+"""Detection of sample loss and DAQ backlog"""
+
+import numpy as np
+
+from pyforcedaq import analysis
+from pyforcedaq.lib.sample_monitor import SampleGap, SampleMonitor
+from pyforcedaq.tools.stats import StageStats
+
+
+def test_gap_and_backlog():
+    stats = StageStats("Sensor", [])
+    monitor = SampleMonitor(1000, stats=stats)
+    monitor.start(0.0)
+    assert monitor.update(100, complete=True, time=0.1) == (0, 0)
+    # stalled loop: the buffer is read in several parts
+    assert monitor.update(1000, complete=False, time=1.6) == (0, 0)
+    assert monitor.update(500, complete=True, time=1.6) == (0, 0)
+    assert monitor.n_lost == 0
+    # buffer overrun: 400 samples lost
+    assert monitor.update(1000, complete=False, time=3.0) == (0, 0)
+    assert monitor.update(0, complete=True, time=3.0) == (400, 0)
+    assert monitor.update(10, complete=True, time=3.01) == (0, 0)
+
+    summary = stats.summary()
+    assert summary["gaps"]["count"] == 1
+    assert summary["lost_samples"]["count"] == 400
+    assert summary["daq_backlog"]["max_ms"] >= 1400
+
+
+def test_gap_in_sample_times():
+    monitor = SampleMonitor(1000)
+    monitor.start(0.0)
+    times = np.arange(1, 101) / 1000
+    assert monitor.update(100, True, 0.1, times) == (0, 0)
+    times = np.r_[np.arange(101, 111), np.arange(131, 141)] / 1000
+    assert monitor.update(20, True, 0.14, times) == (20, 10)
+    times = np.arange(200, 210) / 1000  # gap between the blocks
+    assert monitor.update(10, True, 0.21, times) == (59, 0)
+    assert monitor.n_lost == 79
+
+
+def test_gap_comment_is_skipped_by_reader(tmp_path):
+    path = tmp_path / "rec.csv"
+    gap = SampleGap(device_label="Dev1", sensor_id=1, time=0.5, n_lost=3)
+    with open(path, "w") as fl:
+        fl.write("time,Fx\n0.1,1.0\n0.2,2.0\n" + gap.comment() + "\n0.5,5.0\n")
+    data = analysis.load(path)
+    np.testing.assert_allclose(data["time"], [0.1, 0.2, 0.5])
@@ -0,0 +1,44 @@
+"""Segmented data files"""
+
+import bz2
+
+import numpy as np
+
+from pyforcedaq.lib.sensor import SensorDataWriter
+from pyforcedaq.lib.settings import RecordingSettings
+from pyforcedaq.lib.types import ChannelMask, ForceSensorBlock
+from pyforcedaq.tools.segments import read_manifest, segment_path, select_segments
+
+
+def test_segment_rotation(tmp_path):
+    rs = RecordingSettings(segment_duration=1.0)
+    path = tmp_path / "rec.csv.bz2"
+    writer = SensorDataWriter(rs, filepath=path)
+    mask = ChannelMask.from_settings(rs)
+    writer.start()
+    writer.queue.put("header\n")
+    writer.queue.put("time,Fx,Fy,Fz\n")
+    n_blocks, block_size = 35, 100  # 3.5 s at 1000 Hz
+    for i in range(n_blocks):
+        t = (i * block_size + np.arange(block_size)) / 1000
+        writer.queue.put(mask.apply(ForceSensorBlock(
+            times=t, forces=np.zeros((block_size, 6)),
+            trigger=np.zeros((block_size, 2)), sensor_id=1)))
+    writer.join()
+
+    manifest = read_manifest(path)
+    assert manifest["complete"]
+    segments = manifest["segments"]
+    assert len(segments) == 4
+    assert sum(s["n_samples"] for s in segments) == n_blocks * block_size
+    for k, seg in enumerate(segments):
+        assert seg["file"] == segment_path(path, k + 1)
+        assert seg["closed"]
+        with bz2.open(seg["file"], "rt") as fl:
+            lines = fl.read().splitlines()
+        assert lines[:2] == ["header", "time,Fx,Fy,Fz"]  # each segment has the header
+        assert len(lines) - 2 == seg["n_samples"]
+        assert float(lines[2].split(",")[0]) == seg["first_time"]
+        assert float(lines[-1].split(",")[0]) == seg["last_time"]
+
+    assert select_segments(path, 1.5, 2.2) == [segments[1]["file"], segments[2]["file"]]
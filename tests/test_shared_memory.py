@@ -0,0 +1,96 @@
+"""Shared-memory sample ring and pyforcedaq.client
+
+Run `pytest -s tests/test_shared_memory.py` to see the results.
+"""
+
+import os
+from multiprocessing import Process
+
+import numpy as np
+import pytest
+
+from pyforcedaq.client import SharedMemoryClient
+from pyforcedaq.lib.sample_ring import HEADER, SampleRing, SampleRingWriter
+from pyforcedaq.lib.types import ForceSensorBlock
+from pyforcedaq.tools.clock import local_clock
+
+NAME = f"pyforcedaq_test_{os.getpid()}"
+
+
+def _block(start: int, n: int) -> ForceSensorBlock:
+    k = np.arange(start, start + n, dtype=np.float64)
+    return ForceSensorBlock(times=k / 1000, forces=np.repeat(k[:, None], 6, axis=1),
+                            trigger=np.zeros((n, 2)), sensor_id=1)
+
+
+def _write_blocks(n_blocks: int, block_size: int):
+    writer = SampleRingWriter(NAME)
+    for i in range(n_blocks):
+        writer.write(_block(i * block_size, block_size))
+    writer.close()
+
+
+def test_sample_ring():
+    ring = SampleRing(NAME, capacity=100, sensor_id=1, rate=1000)
+    writer = SampleRingWriter(NAME)
+    client = SharedMemoryClient(NAME)
+    assert (client.capacity, client.sensor_id, client.rate) == (100, 1, 1000)
+
+    writer.write(_block(0, 30))
+    writer.write(_block(30, 50))
+    views = client.read_new()
+    assert len(views) == 1 and len(views[0]) == 80
+    np.testing.assert_array_equal(views[0]["forces"][:, 0], np.arange(80))
+
+    writer.write(_block(80, 40))  # wraps around
+    views = client.read_new()
+    assert [len(v) for v in views] == [20, 20]
+    np.testing.assert_array_equal(np.concatenate(views)["time"], np.arange(80, 120) / 1000)
+    del views
+
+    writer.write(_block(120, 250))  # more than capacity: client loses samples
+    samples = np.concatenate(client.read_new())
+    assert client.n_lost == 150
+    np.testing.assert_array_equal(samples["forces"][:, 5], np.arange(270, 370))
+    np.testing.assert_array_equal(client.latest(3)["forces"][:, 0], [367, 368, 369])
+    del samples
+
+    client.close()
+    writer.close()
+    ring.unlink()
+
+
+def test_sample_ring_other_process():
+    n_blocks, block_size = 1000, 10
+    ring = SampleRing(NAME, capacity=n_blocks * block_size, sensor_id=1, rate=1000)
+    client = SharedMemoryClient(NAME)
+    p = Process(target=_write_blocks, args=(n_blocks, block_size))
+    t0 = local_clock()
+    p.start()
+    received = []
+    while sum(len(x) for x in received) < n_blocks * block_size:
+        received.extend(x.copy() for x in client.read_new(timeout=2))
+    duration = local_clock() - t0
+    p.join()
+    forces = np.concatenate(received)["forces"][:, 0]
+    np.testing.assert_array_equal(forces, np.arange(n_blocks * block_size))
+    print(f"\n{len(forces)} samples in {duration * 1000:.1f} ms")
+
+    client.close()
+    ring.unlink()
+
+
+def test_sample_ring_owner():
+    ring = SampleRing(NAME, capacity=100, sensor_id=1, rate=1000)
+    with pytest.raises(RuntimeError):
+        SampleRing(NAME, capacity=100, sensor_id=2, rate=1000)  # owner is running
+
+    # left over from a crashed recording: the owner does not exist anymore
+    p = Process(target=os.getpid)
+    p.start()
+    p.join()
+    HEADER.pack_into(ring.shm.buf, 0, *HEADER.unpack_from(ring.shm.buf)[:-1], p.pid)
+    ring.shm.close()
+    ring = SampleRing(NAME, capacity=100, sensor_id=2, rate=1000)
+    assert HEADER.unpack_from(ring.shm.buf)[2] == 2
+    ring.unlink()
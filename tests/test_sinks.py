@@ -0,0 +1,65 @@
+"""Sink pipeline of the sensor process"""
+
+from queue import Queue
+
+import numpy as np
+
+from pyforcedaq.lib.sinks import QueueSink, Sink, SinkPipeline
+from pyforcedaq.lib.types import ChannelMask, ForceSensorBlock
+
+
+class ListSink(Sink):
+
+    def __init__(self, rate, **kwargs):
+        super().__init__(rate, **kwargs)
+        self.blocks = []
+
+    def write(self, block):
+        self.blocks.append(block)
+
+    @property
+    def times(self):
+        return np.concatenate([b.times for b in self.blocks])
+
+
+def _block(start, n):
+    times = np.arange(start, start + n) / 1000
+    return ForceSensorBlock(times=times, forces=np.tile(times[:, None], (1, 6)),
+                            trigger=np.zeros((n, 2)), sensor_id=1)
+
+
+def test_pipeline():
+    full = ListSink(1000)
+    batched = ListSink(1000, batch_size=25)
+    slow = ListSink(100)
+    saving = ListSink(100, only_while_saving=True)
+    pipeline = SinkPipeline([full, batched, slow, saving], rate=1000)
+    assert len(pipeline._decimators) == 2  # one decimator per distinct rate
+
+    for i in range(20):
+        pipeline.write(_block(i * 10, 10), saving=i >= 10)
+    pipeline.close()
+
+    assert np.allclose(full.times, np.arange(200) / 1000)
+    assert np.allclose(batched.times, full.times)
+    assert [len(b) for b in batched.blocks] == [30] * 6 + [20]
+    assert np.allclose(slow.times, np.arange(0, 200, 10) / 1000)
+    assert np.allclose(saving.times, np.arange(100, 200, 10) / 1000)
+
+
+def test_channel_mask():
+    mask = ChannelMask(forces=np.array([2, 0]), trigger=np.array([1]))
+    assert mask.force_names == ["Fz", "Fx"]
+    assert mask.trigger_names == ["trigger2"]
+    assert ChannelMask.all().force_names == ["Fx", "Fy", "Fz", "Tx", "Ty", "Tz"]
+
+
+def test_queue_sink_mask():
+    queue = Queue()
+    mask = ChannelMask(forces=np.array([2, 0]), trigger=np.array([1]))
+    sink = QueueSink(queue, rate=1000, mask=mask)
+    sink.write(_block(0, 10))
+    block = queue.get_nowait()
+    assert block.forces.shape == (10, 2)
+    assert block.trigger.shape == (10, 1)
+    assert np.allclose(block.forces[:, 0], block.times)
@@ -0,0 +1,38 @@
+"""Latency stats in shared memory"""
+
+from multiprocessing import Process
+from time import perf_counter
+
+import pytest
+
+from pyforcedaq.tools.stats import ProcessCPU, StageStats
+
+
+def _fill(stats):
+    for x in (0.00012, 0.00015, 0.003):
+        stats["read"].add(x)
+    stats["write"].add(2.0)
+
+
+def test_stage_stats_shared():
+    stats = StageStats("test", ["read", "write", "unused"])
+    p = Process(target=_fill, args=(stats,))
+    p.start()
+    p.join()
+
+    summary = stats.summary()
+    assert summary["read"]["n"] == 3
+    assert summary["read"]["p50_ms"] == pytest.approx(0.2)
+    assert summary["write"]["max_ms"] == pytest.approx(2000)
+    assert summary["unused"]["n"] == 0
+    assert "unused" not in str(stats)
+
+
+def test_process_cpu():
+    cpu = ProcessCPU()
+    if cpu.usage() is None:
+        pytest.skip("/proc not available")
+    end = perf_counter() + 0.1
+    while perf_counter() < end:
+        pass
+    assert 30 < cpu.usage() < 150  # type: ignore
@@ -0,0 +1,145 @@
+"""Loopback test of the local streaming server
+
+Run `pytest -s tests/test_stream_server.py` to see the results.
+"""
+
+import ctypes as ct
+import threading
+import time
+from multiprocessing import RawValue
+
+import numpy as np
+
+from pyforcedaq.lib.stream_server import StreamClient, StreamInput, StreamServerProcess
+from pyforcedaq.lib.types import ForceSensorBlock
+from pyforcedaq.tools.clock import local_clock
+
+
+def _block(start: int, n: int, sensor_id: int = 1) -> ForceSensorBlock:
+    k = np.arange(start, start + n, dtype=np.float64)
+    return ForceSensorBlock(times=k / 1000, forces=np.repeat(k[:, None], 6, axis=1),
+                            trigger=np.zeros((n, 2)), sensor_id=sensor_id)
+
+
+def _put(stream_input: StreamInput, block: ForceSensorBlock) -> None:
+    while not stream_input.put(block):  # input buffer full
+        time.sleep(0.001)
+
+
+def _start_server(address: str, n_clients: int, **kwargs):
+    server = StreamServerProcess(address, **kwargs)
+    server.start()
+    assert server.event_is_ready.wait(timeout=5)
+    clients = [StreamClient(address, timeout=5) for _ in range(n_clients)]
+    t_end = time.monotonic() + 5
+    while server.n_clients.value < n_clients:
+        assert time.monotonic() < t_end
+        time.sleep(0.01)
+    return server, clients
+
+
+def test_stream_server_unix(tmp_path):
+    server, clients = _start_server(f"unix:{tmp_path / 'stream.sock'}", 2)
+
+    n_blocks, block_size = 1000, 10
+    t0 = local_clock()
+    for i in range(n_blocks):
+        _put(server.inputs[0], _block(i * block_size, block_size))
+    for client in clients:
+        forces = np.concatenate([client.receive().forces[:, 0] for _ in range(n_blocks)])
+        np.testing.assert_array_equal(forces, np.arange(n_blocks * block_size))
+        assert client.lost_frames == {}
+    duration = local_clock() - t0
+    print(f"\n{n_blocks} blocks to {len(clients)} clients in {duration * 1000:.1f} ms")
+    print(server.client_stats())
+
+    for client in clients:
+        client.close()
+    server.quit()
+
+
+def test_stream_server_drop_oldest():
+    server, (client,) = _start_server("tcp:127.0.0.1:5107", 1, max_frames=10)
+
+    # the client does not read: the socket buffers fill up and frames are dropped
+    big_block = 2000
+    for i in range(200):
+        _put(server.inputs[0], _block(i * big_block, big_block))
+    time.sleep(0.5)
+    stats = server.client_stats()[0]
+    assert stats["dropped_frames"] > 0
+    assert stats["queued_frames"] <= 10
+
+    received = []
+    while len(received) == 0 or received[-1] < 199 * big_block:
+        received.append(client.receive().forces[0, 0])
+    stats = server.client_stats()[0]
+    print(f"\nreceived {len(received)} frames, dropped {stats['dropped_frames']}, "
+          f"max lag {stats['max_lag'] * 1000:.1f} ms")
+    assert received == sorted(received)
+    assert len(received) + stats["dropped_frames"] == 200
+
+    client.close()
+    server.quit()
+
+
+def test_stream_server_slow_client():
+    server, (client,) = _start_server("tcp:127.0.0.1:5108", 1, policy="drop_after_timeout",
+                                      max_frames=10, drop_timeout=5)
+    big_block = 2000
+    n_blocks = 200
+    received = []
+
+    def slow_reader():
+        for _ in range(n_blocks):
+            received.append(client.receive().forces[0, 0])
+            time.sleep(0.001)
+
+    reader = threading.Thread(target=slow_reader)
+    reader.start()
+    t0 = local_clock()
+    for i in range(n_blocks):  # the server buffers the frames for the slow client
+        _put(server.inputs[0], _block(i * big_block, big_block))
+    reader.join(timeout=10)
+    print(f"\ndrop_after_timeout policy: {n_blocks} blocks in {(local_clock() - t0) * 1000:.1f} ms")
+    assert received == [k * big_block for k in range(n_blocks)]
+    assert client.lost_frames == {}
+
+    client.close()
+    server.quit()
+
+
+def test_stream_server_drop_timeout():
+    server, (client,) = _start_server("tcp:127.0.0.1:5109", 1, policy="drop_after_timeout",
+                                      max_frames=10, drop_timeout=0.2)
+    # the client does not read: the input is never blocked, frames are
+    # dropped after the drop timeout
+    big_block = 2000
+    t0 = local_clock()
+    for i in range(200):
+        _put(server.inputs[0], _block(i * big_block, big_block))
+    assert local_clock() - t0 < 1
+    time.sleep(1)
+    stats = server.client_stats()[0]
+    assert stats["dropped_frames"] > 0
+    assert stats["queued_frames"] <= 10
+
+    received = []
+    while len(received) == 0 or received[-1] < 199 * big_block:
+        received.append(client.receive().forces[0, 0])
+    stats = server.client_stats()[0]
+    assert received == sorted(received)
+    assert len(received) + stats["dropped_frames"] == 200
+
+    client.close()
+    server.quit()
+
+
+def test_stream_input_never_blocks():
+    n_clients = RawValue(ct.c_int32, 1)
+    stream_input = StreamInput(n_clients)  # nobody reads
+    t0 = local_clock()
+    results = [stream_input.put(_block(i * 2000, 2000)) for i in range(100)]
+    assert local_clock() - t0 < 1
+    assert not all(results)
+    assert stream_input.dropped_blocks.value == results.count(False)
@@ -0,0 +1,103 @@
+"""Loopback benchmark of the event-driven UDP server
+
+Measures datagram throughput, trigger latency (time between sending a
+datagram and its receive timestamp) and the delay between kernel and
+user-space receive.
+Run `pytest -s tests/test_udp_server.py` to see the results.
+"""
+
+import socket
+from statistics import median
+
+from pyforcedaq.lib.udp_connection import (
+    UDPConnection,
+    UDPConnectionProcess,
+    UDPServer,
+    _trigger_code,
+)
+from pyforcedaq.tools.clock import local_clock
+from pyforcedaq.tools.event_ring import EventRing
+
+IP = "127.0.0.1"
+PORT = 5105
+
+
+def _connect_client() -> socket.socket:
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind((IP, 0))
+    client.settimeout(0.2)
+    for _ in range(20):  # server process might not be ready yet
+        client.sendto(UDPConnection.CONNECT, (IP, PORT))
+        try:
+            assert client.recvfrom(1024)[0] == UDPConnection.COMMAND_REPLY
+            break
+        except (TimeoutError, ConnectionRefusedError):
+            pass
+    else:
+        raise TimeoutError("Can't connect to UDP server")
+    client.settimeout(2)
+    return client
+
+
+def test_udp_server_loopback():
+    event_ring = EventRing()
+    events = event_ring.reader()
+    udp_p = UDPConnectionProcess(event_ring=event_ring, event_ignore_tag=b"$",
+                                 ip=IP, udp_port=PORT)
+    udp_p.start()
+    clients = [_connect_client(), _connect_client()]
+    assert udp_p.event_is_connected.wait(timeout=2)
+
+    # throughput (connect commands are in the receive queue as well)
+    n = 2000 + len(clients)
+    t0 = local_clock()
+    for cnt in range(n - len(clients)):
+        clients[cnt % 2].sendto(f"data {cnt}".encode(), (IP, PORT))
+        if cnt % 100 == 0:
+            # give the server a chance to drain the socket buffer
+            udp_p.receive_queue.get(timeout=2)
+            n -= 1
+    received = 0
+    while received < n:
+        udp_p.receive_queue.get(timeout=2)
+        received += 1
+    duration = local_clock() - t0
+    print(f"\nthroughput: {n / duration:.0f} datagrams/s")
+
+    # trigger latency
+    latencies = []
+    events.read()
+    for cnt in range(1, 201):
+        t = local_clock()
+        clients[0].sendto(str(cnt).encode(), (IP, PORT))
+        d = udp_p.receive_queue.get(timeout=2)
+        latencies.append(d.time - t)
+        times, codes = events.read()
+        assert list(times) == [d.time] and list(codes) == [cnt]
+    # code 0 (no event) is not pushed
+    clients[0].sendto(b"0", (IP, PORT))
+    udp_p.receive_queue.get(timeout=2)
+    assert len(events.read()[0]) == 0
+    assert udp_p.n_rejected_events.value == 1
+    print(f"trigger latency: median {median(latencies) * 1000:.3f} ms, "
+          f"max {max(latencies) * 1000:.3f} ms")
+    print(udp_p.receive_latency)
+    if UDPServer.KERNEL_TIMESTAMPS:
+        assert udp_p.receive_latency.n > 0
+
+    # send queue to all peers
+    udp_p.send_queue.put(b"hello")
+    for client in clients:
+        assert client.recvfrom(1024)[0] == b"hello"
+
+    udp_p.quit()
+    for client in clients:
+        client.close()
+
+
+def test_trigger_code():
+    assert _trigger_code(b"7") == 7
+    assert _trigger_code(b"hello") == UDPConnectionProcess.SOFTWARE_TRIGGER_CODE
+    # code 0 means no event in the trigger column
+    assert _trigger_code(b"0") is None
+    assert _trigger_code(b" 00 ") is None
@@ -0,0 +1,73 @@
+"""Bounded writer queue with spill-to-disk"""
+
+import threading
+import time
+from multiprocessing import Process
+from queue import Empty
+
+import numpy as np
+import pytest
+
+from pyforcedaq.tools.writer_queue import WriterQueue, _SpillThread
+
+
+def _produce(queue: WriterQueue, first: int, n: int):
+    for i in range(first, first + n):
+        queue.put(np.full(100, i))
+
+
+def test_spill_to_disk(tmp_path):
+    queue = WriterQueue(high_water=50, spill_dir=tmp_path / "spill")
+    producers = [Process(target=_produce, args=(queue, k * 1000, 500)) for k in range(2)]
+    for p in producers:
+        p.start()
+    t_end = time.monotonic() + 10
+    # all items are put and spilled by the spill threads of the producers
+    while queue.depth < 1000 or queue.stats()["spilled"] < 1000 - 50:
+        assert time.monotonic() < t_end
+        time.sleep(0.01)
+
+    stats = queue.stats()
+    assert stats["depth"] == 1000
+    assert stats["spilled"] == 1000 - 50
+    assert len(list((tmp_path / "spill").iterdir())) == 2  # one file per producer
+
+    items = [queue.get(timeout=1)[0] for _ in range(1000)]
+    for p in producers:
+        p.join()
+    # order of each producer is preserved
+    for k in range(2):
+        assert [x for x in items if x // 1000 == k] == list(range(k * 1000, k * 1000 + 500))
+    with pytest.raises(Empty):
+        queue.get_nowait()
+    assert queue.depth == 0
+    assert queue.stats()["max_lag"] > 0
+
+    queue.remove_spill_files()
+    assert not (tmp_path / "spill").exists()
+
+
+def test_spill_overflow(tmp_path, monkeypatch):
+    release = threading.Event()
+    spill = _SpillThread._spill
+
+    def slow_spill(self, item):
+        release.wait()  # the disk is slower than the producer
+        return spill(self, item)
+
+    monkeypatch.setattr(_SpillThread, "_spill", slow_spill)
+    queue = WriterQueue(high_water=0, spill_dir=tmp_path / "spill", max_spill_pending=5)
+    t0 = time.monotonic()
+    for i in range(100):
+        queue.put(i)
+    duration = time.monotonic() - t0
+    stats = queue.stats()
+    release.set()
+    assert duration < 1  # the producer is not blocked
+    assert stats["depth"] <= 6  # one item in the thread, five waiting
+    assert stats["depth"] + stats["dropped"] == 100
+
+    items = [queue.get(timeout=1) for _ in range(stats["depth"])]
+    assert items[:5] == [0, 1, 2, 3, 4] and items == sorted(items)  # order is preserved
+    assert queue.depth == 0
+    queue.remove_spill_files()